@@ -280,7 +280,7 @@ ANONYMOUS_USER_NAME = None
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'ozone.core.authentication.CachedTokenAuthentication',
     ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
     'DEFAULT_PERMISSION_CLASSES': (
@@ -350,6 +350,29 @@ TUSD_HOST = env('TUSD_HOST', default='localhost')
 TUSD_PORT = env('TUSD_PORT', default='1080')
 ALLOWED_FILE_EXTENSIONS = split_env_var('ALLOWED_FILE_EXTENSIONS')
 
+# Background report generation
+REPORT_JOBS_DIR = env('REPORT_JOBS_DIR', default='/var/tmp/ozone_report_jobs')
+# Number of reports generated in parallel by each process
+REPORT_JOBS_WORKERS = env('REPORT_JOBS_WORKERS', default=2)
+# Generated reports are kept for this many seconds
+REPORT_JOBS_TTL = env('REPORT_JOBS_TTL', default=3600)
+# Jobs still not finished after this many seconds are considered lost
+REPORT_JOBS_TIMEOUT = env('REPORT_JOBS_TIMEOUT', default=1800)
+
+# Number of processes used for rendering large reports in parallel, 1 disables
+# parallel rendering
+REPORT_RENDER_WORKERS = env('REPORT_RENDER_WORKERS', default=1)
+# Python interpreter running the rendering processes, defaults to the current
+# one. Needs to be set when running under uWSGI, otherwise reports are
+# rendered sequentially.
+REPORT_RENDER_PYTHON = env('REPORT_RENDER_PYTHON', default='')
+
+# Cache of rendered reports
+REPORT_CACHE_DIR = env('REPORT_CACHE_DIR', default='/var/tmp/ozone_report_cache')
+# Maximum total size in bytes, 0 disables the cache. Reports are only cached
+# if API_CACHE_URL is also set (see ReportCache).
+REPORT_CACHE_MAX_SIZE = env('REPORT_CACHE_MAX_SIZE', default=512 * 1024 * 1024)
+
 # https://docs.djangoproject.com/en/dev/ref/settings/#locale-paths
 LOCALE_PATHS = [
     ROOT_DIR / 'translations' / 'backend',
@@ -392,3 +415,45 @@ CACHE_INVALIDATION_TIMEOUT=env('CACHE_INVALIDATION_TIMEOUT', default=1)
 # Authentication for cache invalidation (basic by default)
 CACHE_INVALIDATION_USER=env('CACHE_INVALIDATION_USER', default='')
 CACHE_INVALIDATION_PASS=env('CACHE_INVALIDATION_PASS', default='')
+# Invalidations are coalesced for this many seconds before being sent
+CACHE_INVALIDATION_DELAY=env('CACHE_INVALIDATION_DELAY', default=2)
+# Failed invalidations are retried this many times, waiting
+# CACHE_INVALIDATION_BACKOFF seconds before the first retry and doubling
+# the wait after each failure.
+CACHE_INVALIDATION_RETRIES=env('CACHE_INVALIDATION_RETRIES', default=3)
+CACHE_INVALIDATION_BACKOFF=env('CACHE_INVALIDATION_BACKOFF', default=1)
+# Maximum number of parties waiting to be invalidated
+CACHE_INVALIDATION_MAX_PENDING=env('CACHE_INVALIDATION_MAX_PENDING', default=10000)
+
+# API response cache
+# Aggregation and limits responses are only cached if a Redis URL is given,
+# as the cache (and its data generation counters) must be shared by all
+# processes.
+API_CACHE_URL = env('API_CACHE_URL', default=None)
+# Timeout is in seconds
+API_CACHE_TIMEOUT = int(env('API_CACHE_TIMEOUT', default=24 * 3600))
+if API_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': API_CACHE_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                # Serve uncached responses if Redis is unavailable
+                'IGNORE_EXCEPTIONS': True,
+            },
+        },
+    }
+
+# Reference data (parties, groups, reporting periods...) is cached by each
+# process. Changes made by other processes are seen after at most this many
+# seconds (the data generation is checked in the API cache, if configured).
+REFERENCE_CACHE_CHECK_INTERVAL = env('REFERENCE_CACHE_CHECK_INTERVAL', default=5)
+
+# Authentication tokens (along with their users) are kept in the API cache for
+# this many seconds, if configured. Revoking tokens or changing users evicts
+# them right away.
+AUTH_TOKEN_CACHE_TIMEOUT = env('AUTH_TOKEN_CACHE_TIMEOUT', default=60)
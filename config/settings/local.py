@@ -76,7 +76,7 @@ INSTALLED_APPS += ['django_extensions']  # noqa F405
 # ------------------------------------------------------------------------------
 REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = (
     'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-    'rest_framework.authentication.TokenAuthentication',
+    'ozone.core.authentication.CachedTokenAuthentication',
     'rest_framework.authentication.BasicAuthentication',
     'rest_framework.authentication.SessionAuthentication',
 )
@@ -58,3 +58,5 @@ EMAIL_PORT = 1025
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Rendered reports are not cached between tests
+REPORT_CACHE_MAX_SIZE = 0
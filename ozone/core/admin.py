@@ -470,14 +470,17 @@ class SubmissionAdmin(admin.ModelAdmin):
         obj.delete()
 
     def export_legacy_xlsx(self, request, queryset):
+        # Rows are only generated while being written, so errors can occur
+        # while dumping as well.
+        output = tempfile.TemporaryFile()
         try:
-            data = export_submissions(queryset)
+            export_submissions(queryset).dump_xlsx(output)
         except ExportError as e:
+            output.close()
             self.message_user(request, e, messages.ERROR)
             return
 
-        output = tempfile.NamedTemporaryFile()
-        data.dump_xlsx(output.name)
+        output.seek(0)
         return FileResponse(
             output,
             as_attachment=True,
@@ -18,6 +18,7 @@ from .section_nonparty import export_nonparty
 from .section_emission import export_emission
 from .section_labuses import export_labuses
 from .labuse_report import export_labuse_report
+from .data import SubmissionsData
 
 from ..util import exclude_blend_items
 from ..util import filter_lab_uses
@@ -29,45 +30,42 @@ __all__ = [
 
 
 def export_submissions(submissions):
-    for submission in submissions:
+    data = SubmissionsData(submissions)
+    for submission in data.submissions:
+        imports = exclude_blend_items(data.imports[submission.pk])
+        productions = data.productions[submission.pk]
 
         yield from export_info(submission)
 
-        yield from export_imports(
-            submission,
-            exclude_blend_items(submission.article7imports),
-        )
+        yield from export_imports(submission, imports)
 
         yield from export_exports(
             submission,
-            exclude_blend_items(submission.article7exports),
+            exclude_blend_items(data.exports[submission.pk]),
         )
 
-        yield from export_production(
-            submission,
-            submission.article7productions.all(),
-        )
+        yield from export_production(submission, productions)
 
         yield from export_destruction(
             submission,
-            exclude_blend_items(submission.article7destructions),
+            exclude_blend_items(data.destructions[submission.pk]),
         )
 
         yield from export_nonparty(
             submission,
-            exclude_blend_items(submission.article7nonpartytrades),
+            exclude_blend_items(data.nonpartytrades[submission.pk]),
         )
 
         yield from export_emission(
             submission,
-            submission.article7emissions.all(),
+            data.emissions[submission.pk],
         )
 
         # For lab uses, consumption is actually data from imports
         # Apparently there aren't any lab uses in exports (?)
         yield from export_labuses(
-            filter_lab_uses(exclude_blend_items(submission.article7imports)),
-            filter_lab_uses(submission.article7productions),
+            filter_lab_uses(imports),
+            filter_lab_uses(productions),
         )
 
         yield PageBreak()
@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+from django.db.models import prefetch_related_objects
+
+from ozone.core.models import Article7Destruction
+from ozone.core.models import Article7Emission
+from ozone.core.models import Article7Export
+from ozone.core.models import Article7Import
+from ozone.core.models import Article7NonPartyTrade
+from ozone.core.models import Article7Production
+
+
+class SubmissionsData:
+    """
+    Loads the data of many Article 7 submissions at once, using one query for
+    each type of data (along with the substances, groups, blends and parties
+    shown by the renderers), regardless of the number of submissions.
+
+    Rows are kept in the default ordering of each model and are grouped by
+    submission id.
+    """
+
+    def __init__(self, submissions):
+        self.submissions = list(submissions)
+        prefetch_related_objects(
+            self.submissions,
+            'party', 'reporting_period', 'obligation',
+            'info__country', 'article7questionnaire',
+        )
+
+        self.imports = self.load(
+            Article7Import, 'substance__group', 'blend', 'source_party'
+        )
+        self.exports = self.load(
+            Article7Export, 'substance__group', 'blend', 'destination_party'
+        )
+        self.productions = self.load(Article7Production, 'substance__group')
+        self.destructions = self.load(
+            Article7Destruction, 'substance__group', 'blend'
+        )
+        self.nonpartytrades = self.load(
+            Article7NonPartyTrade, 'substance__group', 'blend', 'trade_party'
+        )
+        self.emissions = self.load(Article7Emission)
+
+    def load(self, model, *related):
+        rows = defaultdict(list)
+        if not self.submissions:
+            return rows
+        queryset = model.objects.filter(submission__in=self.submissions)
+        if related:
+            queryset = queryset.select_related(*related)
+        for row in queryset:
+            rows[row.submission_id].append(row)
+        return rows
@@ -1,6 +1,22 @@
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import SimpleDocTemplate
 from reportlab.platypus import Paragraph
 from reportlab.lib import pagesizes
@@ -18,11 +34,25 @@ from .reports import (
 )
 
 from ozone.core.models import (
+    Obligation,
     ObligationTypes,
+    Party,
+    ReportingPeriod,
+    Submission,
 )
+from ozone.core.utils.report_jobs import report_jobs
 
 from .util import right_paragraph_style, left_paragraph_style
 
+try:
+    # Only available when running under uWSGI
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+logger = logging.getLogger(__name__)
+
 
 def add_page_footer(canvas, doc, footnote=None):
     canvas.saveState()
@@ -38,8 +68,9 @@ def add_page_footer(canvas, doc, footnote=None):
     canvas.restoreState()
 
 
-def get_doc_template(landscape=False):
-    buff = BytesIO()
+def get_doc_template(landscape=False, buff=None):
+    if buff is None:
+        buff = BytesIO()
     # A4 size is 21cm x 29.7cm
     if landscape:
         doc = SimpleDocTemplate(
@@ -62,21 +93,66 @@ def get_doc_template(landscape=False):
     return buff, doc
 
 
-def export_submissions(obligation, submissions):
-
-    buff, doc = get_doc_template(landscape=True)
-    if obligation._obligation_type == ObligationTypes.ART7.value:
-        clazz = art7
-    elif obligation._obligation_type == ObligationTypes.ESSENCRIT.value:
-        clazz = raf
-
-    flowables = (
-        list(clazz.export_submissions(submissions)) or
-        [Paragraph('No data', left_paragraph_style)]
+class FlowableStream(list):
+    """
+    List of flowables that is lazily filled from an iterable while the
+    document is being built, so only a few flowables (and the data needed to
+    create them) are kept in memory at any time, instead of all of them.
+
+    ReportLab's build loop only checks the length of the list, looks at its
+    first items (at most until the next flowable not kept with the previous
+    one) and removes them once they are drawn, so keeping a small look-ahead
+    buffer is enough.
+    """
+
+    LOOKAHEAD = 20
+
+    def __init__(self, flowables, empty=None):
+        super().__init__()
+        self.flowables = iter(flowables)
+        self.empty = empty
+        self.exhausted = False
+        self.count = 0
+
+    def fill(self):
+        while not self.exhausted and super().__len__() < self.LOOKAHEAD:
+            try:
+                self.append(next(self.flowables))
+                self.count += 1
+            except StopIteration:
+                self.exhausted = True
+                if not self.count and self.empty is not None:
+                    self.append(self.empty)
+
+    def __len__(self):
+        self.fill()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self.fill()
+        return super().__getitem__(index)
+
+
+def build_pdf(flowables, landscape=False, empty=None):
+    """
+    Renders the flowables into a temporary file, returned open at its start.
+
+    Flowables are consumed as the document is built (see FlowableStream) and
+    the output is written to disk instead of memory. Pages are numbered by
+    add_page_footer, the same as for the whole document. The number of pages
+    rendered so far is reported as progress of the current report job, if
+    any.
+    """
+    buff, doc = get_doc_template(
+        landscape=landscape, buff=tempfile.TemporaryFile()
+    )
+    doc.setProgressCallBack(
+        lambda typ, value: (
+            report_jobs.report_progress(pages=value) if typ == 'PAGE' else None
+        )
     )
-
     doc.build(
-        flowables,
+        FlowableStream(flowables, empty=empty),
         onFirstPage=add_page_footer,
         onLaterPages=add_page_footer,
     )
@@ -84,173 +160,330 @@ def export_submissions(obligation, submissions):
     return buff
 
 
-def export_baseline_hfc_raw(parties):
-    buff, doc = get_doc_template(landscape=True)
-    doc.build(
-        list(art7.export_baseline_hfc_raw(parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer,
-    )
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def init_render_worker():
+    # Workers are fresh interpreters, see get_render_pool()
+    django.setup()
+
+
+def get_render_executable():
+    """
+    Returns the Python interpreter that runs the render workers, or None if
+    it is not known. Under uWSGI, sys.executable is the uwsgi binary, so the
+    interpreter needs to be configured in settings.REPORT_RENDER_PYTHON.
+    """
+    if settings.REPORT_RENDER_PYTHON:
+        return settings.REPORT_RENDER_PYTHON
+    if uwsgi is not None:
+        return None
+    return sys.executable
+
+
+def get_render_pool():
+    """
+    Pool of settings.REPORT_RENDER_WORKERS processes, created on first use.
+
+    Workers are spawned instead of forked, as forked processes would share the
+    database connections of the (possibly multi-threaded) parent.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            context = multiprocessing.get_context('spawn')
+            # The executable is process-wide, but it is only used for spawning
+            # processes (or a forkserver). Nothing else does that here (the
+            # management commands' pools fork), and any spawned process would
+            # need the real interpreter anyway.
+            context.set_executable(get_render_executable())
+            _render_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=int(settings.REPORT_RENDER_WORKERS),
+                mp_context=context,
+                initializer=init_render_worker,
+            )
+        return _render_pool
+
+
+def drop_render_pool(pool):
+    """
+    Discards the pool (e.g. when broken by a crashed worker), so that a new
+    one is created on next use.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False)
+
+
+def render_section(language, landscape, get_flowables, args):
+    """
+    Runs in a worker process; renders one section of a report, without page
+    footers (added after merging), and returns the PDF contents.
+    """
+    close_old_connections()
+    with translation.override(language):
+        buff, doc = get_doc_template(landscape=landscape)
+        doc.build(FlowableStream(get_flowables(*args)))
+    return buff.getvalue()
+
+
+def merge_sections(sections, landscape):
+    """
+    Concatenates the rendered sections into a temporary file, adding the page
+    footers of the whole document so pages are numbered continuously.
+    """
+    readers = [PdfFileReader(BytesIO(section)) for section in sections]
+    page_count = sum(reader.getNumPages() for reader in readers)
+
+    # Footers are drawn on otherwise blank pages, merged over the sections
+    footers, doc = get_doc_template(landscape=landscape)
+    footers_canvas = Canvas(footers, pagesize=doc.pagesize)
+    for _page in range(page_count):
+        add_page_footer(footers_canvas, doc)
+        footers_canvas.showPage()
+    footers_canvas.save()
+    footers = PdfFileReader(footers)
+
+    writer = PdfFileWriter()
+    page_number = 0
+    for reader in readers:
+        for index in range(reader.getNumPages()):
+            page = reader.getPage(index)
+            page.mergePage(footers.getPage(page_number))
+            writer.addPage(page)
+            page_number += 1
+
+    buff = tempfile.TemporaryFile()
+    writer.write(buff)
     buff.seek(0)
     return buff
 
 
-def export_labuse(periods):
+def build_pdf_parallel(sections, landscape=False):
+    """
+    Renders the sections of a report in the pool of worker processes and
+    merges them in order (or renders them in this process if the pool is
+    broken). Each section is a (get_flowables, args) tuple, where
+    get_flowables is a module-level function and args are picklable (e.g.
+    ids instead of model instances).
+    """
+    language = translation.get_language()
+    pool = get_render_pool()
+    try:
+        futures = [
+            pool.submit(
+                render_section, language, landscape, get_flowables, args
+            )
+            for get_flowables, args in sections
+        ]
+        rendered = []
+        for future in futures:
+            rendered.append(future.result())
+            report_jobs.report_progress(
+                sections=len(rendered), total_sections=len(futures)
+            )
+    except BrokenProcessPool:
+        # A worker has crashed; the pool cannot be used anymore
+        logger.exception('Render pool is broken, rendering sequentially.')
+        drop_render_pool(pool)
+        return build_pdf(
+            itertools.chain.from_iterable(
+                get_flowables(*args) for get_flowables, args in sections
+            ),
+            landscape=landscape,
+        )
+    return merge_sections(rendered, landscape)
 
-    buff, doc = get_doc_template(landscape=False)
 
-    flowables = (
-        list(art7.export_labuse_report(periods)) or
-        [Paragraph('No data', left_paragraph_style)]
-    )
+def use_parallel_rendering(sections_count):
+    if int(settings.REPORT_RENDER_WORKERS) <= 1 or sections_count <= 1:
+        return False
+    if get_render_executable() is None:
+        logger.warning(
+            'REPORT_RENDER_PYTHON is not set, rendering reports sequentially.'
+        )
+        return False
+    return True
 
-    doc.build(
-        flowables,
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer,
-    )
-    buff.seek(0)
-    return buff
 
+def get_objects(model, ids):
+    """
+    Returns the objects with the given ids, in the same order.
+    """
+    objects = model.objects.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
 
-def export_prodcons(submission, periods, parties):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(prodcons.get_prodcons_flowables(submission, periods, parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
-    )
+def get_submissions_flowables(obligation, submissions):
+    if obligation._obligation_type == ObligationTypes.ART7.value:
+        clazz = art7
+    elif obligation._obligation_type == ObligationTypes.ESSENCRIT.value:
+        clazz = raf
+    return clazz.export_submissions(submissions)
 
-    buff.seek(0)
-    return buff
 
+def get_submissions_section_flowables(obligation_id, submission_ids):
+    return get_submissions_flowables(
+        Obligation.objects.get(pk=obligation_id),
+        get_objects(Submission, submission_ids),
+    )
 
-def export_prodcons_by_region(periods):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(prodcons.get_prodcons_by_region_flowables(periods)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_submissions(obligation, submissions):
+    submissions = list(submissions)
+    if obligation._obligation_type == ObligationTypes.ART7.value:
+        groups = [[submission] for submission in submissions]
+    else:
+        # RAF reports are grouped by party
+        by_party = defaultdict(list)
+        for submission in submissions:
+            by_party[submission.party.name].append(submission)
+        groups = [by_party[name] for name in sorted(by_party)]
+
+    if use_parallel_rendering(len(groups)):
+        return build_pdf_parallel(
+            [
+                (
+                    get_submissions_section_flowables,
+                    (obligation.pk, [submission.pk for submission in group])
+                )
+                for group in groups
+            ],
+            landscape=True,
+        )
+
+    return build_pdf(
+        get_submissions_flowables(obligation, submissions),
+        landscape=True,
+        empty=Paragraph('No data', left_paragraph_style),
     )
 
-    buff.seek(0)
-    return buff
 
+def export_baseline_hfc_raw(parties):
+    return build_pdf(
+        art7.export_baseline_hfc_raw(parties),
+        landscape=True,
+    )
 
-def export_prodcons_a5_summary(periods):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(prodcons.get_prodcons_a5_summary_flowables(periods)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_labuse(periods):
+    return build_pdf(
+        art7.export_labuse_report(periods),
+        landscape=False,
+        empty=Paragraph('No data', left_paragraph_style),
     )
 
-    buff.seek(0)
-    return buff
 
+def get_prodcons_section_flowables(period_ids, party_id):
+    return prodcons.get_prodcons_flowables(
+        None,
+        get_objects(ReportingPeriod, period_ids),
+        [Party.objects.get(pk=party_id)],
+    )
 
-def export_prodcons_parties(periods, is_article5):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(prodcons.get_prodcons_parties_flowables(periods, is_article5)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_prodcons(submission, periods, parties):
+    if submission is None and use_parallel_rendering(len(parties)):
+        period_ids = [period.pk for period in periods]
+        return build_pdf_parallel(
+            [
+                (get_prodcons_section_flowables, (period_ids, party.pk))
+                for party in parties
+            ],
+            landscape=False,
+        )
+
+    return build_pdf(
+        prodcons.get_prodcons_flowables(submission, periods, parties),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
 
+def export_prodcons_by_region(periods):
+    return build_pdf(
+        prodcons.get_prodcons_by_region_flowables(periods),
+        landscape=False,
+    )
 
-def export_impexp_new_rec(periods, parties):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(impexp_new_rec.get_flowables(periods, parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_prodcons_a5_summary(periods):
+    return build_pdf(
+        prodcons.get_prodcons_a5_summary_flowables(periods),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
 
+def export_prodcons_parties(periods, is_article5):
+    return build_pdf(
+        prodcons.get_prodcons_parties_flowables(periods, is_article5),
+        landscape=False,
+    )
 
-def export_impexp_rec_subst(periods):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(impexp.get_rec_subst_flowables(periods)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def get_impexp_new_rec_section_flowables(period_id, party_ids):
+    return impexp_new_rec.get_flowables(
+        [ReportingPeriod.objects.get(pk=period_id)],
+        get_objects(Party, party_ids),
     )
 
-    buff.seek(0)
-    return buff
-
 
-def export_impexp_new_rec_agg(periods):
-    buff, doc = get_doc_template(landscape=False)
+def export_impexp_new_rec(periods, parties):
+    if use_parallel_rendering(len(periods)):
+        party_ids = [party.pk for party in parties]
+        return build_pdf_parallel(
+            [
+                (get_impexp_new_rec_section_flowables, (period.pk, party_ids))
+                for period in periods
+            ],
+            landscape=False,
+        )
 
-    doc.build(
-        list(impexp.get_impexp_new_rec_agg_flowables(periods)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+    return build_pdf(
+        impexp_new_rec.get_flowables(periods, parties),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
 
+def export_impexp_rec_subst(periods):
+    return build_pdf(
+        impexp.get_rec_subst_flowables(periods),
+        landscape=False,
+    )
 
-def export_hfc_baseline(parties):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(hfc_baseline.get_flowables(parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_impexp_new_rec_agg(periods):
+    return build_pdf(
+        impexp.get_impexp_new_rec_agg_flowables(periods),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
 
+def export_hfc_baseline(parties):
+    return build_pdf(
+        hfc_baseline.get_flowables(parties),
+        landscape=False,
+    )
 
-def export_baseline_prod_a5(parties):
-    buff, doc = get_doc_template(landscape=False)
 
-    doc.build(
-        list(baseline_prod_cons.get_prod_a5_flowables(parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+def export_baseline_prod_a5(parties):
+    return build_pdf(
+        baseline_prod_cons.get_prod_a5_flowables(parties),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
-
 
 def export_baseline_cons_a5(parties):
-    buff, doc = get_doc_template(landscape=False)
-
-    doc.build(
-        list(baseline_prod_cons.get_cons_a5_flowables(parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+    return build_pdf(
+        baseline_prod_cons.get_cons_a5_flowables(parties),
+        landscape=False,
     )
 
-    buff.seek(0)
-    return buff
-
 
 def export_baseline_prodcons_na5(parties):
-    buff, doc = get_doc_template(landscape=False)
-
-    doc.build(
-        list(baseline_prod_cons.get_prodcons_na5_flowables(parties)),
-        onFirstPage=add_page_footer,
-        onLaterPages=add_page_footer
+    return build_pdf(
+        baseline_prod_cons.get_prodcons_na5_flowables(parties),
+        landscape=False,
     )
-
-    buff.seek(0)
-    return buff
@@ -1,9 +1,9 @@
 from collections import defaultdict
 
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Count
-from django.db.models import Sum
 
+from ozone.core.models import AggregationSummary
 from ozone.core.models import Baseline
 from ozone.core.models import Group
 from ozone.core.models import Limit
@@ -15,6 +15,7 @@ from ozone.core.models import ProdCons
 from ozone.core.models import Region
 from ozone.core.models import Submission
 from ozone.core.models.utils import round_decimal_half_up
+from ozone.core.models.utils import sum_decimals
 from ozone.core.api.export_pdf.util import get_date_of_reporting_str
 from ozone.core.api.export_pdf.util import b_l
 from ozone.core.api.export_pdf.util import DOUBLE_HEADER_TABLE_STYLES
@@ -360,6 +361,14 @@ class ProdConsSummary:
         self.groups_by_pk = {g.pk: g for g in self.groups}
         self.format = ValueFormatter()
 
+    @cached_property
+    def summaries(self):
+        # Cross-party sums are read from the pre-aggregated summaries
+        AggregationSummary.refresh(self.period)
+        return list(
+            AggregationSummary.objects.filter(reporting_period=self.period)
+        )
+
     def is_phased_out(self, group):
         return self.period.start_date >= group.phase_out_year_article_5
 
@@ -399,45 +408,53 @@ class ProdConsSummary:
 
             table_builder.add_row(row)
 
-    def get_prodcons_groups(self, queryset):
-        rv = defaultdict(dict)
-
-        queryset = (
-            queryset
-            .values('group')
-            .annotate(
-                Sum('calculated_production'),
-                Sum('calculated_consumption'),
-                Sum('baseline_prod'),
-                Sum('baseline_cons'),
-            )
-        )
-
-        for row in queryset:
-            group = self.groups_by_pk[row['group']]
-            rv[group] = (
-                row['calculated_production__sum'],
-                row['calculated_consumption__sum'],
-                row['baseline_prod__sum'],
-                row['baseline_cons__sum'],
+    def filter_summaries(self, **filters):
+        return [
+            summary for summary in self.summaries
+            if all(
+                getattr(summary, field) == value
+                for field, value in filters.items()
             )
-
-        return rv
-
-    def get_stats(self, parties):
-        stats = (
-            PartyHistory.objects
-            .filter(reporting_period=self.period)
-            .filter(party__in=parties)
-            .order_by()
-            .aggregate(population=Sum('population'), count=Count('pk'))
-        )
-
-        eu = parties.filter(abbr='EU').first()
-        if eu:
-            eu_history = eu.history.filter(reporting_period=self.period).first()
-            stats['population'] -= eu_history.population
-
+        ]
+
+    def get_prodcons_groups(self, **filters):
+        """
+        Returns the sums of production, consumption and baselines, by group,
+        for the summaries matching the given filters.
+        """
+        sums = {}
+        for summary in self.filter_summaries(**filters):
+            if summary.group_id is None:
+                continue
+            values = [
+                getattr(summary, field) for field in AggregationSummary.FIELDS
+            ]
+            previous = sums.get(summary.group_id)
+            if previous is not None:
+                values = [
+                    sum_decimals(a, b) for a, b in zip(previous, values)
+                ]
+            sums[summary.group_id] = values
+
+        return {
+            self.groups_by_pk[group_id]: tuple(values)
+            for group_id, values in sums.items()
+        }
+
+    def get_stats(self, **filters):
+        """
+        Returns the population and number of the parties that have submissions
+        for the period, matching the given filters.
+        """
+        stats = {'population': None, 'count': 0}
+        for summary in self.filter_summaries(
+            group=None, is_reporting=True, **filters
+        ):
+            stats['count'] += summary.party_count
+            if summary.population is not None:
+                stats['population'] = (
+                    (stats['population'] or 0) + summary.population
+                )
         return stats
 
     def render_heading(self, name, count, population):
@@ -473,15 +490,8 @@ class SummaryByRegion(ProdConsSummary):
 
     def render_data(self, table_builder):
         # global
-        prodcons_groups = self.get_prodcons_groups(
-            ProdCons.objects
-            .filter(reporting_period=self.period)
-        )
-        parties = (
-            Party.get_main_parties()
-            .filter(submissions__reporting_period=self.period)
-        )
-        stats = self.get_stats(parties)
+        prodcons_groups = self.get_prodcons_groups()
+        stats = self.get_stats()
 
         heading = self.render_heading("All parties", **stats)
         table_builder.add_heading(heading)
@@ -490,17 +500,8 @@ class SummaryByRegion(ProdConsSummary):
 
         # regions
         for region in self.regions:
-            prodcons_groups = self.get_prodcons_groups(
-                ProdCons.objects
-                .filter(reporting_period=self.period)
-                .filter(party__subregion__region=region)
-            )
-            parties = (
-                Party.get_main_parties()
-                .filter(subregion__region=region)
-                .filter(submissions__reporting_period=self.period)
-            )
-            stats = self.get_stats(parties)
+            prodcons_groups = self.get_prodcons_groups(region_id=region.pk)
+            stats = self.get_stats(region_id=region.pk)
 
             heading = self.render_heading(region.name, **stats)
             table_builder.add_heading(heading)
@@ -512,15 +513,8 @@ class SummaryByArt5(ProdConsSummary):
 
     def render_data(self, table_builder):
         # global
-        prodcons_groups = self.get_prodcons_groups(
-            ProdCons.objects
-            .filter(reporting_period=self.period)
-        )
-        parties = (
-            Party.get_main_parties()
-            .filter(submissions__reporting_period=self.period)
-        )
-        stats = self.get_stats(parties)
+        prodcons_groups = self.get_prodcons_groups()
+        stats = self.get_stats()
 
         heading = self.render_heading("All parties", **stats)
         table_builder.add_heading(heading)
@@ -529,22 +523,11 @@ class SummaryByArt5(ProdConsSummary):
 
         # by is_article5
         for is_article5 in [True, False]:
-            histories = (
-                PartyHistory.objects
-                .filter(reporting_period=self.period)
-                .filter(is_article5=is_article5)
-            )
-            parties = (
-                Party.get_main_parties()
-                .filter(submissions__reporting_period=self.period)
-                .filter(history__in=histories)
-            )
+            # Only main parties that have submissions for the period
             prodcons_groups = self.get_prodcons_groups(
-                ProdCons.objects
-                .filter(reporting_period=self.period)
-                .filter(party__in=parties)
+                is_article5=is_article5, is_reporting=True
             )
-            stats = self.get_stats(parties)
+            stats = self.get_stats(is_article5=is_article5)
 
             if is_article5:
                 heading = self.render_heading("Article 5 parties", **stats)
@@ -583,6 +566,26 @@ class SummaryParties(ProdConsSummary):
                 f"{party.subregion.region.abbr}  "
                 f"(Population: {format_decimal(history.population)})")
 
+    def get_dates_reported(self, prodcons_by_party):
+        """
+        Same as get_date_reported(), for all parties at once.
+        """
+        submission_ids = {}
+        for party_id, rows in prodcons_by_party.items():
+            for row in rows:
+                id_list = row.submissions.get(ObligationTypes.ART7.value, [])
+                if id_list:
+                    submission_ids[party_id] = id_list[0]
+
+        submissions = Submission.objects.filter(
+            id__in=submission_ids.values()
+        ).select_related('info').in_bulk()
+        return {
+            party_id: get_date_of_reporting_str(submissions[submission_id])
+            for party_id, submission_id in submission_ids.items()
+            if submission_id in submissions
+        }
+
     def render_data(self, table_builder):
         histories = (
             PartyHistory.objects
@@ -593,22 +596,33 @@ class SummaryParties(ProdConsSummary):
             Party.get_main_parties()
             .filter(submissions__reporting_period=self.period)
             .filter(history__in=histories)
+            .select_related('subregion__region')
             .distinct()
         )
 
-        history_map = {h.party: h for h in histories}
+        history_map = {h.party_id: h for h in histories}
 
-        for party in parties:
-            history = history_map[party]
-
-            prodcons_qs = (
-                ProdCons.objects
-                .filter(reporting_period=self.period)
-                .filter(party=party)
-            )
+        prodcons_by_party = defaultdict(list)
+        for row in ProdCons.objects.filter(
+            reporting_period=self.period, party__in=parties
+        ):
+            prodcons_by_party[row.party_id].append(row)
+        dates_reported = self.get_dates_reported(prodcons_by_party)
 
-            prodcons_groups = self.get_prodcons_groups(prodcons_qs)
-            date_reported = get_date_reported(prodcons_qs)
+        for party in parties:
+            history = history_map[party.pk]
+
+            # There is only one ProdCons per party, period and group
+            prodcons_groups = {
+                self.groups_by_pk[row.group_id]: (
+                    row.calculated_production,
+                    row.calculated_consumption,
+                    row.baseline_prod,
+                    row.baseline_cons,
+                )
+                for row in prodcons_by_party[party.pk]
+            }
+            date_reported = dates_reported.get(party.pk, "-")
 
             heading = self.render_heading(party, history, date_reported)
             table_builder.add_heading(heading)
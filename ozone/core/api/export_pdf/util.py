@@ -330,10 +330,23 @@ def rows_to_table(header, rows, colWidths, style):
 
 
 def exclude_blend_items(data):
+    """
+    Works on both querysets and lists of already loaded rows.
+    """
+    if isinstance(data, list):
+        return [item for item in data if item.blend_item_id is None]
     return data.exclude(blend_item__isnull=False)
 
 
 def filter_lab_uses(data):
+    """
+    Works on both querysets and lists of already loaded rows.
+    """
+    if isinstance(data, list):
+        return [
+            item for item in data
+            if item.quantity_laboratory_analytical_uses
+        ]
     return data.exclude(
         quantity_laboratory_analytical_uses__isnull=True
     ).exclude(
@@ -345,6 +345,14 @@ email_templates.register(
 )
 router.extend(email_templates)
 
+cache_invalidation = routers.SimpleRouter()
+cache_invalidation.register(
+    'cache-invalidation',
+    views.CacheInvalidationViewSet,
+    base_name='cache-invalidation'
+)
+router.extend(cache_invalidation)
+
 # Country profiles
 focal_points = routers.SimpleRouter()
 focal_points.register(
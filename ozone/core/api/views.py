@@ -1,5 +1,7 @@
 from datetime import datetime
 from base64 import b64encode
+import hashlib
+import json
 from collections import OrderedDict
 from copy import deepcopy
 from pathlib import Path
@@ -12,8 +14,12 @@ import os
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files import File
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet, F, Q
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
 from django_filters import rest_framework as filters
 from django.utils.translation import gettext_lazy as _
 from impersonate.views import stop_impersonate
@@ -192,6 +198,11 @@ from .export_pdf import (
 )
 
 from ..models.utils import round_decimal_half_up
+from ..utils.cache import (
+    get_api_cache, get_data_generations, invalidation_queue,
+)
+from ..utils.report_cache import report_cache
+from ..utils.report_jobs import report_jobs
 
 User = get_user_model()
 
@@ -205,6 +216,78 @@ class ReadOnlyMixin:
         return ['GET', 'OPTIONS']
 
 
+class CachedListMixin:
+    """
+    Caches list() responses in the API cache (if one is configured).
+
+    Cache keys are built from the normalized query parameters and the data
+    generations of the requested parties (or the global one, also used when
+    other filters can widen the results), which are bumped whenever the
+    underlying data changes, so cached responses are never stale. Views filtered by IsOwnerFilterBackend are also keyed on the
+    user's party.
+    """
+
+    # Query parameters for which the order of values matters
+    ordered_params = ('ordering', 'search')
+    # Query parameters that can widen the results beyond the requested
+    # parties (see SwitchableOrFilterset)
+    widening_params = ('or_fields',)
+
+    def get_list_cache_key(self, request):
+        params = {}
+        for key in sorted(request.query_params):
+            values = request.query_params.getlist(key)
+            if key not in self.ordered_params:
+                values = sorted(
+                    value for item in values for value in item.split(',')
+                )
+            params[key] = values
+
+        party_ids = set()
+        scope = None
+        if IsOwnerFilterBackend in self.filter_backends:
+            if request.user.is_secretariat:
+                scope = 'secretariat'
+            else:
+                scope = request.user.party_id
+                party_ids.add(request.user.party_id)
+        if (
+            not any(key in params for key in self.widening_params)
+            and all(value.isdigit() for value in params.get('party', ['']))
+        ):
+            party_ids.update(int(value) for value in params['party'])
+
+        # Global generation if not restricted to specific parties
+        generations = get_data_generations(party_ids)
+        payload = json.dumps([params, scope, generations])
+        return 'api:{}:{}'.format(
+            self.__class__.__name__,
+            hashlib.sha1(payload.encode()).hexdigest()
+        )
+
+    def build_list(self, request, *args, **kwargs):
+        """
+        Builds the (uncached) list() response; views customizing list()
+        override this instead, so their responses are cached too.
+        """
+        return super().list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        cache = get_api_cache()
+        if cache is None:
+            return self.build_list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = self.build_list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
+
+
 class BulkCreateUpdateMixin:
     """
     Allows bulk creation and update of resources (given as a list in a JSON),
@@ -330,11 +413,9 @@ class PartyViewSet(ReadOnlyMixin, viewsets.ModelViewSet):
         period = ReportingPeriod.objects.filter(
             name=request.query_params.get('period', '')
         ).first()
-        groups = Group.get_controlled_groups(
+        groups = Group.get_controlled_group_ids(
             Party.objects.filter(pk=pk).first(), period
         )
-        if groups:
-            groups = groups.values_list('group_id', flat=True)
         return Response(groups)
 
     @action(detail=True, methods=["get"])
@@ -347,11 +428,9 @@ class PartyViewSet(ReadOnlyMixin, viewsets.ModelViewSet):
         period = ReportingPeriod.objects.filter(
             name=request.query_params.get('period', '')
         ).first()
-        groups = Group.get_report_groups(
+        groups = Group.get_report_group_ids(
             Party.objects.filter(pk=pk).first(), period
         )
-        if groups:
-            groups = groups.values_list('group_id', flat=True)
         return Response(groups)
 
     @action(detail=True, methods=["get"])
@@ -707,6 +786,64 @@ def populate_aggregation(
             )
 
 
+def aggregated_data_annotations(fields, exclude_eu_and_members):
+    """
+    Returns the annotations needed for summing the given fields in the
+    database, with the same semantics as populate_aggregation():
+    - limit fields are summed over all rows, but are null if any row is null;
+    - when aggregating by party, EU members are excluded from consumption
+      fields and the EU is excluded from production fields.
+    """
+    annotations = {'row_count': Count('pk')}
+    for field in fields:
+        if field.startswith('limit_'):
+            annotations[f'sum_{field}'] = Sum(field)
+            annotations[f'count_{field}'] = Count(field)
+            continue
+
+        expression = F(field)
+        if exclude_eu_and_members:
+            if field.startswith('import_') or field.startswith('export_'):
+                expression = Case(
+                    When(is_eu_member=False, then=F(field)),
+                    default=Value(None),
+                    output_field=DecimalField(),
+                )
+            elif (
+                field.startswith('production_')
+                or field.startswith('destroyed')
+            ):
+                expression = Case(
+                    When(party=eu_party_id(), then=Value(None)),
+                    default=F(field),
+                    output_field=DecimalField(),
+                )
+        # SUM ignores nulls and is null if there are only nulls
+        annotations[f'sum_{field}'] = Sum(expression)
+    return annotations
+
+
+def populate_aggregation_from_sums(aggregation, mt, fields, row):
+    """
+    Populates an aggregation dictionary's fields based on a row annotated
+    using aggregated_data_annotations().
+    """
+    for field in fields:
+        value = row[f'sum_{field}']
+        if (
+            field.startswith('limit_')
+            and row[f'count_{field}'] < row['row_count']
+        ):
+            # A null value in any limit field means that the sum of all
+            # values for that field across an aggregation should be null
+            # (because null means no limits)
+            value = None
+        if value is not None and not mt:
+            # ODP tons values should be rounded
+            value = round_decimal_half_up(value, decimals=2)
+        aggregation[field] = value
+
+
 def filter_aggregated_data_by_grouping(grouping_fields, values_list):
     """
     Helper function that returns a dictionary:
@@ -728,7 +865,7 @@ def filter_aggregated_data_by_grouping(grouping_fields, values_list):
     return filtered_values
 
 
-class AggregationViewSet(viewsets.ReadOnlyModelViewSet):
+class AggregationViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     # Data for this view is in ODP tons for annexes A-E and
     # CO2-eq tonnes for annex F
     queryset = ProdCons.objects.filter(
@@ -791,146 +928,62 @@ class AggregationViewSet(viewsets.ReadOnlyModelViewSet):
             'region': 'party__subregion__region'
         }
 
-        # All decimal fields need to be retrieved from DB
-        fields = self.model_class.decimal_fields()
-        # Using `distinct()` does not work because this queryset is
-        # ordered by fields from related models, which makes similar
-        # values seem distinct.
-        periods = set(
-            queryset.values_list('reporting_period', flat=True)
-        )
-        groups = set(
-            queryset.values_list(self.group_field, flat=True)
-        )
-        parties = set(queryset.values_list('party', flat=True))
-        all_values = queryset.values(
-            *fields,
-            'party', 'reporting_period', self.group_field,
-            *grouping_mapping.values()
-        )
-
         # Field names that will be used for grouping, based on the 'group_by'
         # parameter
         grouping_fields = [
             value for key, value in grouping_mapping.items() if key in groupings
         ]
-        # List of values that will be returned
-        values = []
-        # Use a dictionary of list of dictionaries for in-memory storage to
-        # optimize DB queries.
-        values_dict = {period: [] for period in periods}
-        for value in all_values:
-            values_dict[value['reporting_period']].append(value)
 
-        if aggregates and 'party' in aggregates:
-            exclude_eu_and_members = True
+        # Besides the reporting period and grouping fields, aggregations are
+        # broken down by group or party, depending on what is aggregated.
+        if 'party' in aggregates and 'group' in aggregates:
+            breakdown = {}
+        elif 'party' in aggregates:
+            breakdown = {'group': self.group_field}
+        elif 'group' in aggregates:
+            breakdown = {'party': 'party'}
+        elif substance_to_group is True:
+            # This is used to aggregate MT values (in which entries are
+            # per substance) into entries that contain total values for
+            # each group (as this is what the endpoint should actually
+            # list).
+            breakdown = {'party': 'party', 'group': self.group_field}
         else:
-            exclude_eu_and_members = False
+            return Response([])
 
-        # Now iterate over all periods and produce the data
-        for period in periods:
-            values_for_period = values_dict.get(period, [])
-            # Take grouping fields into account to possibly generate several
-            # objects for the same reporting period
-            filtered_values = filter_aggregated_data_by_grouping(
-                grouping_fields, values_for_period
-            )
-            for key in filtered_values.keys():
-                # We must construct an aggregation for each key-value item
-                # in the filtered_values dictionary
-                grouping_fields_values = dict(zip(grouping_fields, key))
-                to_add = filtered_values[key]
-                params_dict = {
-                    key: grouping_fields_values.get(value, None)
-                    for key, value in grouping_mapping.items()
-                }
+        exclude_eu_and_members = 'party' in aggregates
+        fields = self.model_class.decimal_fields()
 
-                if 'party' in aggregates and 'group' in aggregates:
-                    # Sum values for all groups/substances and all parties
-                    # for this reporting period.
-                    aggregation = dict({
-                        'reporting_period': period,
-                        'party': None,
-                        'group': None,
-                        **params_dict
-                    })
-                    populate_aggregation(
-                        aggregation, self.mt, fields, to_add,
-                        exclude_eu_and_members
-                    )
-                    values.append(aggregation)
-                elif 'party' in aggregates:
-                    for group in groups:
-                        entries = [
-                            value for value in to_add
-                            if value[self.group_field] == group
-                        ]
-                        if entries:
-                            aggregation = dict({
-                                'group': group,
-                                'reporting_period': period,
-                                'party': None,
-                                **params_dict
-                            })
-                            populate_aggregation(
-                                aggregation, self.mt, fields, entries,
-                                exclude_eu_and_members
-                            )
-                            values.append(aggregation)
-                elif 'group' in aggregates:
-                    entries = {party: [] for party in parties}
-                    for value in to_add:
-                        entries[value['party']].append(value)
-                    for party in parties:
-                        if entries.get(party, []):
-                            aggregation = dict({
-                                'party': party,
-                                'reporting_period': period,
-                                'group': None,
-                                **params_dict
-                            })
-                            populate_aggregation(
-                                aggregation, self.mt, fields, entries[party],
-                                exclude_eu_and_members
-                            )
-                            values.append(aggregation)
-                elif substance_to_group is True:
-                    # This is used to aggregate MT values (in which entries are
-                    # per substance) into entries that contain total values for
-                    # each group (as this is what the endpoint should actually
-                    # list).
-                    # It is only done when no other aggregation is performed, as
-                    # any of the above aggregations will already have converted
-                    # the per-substance entries to per-group entries.
-                    entries = {
-                        (party, group): []
-                        for group in groups for party in parties
-                    }
-                    for value in to_add:
-                        key = (value['party'], value[self.group_field])
-                        entries[key].append(value)
-                    for group in groups:
-                        for party in parties:
-                            if entries.get((party, group), []):
-                                aggregation = dict({
-                                    'party': party,
-                                    'group': group,
-                                    'reporting_period': period,
-                                    **params_dict
-                                })
-                                populate_aggregation(
-                                    aggregation, self.mt,
-                                    fields, entries[(party, group)],
-                                    exclude_eu_and_members
-                                )
-                                values.append(aggregation)
+        # Grouping and summing is done by the database, the ordering needs to
+        # be cleared so it does not end up in the GROUP BY clause.
+        rows = queryset.order_by().values(
+            'reporting_period', *grouping_fields, *breakdown.values()
+        ).annotate(
+            **aggregated_data_annotations(fields, exclude_eu_and_members)
+        )
+
+        values = []
+        for row in rows:
+            aggregation = {
+                'reporting_period': row['reporting_period'],
+                'party': None,
+                'group': None,
+            }
+            aggregation.update({
+                key: row[value] for key, value in breakdown.items()
+            })
+            aggregation.update({
+                key: row[value] if value in grouping_fields else None
+                for key, value in grouping_mapping.items()
+            })
+            populate_aggregation_from_sums(aggregation, self.mt, fields, row)
+            values.append(aggregation)
 
         # Aggregating disables pagination. However that is ok given the
         # small number of results that will be returned.
-        # Ordering is also lost due to the use of set().
         return Response(values)
 
-    def list(self, request, *args, **kwargs):
+    def build_list(self, request, *args, **kwargs):
         """
         We need to override the default ViewSet list method to handle the
         custom `aggregation` parameter.
@@ -985,7 +1038,7 @@ class AggregationMTViewSet(AggregationViewSet):
     def get_queryset(self):
         return ProdConsMT.objects.filter(party=F('party__parent_party'))
 
-    def list(self, request, *args, **kwargs):
+    def build_list(self, request, *args, **kwargs):
         """
         Need to override, since these are actually serialized as "normal"
         ProdCons objects (instead of ProdConsMT).
@@ -1031,7 +1084,7 @@ class AggregationDestructionViewSet(AggregationViewSet):
     group_or_substance = 'group'
     mt = False
 
-    def list(self, request, *args, **kwargs):
+    def build_list(self, request, *args, **kwargs):
         """
         We need to override the default ViewSet list method to handle the
         custom `aggregation` parameter.
@@ -1193,7 +1246,7 @@ class LimitViewFilterSet(filters.FilterSet):
     )
 
 
-class LimitViewSet(viewsets.ModelViewSet):
+class LimitViewSet(CachedListMixin, viewsets.ModelViewSet):
     # Will only allow GET for now on this view
     http_method_names = ['get']
 
@@ -1588,7 +1641,7 @@ class SubmissionViewSet(viewsets.ModelViewSet):
         obligation = submission.obligation._obligation_type
         filename = f'{obligation}_{pk}_{timestamp}.pdf'
         buf_pdf = export_submissions(submission.obligation, [submission])
-        resp = HttpResponse(buf_pdf, content_type='application/pdf')
+        resp = FileResponse(buf_pdf, content_type='application/pdf')
         resp['Content-Disposition'] = f'attachment; filename="{filename}"'
         resp['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return resp
@@ -1599,11 +1652,21 @@ class SubmissionViewSet(viewsets.ModelViewSet):
         timestamp = datetime.now().strftime('%Y-%m-%d')
         filename = f'prodcons_{pk}_{timestamp}.pdf'
         buf_pdf = export_prodcons(submission=submission, periods=None, parties=None)
-        resp = HttpResponse(buf_pdf, content_type='application/pdf')
+        resp = FileResponse(buf_pdf, content_type='application/pdf')
         resp['Content-Disposition'] = f'attachment; filename="{filename}"'
         resp['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return resp
 
+    @action(detail=True, methods=["get"])
+    def imports_exports_errors(self, request, pk=None):
+        """
+        Validates the imports and exports data as done on submit, so it can
+        be checked beforehand. Returns all the error messages found, for
+        imports and exports.
+        """
+        submission = self.get_object()
+        return Response(submission.get_imports_exports_errors())
+
     @action(detail=True, methods=["get"])
     def aggregations(self, request, submission_pk=None, pk=None):
         sub = Submission.objects.get(pk=pk)
@@ -2151,6 +2214,17 @@ class EmailTemplateViewSet(mixins.ListModelMixin, GenericViewSet):
     queryset = EmailTemplate.objects.all()
 
 
+class CacheInvalidationViewSet(viewsets.ViewSet):
+    """
+    Metrics of the queue invalidating the main website's cache, for the
+    current process.
+    """
+    permission_classes = (IsAuthenticated, IsSecretariat)
+
+    def list(self, request):
+        return Response(invalidation_queue.metrics())
+
+
 class UploadHookViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny,)
     """
@@ -2544,6 +2618,10 @@ class DefaultValuesViewSet(ReadOnlyMixin, views.APIView):
 
 
 class ReportsViewSet(viewsets.ViewSet):
+    """
+    Each report can be generated synchronously (by the GET action with the
+    report's name) or in the background, by submitting a job.
+    """
     permission_classes = (IsAuthenticated,)
 
     def list(self, request):
@@ -2552,13 +2630,22 @@ class ReportsViewSet(viewsets.ViewSet):
     def _response_pdf(self, base_name, buf_pdf):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'{base_name}_{timestamp}.pdf'
-        resp = HttpResponse(buf_pdf, content_type='application/pdf')
+        # Reports are rendered to (or cached in) files, which are streamed
+        resp = FileResponse(buf_pdf, content_type='application/pdf')
         resp['Content-Disposition'] = f'attachment; filename="{filename}"'
         resp['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return resp
 
+    def _get_params(self, request, key):
+        if request.method == 'GET':
+            return request.GET.getlist(key=key)
+        if hasattr(request.data, 'getlist'):
+            return request.data.getlist(key)
+        value = request.data.get(key, [])
+        return value if isinstance(value, list) else [value]
+
     def _get_parties(self, request):
-        parties = request.GET.getlist(key='party')
+        parties = self._get_params(request, 'party')
         if request.user.is_secretariat:
             qs = Party.get_main_parties()
             if parties:
@@ -2570,185 +2657,299 @@ class ReportsViewSet(viewsets.ViewSet):
         return qs.order_by('name')
 
     def _get_periods(self, request):
-        reporting_periods = request.GET.getlist(key='period')
+        reporting_periods = self._get_params(request, 'period')
         qs = ReportingPeriod.get_past_periods()
         if reporting_periods:
             qs = qs.filter(pk__in=reporting_periods)
         return qs.order_by('-start_date')
 
     def get_submissions(self, obligation, periods, parties):
-        submissions = list()
-        for period in periods:
-            for party in parties:
-                sub = Submission.latest_submitted(
-                    obligation, party, period
-                )
-                if sub:
-                    submissions.append(sub)
-        return submissions
+        latest = Submission.latest_submitted_for_matrix(
+            obligation, parties, periods
+        )
+        return [
+            latest[(party.pk, period.pk)]
+            for period in periods
+            for party in parties
+            if (party.pk, period.pk) in latest
+        ]
 
-    @action(detail=False, methods=["get"])
-    def art7_raw(self, request):
-        parties = self._get_parties(request)
-        periods = self._get_periods(request)
+    def build_report(self, report, parties, periods):
+        """
+        Returns a (base file name, PDF buffer) tuple for the report. Reports
+        are only rendered if not already cached for the current data.
+        """
+        params = {
+            'party': [p.pk for p in parties],
+            'period': [p.pk for p in periods],
+        }
+        return report_cache.get_or_build(
+            report, params,
+            partial(getattr(self, f'build_{report}'), parties, periods)
+        )
+
+    def _report_response(self, request, report):
+        return self._response_pdf(*self.build_report(
+            report, self._get_parties(request), self._get_periods(request)
+        ))
+
+    def _get_job_scope(self, request):
+        if request.user.is_secretariat:
+            return 'secretariat'
+        return f'party:{request.user.party_id}'
+
+    def _get_job(self, request, job_id):
+        job = report_jobs.get(job_id)
+        if job is None or job['scope'] != self._get_job_scope(request):
+            raise Http404()
+        return job
+
+    @action(detail=False, methods=["post"])
+    def jobs(self, request):
+        """
+        Submits a report for background generation. Expects the report name
+        in `report` and the same `party`/`period` parameters as the report.
+        """
+        report = request.data.get('report')
+        if report not in [r.value for r in Reports]:
+            raise InvalidRequest({'report': _('Unknown report.')})
+
+        # Resolved now, as permissions depend on the requesting user
+        party_ids = list(
+            self._get_parties(request).values_list('pk', flat=True)
+        )
+        period_ids = list(
+            self._get_periods(request).values_list('pk', flat=True)
+        )
+
+        def build():
+            return self.build_report(
+                report,
+                Party.objects.filter(pk__in=party_ids).order_by('name'),
+                ReportingPeriod.objects.filter(
+                    pk__in=period_ids
+                ).order_by('-start_date'),
+            )
+
+        job = report_jobs.submit(
+            report,
+            {'party': party_ids, 'period': period_ids},
+            self._get_job_scope(request),
+            build,
+        )
+        return Response(job, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        detail=False, methods=["get"],
+        url_path=r'jobs/(?P<job_id>[0-9a-f]{40})'
+    )
+    def job(self, request, job_id):
+        return Response(self._get_job(request, job_id))
+
+    @action(
+        detail=False, methods=["get"],
+        url_path=r'jobs/(?P<job_id>[0-9a-f]{40})/download'
+    )
+    def job_download(self, request, job_id):
+        job = self._get_job(request, job_id)
+        if job['status'] != report_jobs.DONE:
+            raise Http404(_('The report is not ready yet.'))
+        try:
+            buf_pdf = open(report_jobs.get_file_path(job_id), 'rb')
+        except FileNotFoundError:
+            raise Http404()
+        return self._response_pdf(job['filename'], buf_pdf)
+
+    def build_art7_raw(self, parties, periods):
         params = "%s_%s" % (
             "_".join(p.abbr for p in parties),
             "_".join(p.name for p in periods),
         )
         art7 = Obligation.objects.get(_obligation_type=ObligationTypes.ART7.value)
-        return self._response_pdf(
+        return (
             f'art7raw_{params}',
             export_submissions(art7, self.get_submissions(art7, periods, parties))
         )
 
     @action(detail=False, methods=["get"])
-    def baseline_hfc_raw(self, request):
-        parties = self._get_parties(request)
+    def art7_raw(self, request):
+        return self._report_response(request, 'art7_raw')
+
+    def build_baseline_hfc_raw(self, parties, periods):
         params = "_".join(p.abbr for p in parties)
-        return self._response_pdf(
+        return (
             f'art7raw_{params}',
             export_baseline_hfc_raw(parties),
         )
 
     @action(detail=False, methods=["get"])
-    def labuse(self, request):
-        periods = self._get_periods(request)
+    def baseline_hfc_raw(self, request):
+        return self._report_response(request, 'baseline_hfc_raw')
+
+    def build_labuse(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'art7raw_{params}',
             export_labuse(periods),
         )
 
     @action(detail=False, methods=["get"])
-    def prodcons(self, request):
-        parties = self._get_parties(request)
-        periods = self._get_periods(request)
+    def labuse(self, request):
+        return self._report_response(request, 'labuse')
+
+    def build_prodcons(self, parties, periods):
         params = "%s_%s" % (
             "_".join(p.abbr for p in parties),
             "_".join(p.name for p in periods),
         )
-        return self._response_pdf(
+        return (
             f'prodcons_{params}',
             export_prodcons(submission=None, periods=periods, parties=parties)
         )
 
     @action(detail=False, methods=["get"])
-    def prodcons_by_region(self, request):
-        periods = self._get_periods(request)
+    def prodcons(self, request):
+        return self._report_response(request, 'prodcons')
+
+    def build_prodcons_by_region(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'prodcons_by_region_{params}',
             export_prodcons_by_region(periods=periods),
         )
 
     @action(detail=False, methods=["get"])
-    def prodcons_a5_summary(self, request):
-        periods = self._get_periods(request)
+    def prodcons_by_region(self, request):
+        return self._report_response(request, 'prodcons_by_region')
+
+    def build_prodcons_a5_summary(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'prodcons_a5_summary_{params}',
             export_prodcons_a5_summary(periods=periods),
         )
 
     @action(detail=False, methods=["get"])
-    def prodcons_a5_parties(self, request):
-        periods = self._get_periods(request)
+    def prodcons_a5_summary(self, request):
+        return self._report_response(request, 'prodcons_a5_summary')
+
+    def build_prodcons_a5_parties(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'prodcons_a5_parties_{params}',
             export_prodcons_parties(periods=periods, is_article5=True),
         )
 
     @action(detail=False, methods=["get"])
-    def prodcons_na5_parties(self, request):
-        periods = self._get_periods(request)
+    def prodcons_a5_parties(self, request):
+        return self._report_response(request, 'prodcons_a5_parties')
+
+    def build_prodcons_na5_parties(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'prodcons_na5_parties_{params}',
             export_prodcons_parties(periods=periods, is_article5=False),
         )
 
     @action(detail=False, methods=["get"])
-    def raf(self, request):
-        parties = self._get_parties(request)
-        periods = self._get_periods(request)
+    def prodcons_na5_parties(self, request):
+        return self._report_response(request, 'prodcons_na5_parties')
+
+    def build_raf(self, parties, periods):
         params = "%s_%s" % (
             "_".join(p.abbr for p in parties),
             "_".join(p.name for p in periods),
         )
         raf = Obligation.objects.get(_obligation_type=ObligationTypes.ESSENCRIT.value)
-        return self._response_pdf(
+        return (
             f'raf_{params}',
             export_submissions(raf, self.get_submissions(raf, periods, parties))
         )
 
     @action(detail=False, methods=["get"])
-    def impexp_new_rec(self, request):
-        parties = self._get_parties(request)
-        periods = self._get_periods(request)
+    def raf(self, request):
+        return self._report_response(request, 'raf')
+
+    def build_impexp_new_rec(self, parties, periods):
         params = "%s_%s" % (
             "_".join(p.abbr for p in parties),
             "_".join(p.name for p in periods),
         )
-        return self._response_pdf(
+        return (
             f'impexp_new_rec_{params}',
             export_impexp_new_rec(periods=periods, parties=parties)
         )
 
     @action(detail=False, methods=["get"])
-    def impexp_rec_subst(self, request):
-        periods = self._get_periods(request)
+    def impexp_new_rec(self, request):
+        return self._report_response(request, 'impexp_new_rec')
+
+    def build_impexp_rec_subst(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'impexp_rec_subst_{params}',
             export_impexp_rec_subst(periods=periods)
         )
 
     @action(detail=False, methods=["get"])
-    def impexp_new_rec_agg(self, request):
-        periods = self._get_periods(request)
+    def impexp_rec_subst(self, request):
+        return self._report_response(request, 'impexp_rec_subst')
+
+    def build_impexp_new_rec_agg(self, parties, periods):
         params = "_".join(p.name for p in periods)
-        return self._response_pdf(
+        return (
             f'impexp_rec_subst_{params}',
             export_impexp_new_rec_agg(periods=periods)
         )
 
     @action(detail=False, methods=["get"])
-    def hfc_baseline(self, request):
-        parties = self._get_parties(request)
+    def impexp_new_rec_agg(self, request):
+        return self._report_response(request, 'impexp_new_rec_agg')
+
+    def build_hfc_baseline(self, parties, periods):
         params = "_".join(p.abbr for p in parties)
-        return self._response_pdf(
+        return (
             f'hfc_baseline_{params}',
             export_hfc_baseline(parties=parties)
         )
 
     @action(detail=False, methods=["get"])
-    def baseline_prod_a5(self, request):
-        parties = self._get_parties(request)
+    def hfc_baseline(self, request):
+        return self._report_response(request, 'hfc_baseline')
+
+    def build_baseline_prod_a5(self, parties, periods):
         params = "_".join(p.abbr for p in parties)
-        return self._response_pdf(
+        return (
             f'baseline_prod_a5_{params}',
             export_baseline_prod_a5(parties=parties)
         )
 
     @action(detail=False, methods=["get"])
-    def baseline_cons_a5(self, request):
-        parties = self._get_parties(request)
+    def baseline_prod_a5(self, request):
+        return self._report_response(request, 'baseline_prod_a5')
+
+    def build_baseline_cons_a5(self, parties, periods):
         params = "_".join(p.abbr for p in parties)
-        return self._response_pdf(
+        return (
             f'baseline_cons_a5_{params}',
             export_baseline_cons_a5(parties=parties)
         )
 
     @action(detail=False, methods=["get"])
-    def baseline_prodcons_na5(self, request):
-        parties = self._get_parties(request)
+    def baseline_cons_a5(self, request):
+        return self._report_response(request, 'baseline_cons_a5')
+
+    def build_baseline_prodcons_na5(self, parties, periods):
         params = "_".join(p.abbr for p in parties)
-        return self._response_pdf(
+        return (
             f'baseline_cons_a5_{params}',
             export_baseline_prodcons_na5(parties=parties)
         )
 
+    @action(detail=False, methods=["get"])
+    def baseline_prodcons_na5(self, request):
+        return self._report_response(request, 'baseline_prodcons_na5')
+
 
 class CriticalUseCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAuthenticated,)
@@ -2911,35 +3112,34 @@ class EssentialCriticalFilterSet(SwitchableOrFilterset):
     )
 
 
-def populate_essencrit_aggregation(aggregation, to_add, odp_tons):
+def essencrit_annotations(odp_tons):
     """
-    Helper function to populate an aggregation's fields based on a list
-    of dictionaries containing key-value pairs for those fields.
+    Returns the annotations needed for summing the essential and critical use
+    quantities in the database. Exemptions for substances with critical uses
+    are counted as critical, all others as essential.
+
+    A sum is null if there are no exemptions of that kind; null quantities
+    are counted as zero.
     """
+    quantity = Coalesce(
+        'quantity', Value(Decimal(0)), output_field=DecimalField()
+    )
     if odp_tons:
-        # ODP tons values should be rounded
-        rounding_method = partial(round_decimal_half_up, decimals=2)
-    else:
-        # Do not round metric tons values when populating MT aggregations
-        rounding_method = lambda x: x
-
-    essential_use_quantities = [
-        (a['quantity'] or Decimal(0)) * (a['substance__odp'] if odp_tons else Decimal(1))
-        for a in to_add
-        if not a['substance__has_critical_uses']
-    ]
-    aggregation['quantity_essential'] = rounding_method(
-        sum(essential_use_quantities)
-    ) if essential_use_quantities else None
-
-    critical_use_quantities = [
-        (a['quantity'] or Decimal(0)) * (a['substance__odp'] if odp_tons else Decimal(1))
-        for a in to_add
-        if a['substance__has_critical_uses']
-    ]
-    aggregation['quantity_critical'] = rounding_method(
-        sum(critical_use_quantities)
-    ) if critical_use_quantities else None
+        quantity = ExpressionWrapper(
+            quantity * F('substance__odp'), output_field=DecimalField()
+        )
+    return {
+        'quantity_essential': Sum(Case(
+            When(substance__has_critical_uses=False, then=quantity),
+            default=Value(None),
+            output_field=DecimalField(),
+        )),
+        'quantity_critical': Sum(Case(
+            When(substance__has_critical_uses=True, then=quantity),
+            default=Value(None),
+            output_field=DecimalField(),
+        )),
+    }
 
 
 class EssentialCriticalViewSet(viewsets.ReadOnlyModelViewSet):
@@ -3019,96 +3219,43 @@ class EssentialCriticalViewSet(viewsets.ReadOnlyModelViewSet):
             value for key, value in grouping_mapping.items() if key in groupings
         ]
 
-        # Otherwise, need to perform the aggregations
-        values_list = queryset.values_list(
-            'submission__reporting_period',
-            'submission__party',
-            'substance__group',
-        )
-        reporting_periods = set(value[0] for value in values_list)
-        parties = set(value[1] for value in values_list)
-        groups = set(value[2] for value in values_list)
+        # Besides the reporting period and grouping fields, aggregations are
+        # broken down by party or group, depending on what is aggregated.
+        if 'party' in aggregates and 'group' in aggregates:
+            breakdown = {}
+        elif 'group' in aggregates:
+            breakdown = {'party': 'submission__party'}
+        else:
+            breakdown = {'group': 'substance__group'}
 
-        all_values = queryset.values(
-            'quantity', 'submission__party', 'submission__reporting_period',
-            'substance_id', 'substance__odp', 'substance__group',
-            'substance__has_critical_uses',
-            *grouping_mapping.values()
-        )
-        values_dict = {period: [] for period in reporting_periods}
-        for value in all_values:
-            values_dict[value['submission__reporting_period']].append(value)
+        # Grouping and summing is done by the database, the ordering needs to
+        # be cleared so it does not end up in the GROUP BY clause.
+        rows = queryset.order_by().values(
+            'submission__reporting_period', *grouping_fields,
+            *breakdown.values()
+        ).annotate(**essencrit_annotations(self.odp_tons))
 
-        # List of values that will be returned
         data = []
-        for reporting_period in reporting_periods:
-            # Create in-memory list of dictionaries for each exemption approved
-            # for this reporting_period
-            values_for_period = values_dict.get(reporting_period, [])
-            if not values_for_period:
-                continue
-
-            # Take grouping fields into account to possibly generate several
-            # objects for the same reporting period
-            filtered_values = filter_aggregated_data_by_grouping(
-                grouping_fields, values_for_period
-            )
-            for key in filtered_values.keys():
-                # We must construct an aggregation for each key-value item
-                # in the filtered_values dictionary
-                to_add = filtered_values[key]
-                grouping_fields_values = dict(zip(grouping_fields, key))
-                params_dict = {
-                    key: grouping_fields_values.get(value, None)
-                    for key, value in grouping_mapping.items()
-                }
-
-                # Now aggregate
-                if 'party' in aggregates and 'group' in aggregates:
-                    ret = dict({
-                        'reporting_period': reporting_period,
-                        'party': None,
-                        'group': None,
-                        **params_dict
-                    })
-                    populate_essencrit_aggregation(ret, to_add, self.odp_tons)
-                    data.append(ret)
-                elif 'group' in aggregates:
-                    for party in parties:
-                        # Do in-memory filtering to avoid yet another DB hit
-                        entries = [
-                            entry for entry in to_add
-                            if entry['submission__party'] == party
-                        ]
-                        if entries:
-                            ret = dict({
-                                'reporting_period': reporting_period,
-                                'party': party,
-                                'group': None,
-                                **params_dict
-                            })
-                            populate_essencrit_aggregation(
-                                ret, entries, self.odp_tons
-                            )
-                            data.append(ret)
-                elif 'party' in aggregates:
-                    for group in groups:
-                        # Do in-memory filtering to avoid yet another DB hit
-                        entries = [
-                            entry for entry in to_add
-                            if entry['substance__group'] == group
-                        ]
-                        if entries:
-                            ret = dict({
-                                'reporting_period': reporting_period,
-                                'party': None,
-                                'group': group,
-                                **params_dict
-                            })
-                            populate_essencrit_aggregation(
-                                ret, entries, self.odp_tons
-                            )
-                            data.append(ret)
+        for row in rows:
+            aggregation = {
+                'reporting_period': row['submission__reporting_period'],
+                'party': None,
+                'group': None,
+            }
+            aggregation.update({
+                key: row[value] for key, value in breakdown.items()
+            })
+            aggregation.update({
+                key: row[value] if value in grouping_fields else None
+                for key, value in grouping_mapping.items()
+            })
+            for field in ('quantity_essential', 'quantity_critical'):
+                value = row[field]
+                if value is not None and self.odp_tons:
+                    # ODP tons values should be rounded
+                    value = round_decimal_half_up(value, decimals=2)
+                aggregation[field] = value
+            data.append(aggregation)
 
         return Response(data)
 
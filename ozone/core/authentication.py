@@ -0,0 +1,98 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .utils.cache import get_api_cache
+
+
+def _token_cache_key(key):
+    # Token keys are credentials, they are not stored in the cache as such.
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_token(key, request=None):
+    """
+    Returns the Token with the given key (along with its user), or None if
+    there is no such token.
+
+    Tokens are remembered on the request, so the middleware and the API
+    authentication share the same lookup, and are cached in the API cache (if
+    configured) for settings.AUTH_TOKEN_CACHE_TIMEOUT seconds. Changing or
+    deleting tokens and users evicts them from the cache (see signals).
+    """
+    tokens = None
+    if request is not None:
+        if not hasattr(request, '_auth_tokens'):
+            request._auth_tokens = {}
+        tokens = request._auth_tokens
+        if key in tokens:
+            return tokens[key]
+
+    cache = get_api_cache()
+    cache_key = _token_cache_key(key)
+    token = cache.get(cache_key) if cache is not None else None
+    if token is None:
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is not None and cache is not None:
+            cache.set(
+                cache_key, token, int(settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            )
+
+    if tokens is not None:
+        tokens[key] = token
+    return token
+
+
+def evict_token(key):
+    """
+    Removes the token from the cache, right away and once again after the
+    current transaction is committed (so that requests running in the
+    meantime do not put it back).
+    """
+    cache = get_api_cache()
+    if cache is None:
+        return
+    cache_key = _token_cache_key(key)
+    cache.delete(cache_key)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+
+def evict_user_tokens(user_id):
+    """
+    Removes the tokens of this user from the cache.
+    """
+    if get_api_cache() is None:
+        return
+    for key in Token.objects.filter(user_id=user_id).values_list(
+        'key', flat=True
+    ):
+        evict_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Same as TokenAuthentication, but looks up tokens using get_token().
+    """
+
+    def authenticate(self, request):
+        # Authenticators are instantiated for each request
+        self.request = request._request
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        token = get_token(key, getattr(self, 'request', None))
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        return (token.user, token)
@@ -1,6 +1,5 @@
 import json
 from decimal import Decimal
-from functools import lru_cache
 import logging
 
 from django.db import transaction
@@ -8,15 +7,14 @@ from django.template.response import TemplateResponse
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 
+from ozone.core.calculated.context import CalculationContext
+from ozone.core.calculated import dirty
 from ozone.core.models import Baseline
 from ozone.core.models import BaselineType
+from ozone.core.models import CalculationDirtyKey
 from ozone.core.models import Group
 from ozone.core.models import Party
-from ozone.core.models import PartyHistory
-from ozone.core.models import ProdCons
-from ozone.core.models import ReportingPeriod
 from ozone.core.models import Submission
-from ozone.core.models import Transfer
 from ozone.core.models.utils import round_decimal_half_up
 from ozone.core.models.utils import sum_decimals
 from ozone.core.models.utils import decimal_zero_if_none
@@ -32,45 +30,33 @@ class CalculationError(Exception):
 
 class BaselineCalculator:
 
-    def __init__(self):
-        self.current_period = ReportingPeriod.get_current_period()
-        self.groups = {
-            _group.group_id: _group
-            for _group in Group.objects.all()
-        }
-        self.reporting_periods = {
-            _period.name: _period
-            for _period in ReportingPeriod.objects.all()
-        }
-        self.parties = {
-            _party.abbr: _party
-            for _party in Party.get_main_parties()
-        }
+    def __init__(self, context=None):
+        # All data is read from the (possibly shared) calculation context
+        self.context = context if context is not None else CalculationContext()
+        self.current_period = self.context.current_period
+        self.groups = self.context.groups
+        self.reporting_periods = self.context.reporting_periods
+        self.parties = self.context.parties
         self.party_types = {
-            entry['party__abbr']: entry['party_type__abbr']
-            for entry in PartyHistory.objects.filter(
-                reporting_period=self.current_period,
-            ).values('party__abbr', 'party_type__abbr')
+            ph.party.abbr: ph.party_type.abbr if ph.party_type else None
+            for ph in self.context.party_histories.values()
+            if ph.reporting_period_id == self.current_period.id
         }
-        self.eu_member_states = [
-            _party.abbr
-            for _party in Party.get_eu_members()
-        ]
-        self.eu_member_states_1989 = [
-            _party.abbr
-            for _party in Party.get_eu_members_at(
-                self.reporting_periods['1989']
-            )
-        ]
+        self.eu_member_states = self.context.get_eu_member_abbrs_at(
+            self.current_period
+        )
+        self.eu_member_states_1989 = self.context.get_eu_member_abbrs_at(
+            self.reporting_periods['1989']
+        )
         self.baseline_types = {
             _baseline_type.name: _baseline_type
             for _baseline_type in BaselineType.objects.all()
         }
 
         def _new_eu_member_states_since(period_name):
-            eu_members_for_period = Party.get_eu_members_at(
+            eu_members_for_period = self.context.get_eu_member_abbrs_at(
                 self.reporting_periods[period_name]
-            ).values_list('abbr', flat=True)
+            )
             return [
                 self.parties[_party]
                 for _party in self.eu_member_states
@@ -81,12 +67,8 @@ class BaselineCalculator:
             for _period in ('1989', '2009', '2010')
         }
 
-    @lru_cache(maxsize=1)
-    def _get_prodcons_objects(self, group, party):
-        prodcons_objects = {p: None for p in self.reporting_periods}
-        for p in ProdCons.objects.filter(group=group, party=party):
-            prodcons_objects[p.reporting_period.name] = p
-        return prodcons_objects
+        # Non-persistent aggregations calculated from submissions, by id
+        self._aggregations_from_submissions = {}
 
     def get_baseline(self, baseline_type, group, party):
         func, periods = getattr(
@@ -94,10 +76,8 @@ class BaselineCalculator:
         )(group, party)
         return func(party, group, periods) if func else None
 
-    @lru_cache(maxsize=1)
     def _get_prodcons(self, party, group, period_name):
-        prodcons_objects = self._get_prodcons_objects(group, party)
-        p = prodcons_objects.get(period_name, None)
+        p = self.context.get_prodcons(party, group, period_name)
         if p is None:
             logger.warning("{} has not reported {} for {}".format(
                 party.name,
@@ -107,16 +87,7 @@ class BaselineCalculator:
         return p
 
     def _get_bdn_transfer(self, party, group, period_name):
-        transfers = Transfer.objects.filter(
-            is_basic_domestic_need=True,
-            source_party=party,
-            reporting_period__name=period_name,
-            substance__group=group
-        )
-        transfer_odp = Decimal(0)
-        for tx in transfers:
-            transfer_odp += tx.transferred_amount * tx.substance.odp
-        return transfer_odp
+        return self.context.get_bdn_transfer(party, group, period_name)
 
     def production(self, party, group, periods):
         if len(periods) != 1:
@@ -242,25 +213,29 @@ class BaselineCalculator:
         hcfc_1989 = self._get_prodcons(party, hcfc_group, '1989')
         cfc_1989 = self._get_prodcons(party, cfc_group, '1989')
         if hcfc_1989 and cfc_1989:
+            # The ProdCons objects are shared through the calculation context,
+            # so they must not be modified here.
+            hcfc_cons = hcfc_1989.calculated_consumption
+            cfc_cons = cfc_1989.calculated_consumption
             if hcfc_1989.is_eu_member:
-                # hcfc_1989.calculated_consumption = round_decimal_half_up(
+                # hcfc_cons = round_decimal_half_up(
                 #     hcfc_1989.get_calc_consumption(),
                 #     1  # always 1 decimal for 1989
                 # )
-                # cfc_1989.calculated_consumption = round_decimal_half_up(
+                # cfc_cons = round_decimal_half_up(
                 #     cfc_1989.get_calc_consumption(),
                 #     1  # always 1 decimal for 1989
                 # )
                 # TODO: but is it correct to use unrounded values for EU members
                 # and rounded values for non-EU?
-                hcfc_1989.calculated_consumption = hcfc_1989.get_calc_consumption()
-                cfc_1989.calculated_consumption = cfc_1989.get_calc_consumption()
+                hcfc_cons = hcfc_1989.get_calc_consumption()
+                cfc_cons = cfc_1989.get_calc_consumption()
 
             # Use already rounded values for calculated consumption
             c1_baseline_cons = round_decimal_half_up(
                 sum((
-                    hcfc_1989.calculated_consumption,
-                    cfc_1989.calculated_consumption * Decimal('0.028'),
+                    hcfc_cons,
+                    cfc_cons * Decimal('0.028'),
                 )),
                 1,  # always 1 decimal for 1989
             )
@@ -332,8 +307,8 @@ class BaselineCalculator:
                 total_amount += prodcons.calculated_production
             elif prod_cons == 'CONS':
                 # Check EU membership
-                if party in Party.get_eu_members_at(
-                    self.reporting_periods[period]
+                if self.context.is_eu_member_at(
+                    party, self.reporting_periods[period]
                 ):
                     return None
                 total_amount += (
@@ -488,15 +463,17 @@ class BaselineCalculator:
             func = self.average_production_bdn
         return func, periods
 
-    @lru_cache(maxsize=1)
     def _get_aggregation_from_submission(self, submission_id):
         """
         Helps cache result of expensive call made in _prod_cons_gwp().
         """
-        submission = Submission.objects.get(pk=submission_id)
-        return submission.get_aggregated_data(
-            baseline=True, populate_baselines=False
-        )
+        if submission_id not in self._aggregations_from_submissions:
+            submission = Submission.objects.get(pk=submission_id)
+            self._aggregations_from_submissions[submission_id] = \
+                submission.get_aggregated_data(
+                    baseline=True, populate_baselines=False
+                )
+        return self._aggregations_from_submissions[submission_id]
 
     def _prod_cons_gwp(self, party, group, period_name, prod_or_cons):
         """
@@ -687,12 +664,18 @@ class BaselineCalculator:
         return func, periods
 
 
-def expected_baselines(parties, groups):
-    calculator = BaselineCalculator()
+def expected_baselines(parties, groups, context=None, keys=None):
+    """
+    If `keys` is given, only baselines for the (party_id, group_id) pairs
+    contained in it are calculated.
+    """
+    calculator = BaselineCalculator(context)
     baseline_types = list(BaselineType.objects.all())
 
     for party in parties:
         for group in groups:
+            if keys is not None and (party.id, group.id) not in keys:
+                continue
             for baseline_type in baseline_types:
                 baseline = calculator.get_baseline(baseline_type.name, group, party)
                 if baseline is None:
@@ -706,7 +689,7 @@ def expected_baselines(parties, groups):
                 }
 
 
-def baselines_diff(parties, groups):
+def baselines_diff(parties, groups, context=None, keys=None):
     def record_key(record):
         return (
             record['party'].id,
@@ -726,6 +709,8 @@ def baselines_diff(parties, groups):
         for record in expected_baselines(
             list(parties),
             list(groups),
+            context,
+            keys,
         )
     }
 
@@ -738,6 +723,8 @@ def baselines_diff(parties, groups):
         .filter(group__in=groups)
     )
     for row in existing_baselines.iterator():
+        if keys is not None and (row.party_id, row.group_id) not in keys:
+            continue
         key = row_key(row)
         try:
             expected_record = expected.pop(key)
@@ -757,14 +744,27 @@ def baselines_diff(parties, groups):
 
 def admin_diff(request, context):
     parties = Party.get_main_parties()
-    if request.POST['party'] != '*':
+    if request.POST['party'] not in ('*', 'dirty'):
         parties = parties.filter(pk=request.POST['party'])
 
     groups = Group.objects.all()
     if request.POST['group'] != '*':
         groups = groups.filter(pk=request.POST['group'])
 
-    diff = baselines_diff(parties, groups)
+    calculation_context = CalculationContext()
+    keys = None
+    if request.POST['party'] == 'dirty':
+        # Only recalculate baselines whose inputs have changed
+        marks = dirty.get_dirty_marks(CalculationDirtyKey.Targets.BASELINES)
+        keys = dirty.get_dirty_baseline_keys(calculation_context, marks)
+        # The marks can only be cleared if the diff shows all the changes
+        # they caused, i.e. it is not filtered.
+        if marks and (
+            request.POST['group'] == '*'
+        ):
+            context['dirty_until'] = max(mark.pk for mark in marks)
+
+    diff = baselines_diff(parties, groups, calculation_context, keys)
 
     for record in diff['missing']:
         record['checkbox_value'] = json.dumps({
@@ -786,6 +786,7 @@ def admin_diff(request, context):
         })
 
     context['diff'] = diff
+    context['diff_size'] = sum(len(records) for records in diff.values())
 
 
 @transaction.atomic
@@ -831,6 +832,21 @@ def admin_apply(request, context):
             _("Removed %d baselines") % removed,
         )
 
+    if request.POST.get('dirty_until'):
+        # Marks are kept if some of the proposed changes were left out, so
+        # the corresponding baselines are recalculated next time.
+        if created + updated + removed == int(request.POST['diff_size']):
+            dirty.clear_dirty_marks(
+                CalculationDirtyKey.Targets.BASELINES,
+                int(request.POST['dirty_until'])
+            )
+        else:
+            messages.warning(
+                request,
+                _("Not all changes were applied; the changed data is still "
+                  "marked for recalculation"),
+            )
+
 
 def admin_view(request, context):
     if request.POST:
@@ -0,0 +1,136 @@
+from decimal import Decimal
+
+from django.utils.functional import cached_property
+
+from ozone.core.models import Baseline
+from ozone.core.models import Group
+from ozone.core.models import Party
+from ozone.core.models import PartyHistory
+from ozone.core.models import ProdCons
+from ozone.core.models import ReportingPeriod
+from ozone.core.models import Transfer
+
+
+class CalculationContext:
+    """
+    In-memory snapshot of the data used by the baseline and limit calculators.
+
+    Each dataset is fetched using a single query the first time it is needed
+    and then indexed in dictionaries, so calculations over all parties, groups
+    and periods need a constant number of queries.
+
+    A context can be shared between several calculators; it should not be kept
+    around for longer than a calculation run, as it is never refreshed.
+    """
+
+    @cached_property
+    def current_period(self):
+        return ReportingPeriod.get_current_period()
+
+    @cached_property
+    def groups(self):
+        return {
+            _group.group_id: _group
+            for _group in Group.objects.all()
+        }
+
+    @cached_property
+    def reporting_periods(self):
+        return {
+            _period.name: _period
+            for _period in ReportingPeriod.objects.all()
+        }
+
+    @cached_property
+    def parties(self):
+        return {
+            _party.abbr: _party
+            for _party in Party.get_main_parties()
+        }
+
+    @cached_property
+    def prodcons(self):
+        """
+        ProdCons objects, keyed by (party_id, group_id, period_name)
+        """
+        return {
+            (p.party_id, p.group_id, p.reporting_period.name): p
+            for p in ProdCons.objects.all()
+        }
+
+    def get_prodcons(self, party, group, period_name):
+        return self.prodcons.get((party.id, group.id, period_name))
+
+    @cached_property
+    def bdn_transfers(self):
+        """
+        ODP-weighted sums of BDN transfers, keyed by
+        (source_party_id, group_id, period_name)
+        """
+        ret = {}
+        for tx in Transfer.objects.filter(is_basic_domestic_need=True).values(
+            'source_party_id', 'substance__group_id', 'reporting_period__name',
+            'transferred_amount', 'substance__odp'
+        ):
+            key = (
+                tx['source_party_id'],
+                tx['substance__group_id'],
+                tx['reporting_period__name']
+            )
+            ret[key] = (
+                ret.get(key, Decimal(0))
+                + tx['transferred_amount'] * tx['substance__odp']
+            )
+        return ret
+
+    def get_bdn_transfer(self, party, group, period_name):
+        return self.bdn_transfers.get(
+            (party.id, group.id, period_name), Decimal(0)
+        )
+
+    @cached_property
+    def baselines(self):
+        """
+        Baseline objects, keyed by party_id and then by
+        (group_id, baseline_type_name)
+        """
+        ret = {}
+        for b in Baseline.objects.select_related('group', 'baseline_type'):
+            key = (b.group.group_id, b.baseline_type.name)
+            ret.setdefault(b.party_id, {})[key] = b
+        return ret
+
+    def get_baselines_for_party(self, party):
+        return self.baselines.get(party.id, {})
+
+    @cached_property
+    def party_histories(self):
+        """
+        PartyHistory objects, keyed by (party_id, period_id)
+        """
+        return {
+            (ph.party_id, ph.reporting_period_id): ph
+            for ph in PartyHistory.objects.all()
+        }
+
+    def get_party_history(self, party, period):
+        return self.party_histories.get((party.id, period.id))
+
+    @cached_property
+    def eu_members(self):
+        """
+        EU member states abbreviations, keyed by period_id and then by party_id.
+        Same criteria as Party.get_eu_members_at().
+        """
+        ret = {}
+        for period_id, party_id, abbr in PartyHistory.objects.filter(
+            is_eu_member=True, party__is_active=True
+        ).values_list('reporting_period_id', 'party_id', 'party__abbr'):
+            ret.setdefault(period_id, {})[party_id] = abbr
+        return ret
+
+    def get_eu_member_abbrs_at(self, period):
+        return list(self.eu_members.get(period.id, {}).values())
+
+    def is_eu_member_at(self, party, period):
+        return party.id in self.eu_members.get(period.id, {})
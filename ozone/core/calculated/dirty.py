@@ -0,0 +1,123 @@
+from ozone.core.models import CalculationDirtyKey
+
+
+# All reporting periods whose data is used by the baseline formulas
+BASELINE_PERIODS = (
+    '1986', '1989', '1991',
+    '1995', '1996', '1997', '1998', '1999', '2000',
+    '2009', '2010',
+    '2011', '2012', '2013',
+    '2020', '2021', '2022',
+    '2024', '2025', '2026',
+)
+
+# Baselines of some groups are calculated using data of other groups:
+# CI baselines use AI data and F baselines use CI baselines.
+DEPENDENT_GROUPS = {
+    'AI': ('CI', 'F'),
+    'CI': ('F',),
+}
+
+
+def get_dirty_marks(target, until=None):
+    """
+    Returns the CalculationDirtyKey objects for the given target, optionally
+    only up to (and including) the `until` id.
+    """
+    marks = CalculationDirtyKey.objects.filter(target=target.value)
+    if until is not None:
+        marks = marks.filter(pk__lte=until)
+    return list(marks)
+
+
+def clear_dirty_marks(target, until):
+    """
+    Called after the recalculated values have been saved. Changes made in
+    the meantime are kept, as marks are never reused (see
+    CalculationDirtyKey.mark) and new ones have a greater id.
+    """
+    CalculationDirtyKey.objects.filter(
+        target=target.value, pk__lte=until
+    ).delete()
+
+
+def get_dirty_baseline_keys(context, marks):
+    """
+    Returns the set of (party_id, group_id) for which baselines need to be
+    recalculated. A baseline is affected when data of one of its input periods
+    changes, when data of a group it depends on changes or, for the EU, when
+    data of one of its member states changes.
+    """
+    parties = list(context.parties.values())
+    groups = list(context.groups.values())
+    groups_by_id = {group.id: group for group in groups}
+    periods = {
+        period.id: period.name
+        for period in context.reporting_periods.values()
+    }
+    relevant_periods = BASELINE_PERIODS + (context.current_period.name,)
+    eu_party = context.parties.get('EU')
+    eu_member_ids = set()
+    for members in context.eu_members.values():
+        eu_member_ids.update(members)
+
+    keys = set()
+    for mark in marks:
+        if (
+            mark.reporting_period_id is not None
+            and periods.get(mark.reporting_period_id) not in relevant_periods
+        ):
+            continue
+
+        mark_parties = [
+            party for party in parties
+            if mark.party_id is None or party.id == mark.party_id
+        ]
+        if eu_party and (
+            mark.party_id is None or mark.party_id in eu_member_ids
+        ):
+            mark_parties.append(eu_party)
+
+        if mark.group_id is None:
+            mark_groups = groups
+        else:
+            group = groups_by_id[mark.group_id]
+            mark_groups = [group] + [
+                context.groups[group_id]
+                for group_id in DEPENDENT_GROUPS.get(group.group_id, ())
+                if group_id in context.groups
+            ]
+
+        keys.update(
+            (party.id, group.id)
+            for party in mark_parties
+            for group in mark_groups
+        )
+    return keys
+
+
+def get_dirty_limit_keys(context, marks):
+    """
+    Returns the set of (party_id, period_id, group_id) for which limits need to
+    be recalculated. Null fields of the marks match everything.
+    """
+    party_ids = [party.id for party in context.parties.values()]
+    period_ids = [period.id for period in context.reporting_periods.values()]
+    group_ids = [group.id for group in context.groups.values()]
+
+    keys = set()
+    for mark in marks:
+        keys.update(
+            (party_id, period_id, group_id)
+            for party_id in (
+                party_ids if mark.party_id is None else [mark.party_id]
+            )
+            for period_id in (
+                period_ids if mark.reporting_period_id is None
+                else [mark.reporting_period_id]
+            )
+            for group_id in (
+                group_ids if mark.group_id is None else [mark.group_id]
+            )
+        )
+    return keys
@@ -9,14 +9,15 @@ from django.template.response import TemplateResponse
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 
-from ozone.core.models import Baseline
+from ozone.core.calculated.context import CalculationContext
+from ozone.core.calculated import dirty
+from ozone.core.models import CalculationDirtyKey
 from ozone.core.models import ControlMeasure
 from ozone.core.models import Group
 from ozone.core.models import Limit
 from ozone.core.models import LimitTypes
 from ozone.core.models import Party
 from ozone.core.models import PartyType
-from ozone.core.models import PartyHistory
 from ozone.core.models import ProdCons
 from ozone.core.models import ReportingPeriod
 from ozone.core.models.utils import round_decimal_half_up
@@ -32,19 +33,12 @@ class CalculationError(Exception):
 
 class LimitCalculator:
 
-    def __init__(self):
-        self.groups = {
-            _group.group_id: _group
-            for _group in Group.objects.all()
-        }
-        self.reporting_periods = {
-            _period.name: _period
-            for _period in ReportingPeriod.objects.all()
-        }
-        self.parties = {
-            _party.abbr: _party
-            for _party in Party.get_main_parties()
-        }
+    def __init__(self, context=None):
+        # All data is read from the (possibly shared) calculation context
+        self.context = context if context is not None else CalculationContext()
+        self.groups = self.context.groups
+        self.reporting_periods = self.context.reporting_periods
+        self.parties = self.context.parties
         self.party_types = [_pt.name for _pt in PartyType.objects.all()]
 
         # The number of control measures is relatively low; so to avoid
@@ -64,9 +58,8 @@ class LimitCalculator:
             key = (cm.group.group_id, cm.party_type.name, cm.limit_type)
             self.control_measures[key].append(cm)
 
-    @lru_cache(maxsize=1)
     def _party_in_eu(self, party, period):
-        return party in Party.get_eu_members_at(period)
+        return self.context.is_eu_member_at(party, period)
 
     @lru_cache(maxsize=1)
     def _get_control_measure_objects(self, group, period):
@@ -133,15 +126,8 @@ class LimitCalculator:
                 self._get_decimals_for_limits(group, party)
             )
 
-    @lru_cache(maxsize=1)
     def _get_baselines_for_party(self, party):
-        ret = {}
-        for b in Baseline.objects.filter(party=party).select_related(
-            'group', 'baseline_type'
-        ):
-            key = (b.group.group_id, b.baseline_type.name)
-            ret[key] = b
-        return ret
+        return self.context.get_baselines_for_party(party)
 
     def _get_baseline(self, party, group, baseline_type):
         if group.group_id in ('CII', 'CIII'):
@@ -173,16 +159,24 @@ class LimitCalculator:
         return 1
 
 
-def expected_limits(parties, reporting_periods, groups):
-    calculator = LimitCalculator()
+def expected_limits(parties, reporting_periods, groups, context=None,
+                    keys=None):
+    """
+    If `keys` is given, only limits for the (party_id, period_id, group_id)
+    triples contained in it are calculated.
+    """
+    calculator = LimitCalculator(context)
+    sorted_periods = sorted(reporting_periods, key=lambda p: p.start_date)
 
     for party in parties:
-        qs = PartyHistory.objects.filter(
-            party=party,
-            reporting_period__in=reporting_periods
-        ).order_by('reporting_period__start_date')
+        party_histories = (
+            calculator.context.get_party_history(party, period)
+            for period in sorted_periods
+        )
 
-        for party_history in qs:
+        for party_history in party_histories:
+            if party_history is None:
+                continue
             party = party_history.party
             party_type = party_history.party_type
             is_eu_member = party_history.is_eu_member
@@ -196,6 +190,11 @@ def expected_limits(parties, reporting_periods, groups):
                 continue
 
             for group in groups:
+                if (
+                    keys is not None
+                    and (party.id, period.id, group.id) not in keys
+                ):
+                    continue
                 for limit_type in LimitTypes:
                     limit = calculator.get_limit(
                         limit_type.value,
@@ -217,7 +216,7 @@ def expected_limits(parties, reporting_periods, groups):
                     }
 
 
-def limits_diff(parties, reporting_periods, groups):
+def limits_diff(parties, reporting_periods, groups, context=None, keys=None):
     def record_key(record):
         return (
             record['party'].id,
@@ -240,6 +239,8 @@ def limits_diff(parties, reporting_periods, groups):
             list(parties),
             list(reporting_periods),
             list(groups),
+            context,
+            keys,
         )
     }
 
@@ -253,6 +254,12 @@ def limits_diff(parties, reporting_periods, groups):
         .filter(group__in=groups)
     )
     for row in existing_limits.iterator():
+        if (
+            keys is not None
+            and (row.party_id, row.reporting_period_id, row.group_id)
+            not in keys
+        ):
+            continue
         key = row_key(row)
         try:
             expected_record = expected.pop(key)
@@ -272,7 +279,7 @@ def limits_diff(parties, reporting_periods, groups):
 
 def admin_diff(request, context):
     parties = Party.get_main_parties()
-    if request.POST['party'] != '*':
+    if request.POST['party'] not in ('*', 'dirty'):
         parties = parties.filter(pk=request.POST['party'])
 
     reporting_periods = ReportingPeriod.objects.all()
@@ -283,7 +290,23 @@ def admin_diff(request, context):
     if request.POST['group'] != '*':
         groups = groups.filter(pk=request.POST['group'])
 
-    diff = limits_diff(parties, reporting_periods, groups)
+    calculation_context = CalculationContext()
+    keys = None
+    if request.POST['party'] == 'dirty':
+        # Only recalculate limits whose inputs have changed
+        marks = dirty.get_dirty_marks(CalculationDirtyKey.Targets.LIMITS)
+        keys = dirty.get_dirty_limit_keys(calculation_context, marks)
+        # The marks can only be cleared if the diff shows all the changes
+        # they caused, i.e. it is not filtered.
+        if marks and (
+            request.POST['group'] == '*'
+            and request.POST['reporting_period'] == '*'
+        ):
+            context['dirty_until'] = max(mark.pk for mark in marks)
+
+    diff = limits_diff(
+        parties, reporting_periods, groups, calculation_context, keys
+    )
 
     for record in diff['missing']:
         record['checkbox_value'] = json.dumps({
@@ -306,6 +329,7 @@ def admin_diff(request, context):
         })
 
     context['diff'] = diff
+    context['diff_size'] = sum(len(records) for records in diff.values())
 
 
 @transaction.atomic
@@ -351,6 +375,21 @@ def admin_apply(request, context):
             _("Removed %d limits") % removed,
         )
 
+    if request.POST.get('dirty_until'):
+        # Marks are kept if some of the proposed changes were left out, so
+        # the corresponding limits are recalculated next time.
+        if created + updated + removed == int(request.POST['diff_size']):
+            dirty.clear_dirty_marks(
+                CalculationDirtyKey.Targets.LIMITS,
+                int(request.POST['dirty_until'])
+            )
+        else:
+            messages.warning(
+                request,
+                _("Not all changes were applied; the changed data is still "
+                  "marked for recalculation"),
+            )
+
 
 def admin_view(request, context):
     if request.POST:
@@ -1,9 +1,17 @@
 from collections import defaultdict
 
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 from ozone.core.utils.spreadsheet import OzoneSpreadsheet, OzoneTable
-from ozone.core.models import ObligationTypes
+from ozone.core.models import (
+    Article7Destruction,
+    Article7Export,
+    Article7Import,
+    Article7NonPartyTrade,
+    Article7Production,
+    ObligationTypes,
+)
 
 
 tz_default = timezone.get_default_timezone()
@@ -26,7 +34,96 @@ class ExportError(RuntimeError):
     """ Error during export """
 
 
-def export_overall(queryset):
+class ExportData:
+    """
+    Data shared by all the export sheets. The submissions (along with their
+    questionnaires and infos) are loaded with a single query, and each type of
+    data rows with one more query for all submissions, when first needed.
+
+    Data rows are grouped by submission id and kept in the order expected in
+    the sheets.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    @cached_property
+    def submissions(self):
+        return list(
+            self.queryset.select_related(
+                'party', 'reporting_period', 'obligation',
+                'article7questionnaire', 'info__submission_format',
+            )
+        )
+
+    def load(self, queryset):
+        rows = defaultdict(list)
+        submission_ids = [submission.id for submission in self.submissions]
+        if not submission_ids:
+            return rows
+        for row in queryset.filter(submission_id__in=submission_ids):
+            rows[row.submission_id].append(row)
+        return rows
+
+    @cached_property
+    def imports(self):
+        return self.load(
+            Article7Import.objects
+            .filter(blend_item_id__isnull=True)
+            .select_related('substance', 'blend', 'source_party')
+            .order_by(
+                'substance__substance_id',
+                'blend__legacy_blend_id',
+                'source_party__abbr',
+            )
+        )
+
+    @cached_property
+    def exports(self):
+        return self.load(
+            Article7Export.objects
+            .filter(blend_item_id__isnull=True)
+            .select_related('substance', 'blend', 'destination_party')
+            .order_by(
+                'substance__substance_id',
+                'blend__legacy_blend_id',
+                'destination_party__abbr',
+            )
+        )
+
+    @cached_property
+    def productions(self):
+        return self.load(
+            Article7Production.objects
+            .select_related('substance')
+            .order_by('substance__substance_id')
+        )
+
+    @cached_property
+    def destructions(self):
+        return self.load(
+            Article7Destruction.objects
+            .filter(blend_item_id__isnull=True)
+            .select_related('substance', 'blend')
+            .order_by(
+                'substance__substance_id',
+                'blend__legacy_blend_id',
+            )
+        )
+
+    @cached_property
+    def nonpartytrades(self):
+        return self.load(
+            Article7NonPartyTrade.objects
+            .select_related('substance', 'trade_party')
+            .order_by(
+                'substance__substance_id',
+                'trade_party__abbr',
+            )
+        )
+
+
+def export_overall(data):
     header = [
         'CntryID', 'PeriodID', 'DataID',
 
@@ -47,7 +144,7 @@ def export_overall(queryset):
         ).strip()
 
     def rows():
-        for submission in queryset:
+        for submission in data.submissions:
 
             # Filter out non-art7 submissions
             if submission.obligation._obligation_type not in (
@@ -111,10 +208,10 @@ def export_overall(queryset):
                 'HFCDateReported': submission.date_reported_f,
             }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
-def export_imports_new(queryset):
+def export_imports_new(data):
     header = [
         'CntryID', 'PeriodID', 'SubstID', 'OrgCntryID', 'DataID',
 
@@ -135,17 +232,8 @@ def export_imports_new(queryset):
         return f"{row.remarks_os} {row.remarks_party}".strip()
 
     def rows():
-        for submission in queryset:
-            imports_queryset = (
-                submission.article7imports
-                .filter(blend_item_id__isnull=True)
-                .order_by(
-                    'substance__substance_id',
-                    'blend__legacy_blend_id',
-                    'source_party__abbr',
-                )
-            )
-            for row in imports_queryset.all():
+        for submission in data.submissions:
+            for row in data.imports[submission.id]:
                 yield {
                     'CntryID':    submission.party.abbr,
                     'PeriodID':   submission.reporting_period.name,
@@ -170,7 +258,7 @@ def export_imports_new(queryset):
                     'TS':           None,
                 }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
 def aggregate_import_sheet(import_new_sheet):
@@ -192,14 +280,15 @@ def aggregate_import_sheet(import_new_sheet):
         'TS': None,
     }
 
-    aggregations = defaultdict(lambda: {k: 0 for k in aggregation_cols})
+    def rows():
+        # Aggregated when the sheet is written, as the source rows are lazy
+        aggregations = defaultdict(lambda: {k: 0 for k in aggregation_cols})
 
-    for row in import_new_sheet.rows:
-        pk = tuple((k, row[k]) for k in pk_cols)
-        for col in aggregation_cols:
-            aggregations[pk][col] += (row[col] or 0)
+        for row in import_new_sheet.rows:
+            pk = tuple((k, row[k]) for k in pk_cols)
+            for col in aggregation_cols:
+                aggregations[pk][col] += (row[col] or 0)
 
-    def rows():
         for pk in sorted(aggregations):
             row = aggregations[pk]
             row.update(dict(pk))
@@ -207,10 +296,10 @@ def aggregate_import_sheet(import_new_sheet):
                 row[col] = value
             yield row
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
-def export_exports(queryset):
+def export_exports(data):
     header = [
         'CntryID', 'PeriodID', 'SubstID', 'DestCntryID', 'DataID',
 
@@ -230,17 +319,8 @@ def export_exports(queryset):
         return f"{row.remarks_os} {row.remarks_party}".strip()
 
     def rows():
-        for submission in queryset:
-            exports_queryset = (
-                submission.article7exports
-                .filter(blend_item_id__isnull=True)
-                .order_by(
-                    'substance__substance_id',
-                    'blend__legacy_blend_id',
-                    'destination_party__abbr',
-                )
-            )
-            for row in exports_queryset.all():
+        for submission in data.submissions:
+            for row in data.exports[submission.id]:
                 yield {
                     'CntryID':     submission.party.abbr,
                     'PeriodID':    submission.reporting_period.name,
@@ -264,10 +344,10 @@ def export_exports(queryset):
                     'TS':           None,
                 }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
-def export_produce(queryset):
+def export_produce(data):
     header = [
         'CntryID', 'PeriodID', 'SubstID', 'DataID',
 
@@ -289,11 +369,8 @@ def export_produce(queryset):
         return f"{row.remarks_os} {row.remarks_party}".strip()
 
     def rows():
-        for submission in queryset:
-            productions_queryset = submission.article7productions.order_by(
-                'substance__substance_id',
-            )
-            for row in productions_queryset.all():
+        for submission in data.submissions:
+            for row in data.productions[submission.id]:
                 yield {
                     'CntryID':     submission.party.abbr,
                     'PeriodID':    submission.reporting_period.name,
@@ -317,10 +394,10 @@ def export_produce(queryset):
                     'CaptureDest':  None
                 }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
-def export_destroy(queryset):
+def export_destroy(data):
     header = [
         'CntryID', 'PeriodID', 'SubstID', 'DataID',
 
@@ -333,16 +410,8 @@ def export_destroy(queryset):
         return f"{row.remarks_os} {row.remarks_party}".strip()
 
     def rows():
-        for submission in queryset:
-            destructions_queryset = (
-                submission.article7destructions
-                .filter(blend_item_id__isnull=True)
-                .order_by(
-                    'substance__substance_id',
-                    'blend__legacy_blend_id',
-                )
-            )
-            for row in destructions_queryset.all():
+        for submission in data.submissions:
+            for row in data.destructions[submission.id]:
                 yield {
                     'CntryID':     submission.party.abbr,
                     'PeriodID':    submission.reporting_period.name,
@@ -359,10 +428,10 @@ def export_destroy(queryset):
                     'TS':           None,
                 }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
-def export_nonparty_new(queryset):
+def export_nonparty_new(data):
     header = [
         'CntryID', 'PeriodID', 'SubstID', 'DataID', 'SrcDestCntryID',
 
@@ -375,12 +444,8 @@ def export_nonparty_new(queryset):
         return f"{row.remarks_os} {row.remarks_party}".strip()
 
     def rows():
-        for submission in queryset:
-            nonparty_queryset = submission.article7nonpartytrades.order_by(
-                'substance__substance_id',
-                'trade_party__abbr',
-            )
-            for row in nonparty_queryset.all():
+        for submission in data.submissions:
+            for row in data.nonpartytrades[submission.id]:
                 yield {
                     'CntryID':        submission.party.abbr,
                     'PeriodID':       submission.reporting_period.name,
@@ -401,7 +466,7 @@ def export_nonparty_new(queryset):
                     'TS':           None,
                 }
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
 def aggregate_nonparty_sheet(import_new_sheet):
@@ -428,15 +493,16 @@ def aggregate_nonparty_sheet(import_new_sheet):
         'TS': None,
     }
 
-    aggregations = defaultdict(lambda: {k: 0 for k in aggregation_cols})
+    def rows():
+        # Aggregated when the sheet is written, as the source rows are lazy
+        aggregations = defaultdict(lambda: {k: 0 for k in aggregation_cols})
 
-    for row in import_new_sheet.rows:
-        pk = tuple((k, row[k]) for k in pk_cols)
-        for col, src_cols in aggregation_cols.items():
-            for src in src_cols:
-                aggregations[pk][col] += (row[src] or 0)
+        for row in import_new_sheet.rows:
+            pk = tuple((k, row[k]) for k in pk_cols)
+            for col, src_cols in aggregation_cols.items():
+                for src in src_cols:
+                    aggregations[pk][col] += (row[src] or 0)
 
-    def rows():
         for pk in sorted(aggregations):
             row = aggregations[pk]
             row.update(dict(pk))
@@ -444,20 +510,22 @@ def aggregate_nonparty_sheet(import_new_sheet):
                 row[col] = value
             yield row
 
-    return OzoneTable(header, rows())
+    return OzoneTable(header, rows)
 
 
 def export_submissions(queryset):
-    queryset = queryset.order_by('party__abbr', 'reporting_period__name')
-    import_new_sheet = export_imports_new(queryset)
-    nonparty_new_sheet = export_nonparty_new(queryset)
+    data = ExportData(
+        queryset.order_by('party__abbr', 'reporting_period__name')
+    )
+    import_new_sheet = export_imports_new(data)
+    nonparty_new_sheet = export_nonparty_new(data)
     out = OzoneSpreadsheet()
-    out.tables['Overall'] = export_overall(queryset)
+    out.tables['Overall'] = export_overall(data)
     out.tables['Import'] = aggregate_import_sheet(import_new_sheet)
     out.tables['ImportNew'] = import_new_sheet
-    out.tables['Export'] = export_exports(queryset)
-    out.tables['Produce'] = export_produce(queryset)
-    out.tables['Destroy'] = export_destroy(queryset)
+    out.tables['Export'] = export_exports(data)
+    out.tables['Produce'] = export_produce(data)
+    out.tables['Destroy'] = export_destroy(data)
     out.tables['NonPartyTrade'] = aggregate_nonparty_sheet(nonparty_new_sheet)
     out.tables['NonPartyTradeNew'] = nonparty_new_sheet
     return out
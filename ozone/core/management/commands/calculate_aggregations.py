@@ -1,22 +1,85 @@
+import json
 import logging
+import multiprocessing
+import os
+from collections import defaultdict
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
 
 from ozone.core.models import (
+    CalculationDirtyKey,
     Submission,
     ProdCons,
     Party,
     ReportingPeriod,
     ObligationTypes,
 )
+from ozone.core.utils.cache import bump_data_generation, invalidation_queue
 
 logger = logging.getLogger(__name__)
 
 
+def rebuild_partition(partition):
+    """
+    Deletes and re-creates all aggregations for one party/period, in its own
+    transaction, so the other partitions (and the already-rebuilt ones) stay
+    readable while the rebuild is running.
+
+    Kept at module level so it can be used by a multiprocessing pool.
+    """
+    (party_id, period_id), submission_ids = partition
+    with transaction.atomic():
+        ProdCons.objects.filter(
+            party_id=party_id, reporting_period_id=period_id
+        ).delete()
+        # Queryset deletes bypass ProdCons.delete(), mark all groups instead.
+        CalculationDirtyKey.mark_aggregation(
+            Party.objects.get(pk=party_id), None,
+            ReportingPeriod.objects.get(pk=period_id)
+        )
+        bump_data_generation(party_id)
+        for s in Submission.objects.filter(id__in=submission_ids):
+            logger.info(f"Aggregating data for submission {s.id}")
+            created_aggregations = s.fill_aggregated_data()
+            for a in ProdCons.objects.filter(id__in=created_aggregations):
+                logger.debug(
+                    f"Created aggregation for group {a.group} with "
+                    f"calculated production: {a.calculated_production}, "
+                    f"calculated consumption: {a.calculated_consumption}."
+                )
+    return party_id, period_id
+
+
+def rebuild_partition_in_worker(partition):
+    """
+    Same as rebuild_partition(), for pool workers. These are terminated
+    without running atexit handlers, so the queued cache invalidations are
+    sent before returning.
+    """
+    try:
+        return rebuild_partition(partition)
+    finally:
+        invalidation_queue.flush(force=True)
+
+
+def close_connections():
+    """
+    Used as pool initializer; forked workers must not share the parent's
+    database connections, so they are closed and lazily reopened.
+    """
+    connections.close_all()
+
+
 class Command(BaseCommand):
     """
     Calculates and saves (overwriting if needed) aggregations for all Article 7
     submissions.
+
+    Aggregations are rebuilt separately for each party/reporting period, each
+    in its own transaction. With --workers the partitions are processed in
+    parallel and with --checkpoint already-rebuilt partitions are recorded, so
+    an interrupted run can be resumed.
     """
 
     help = __doc__
@@ -38,6 +101,20 @@ class Command(BaseCommand):
             default=False,
             help="Use to re-populate all data, otherwise just dry-run"
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Number of worker processes used for rebuilding the "
+                 "party/period partitions."
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help="File in which rebuilt party/period partitions are recorded. "
+                 "If it already exists, these partitions are skipped, "
+                 "resuming a previously interrupted run (with the same "
+                 "--party and --period)."
+        )
 
     def handle(self, *args, **options):
         stream = logging.StreamHandler()
@@ -83,10 +160,18 @@ class Command(BaseCommand):
                 f"and create from scratch around "
                 f"{9 * submission_queryset.count()} aggregations."
             )
-        else:
-            prodcons_queryset.delete()
+
+        # Partitions are keyed by (party_id, reporting_period_id). Partitions
+        # without any valid submission still need their aggregations deleted.
+        partitions = defaultdict(list)
+        for key in prodcons_queryset.values_list(
+            'party_id', 'reporting_period_id'
+        ).distinct():
+            partitions[key] = []
 
         for s in submission_queryset:
+            # Make sure the partition exists even if the submission is skipped
+            partitions[(s.party_id, s.reporting_period_id)]
             if s.flag_valid is False:
                 logger.info(
                     f"Submission {s} has flag_valid set to False and will "
@@ -100,16 +185,70 @@ class Command(BaseCommand):
                 )
                 continue
 
-            if options['confirm']:
-                logger.info(f"Aggregating data for submission {s.id}")
-            else:
-                logger.debug(f"Found submission {s.id}")
-
-            if options['confirm']:
-                created_aggregations = s.fill_aggregated_data()
-                for a in ProdCons.objects.filter(id__in=created_aggregations):
-                    logger.debug(
-                        f"Created aggregation for group {a.group} with "
-                        f"calculated production: {a.calculated_production}, "
-                        f"calculated consumption: {a.calculated_consumption}."
-                    )
+            logger.debug(f"Found submission {s.id}")
+            partitions[(s.party_id, s.reporting_period_id)].append(s.id)
+
+        if not options['confirm']:
+            return
+
+        scope = {'party': options['party'], 'period': options['period']}
+        done = self.load_checkpoint(options['checkpoint'], scope)
+        if done:
+            logger.info(
+                f"Skipping {len(done)} partitions already rebuilt according to "
+                f"{options['checkpoint']}."
+            )
+        pending = [
+            (key, submission_ids)
+            for key, submission_ids in sorted(partitions.items())
+            if key not in done
+        ]
+
+        if options['workers'] > 1:
+            # Forked processes must not reuse the parent's DB connections
+            connections.close_all()
+            with multiprocessing.Pool(
+                options['workers'], initializer=close_connections
+            ) as pool:
+                for key in pool.imap_unordered(
+                    rebuild_partition_in_worker, pending
+                ):
+                    self.save_checkpoint(options['checkpoint'], scope, key)
+        else:
+            for partition in pending:
+                key = rebuild_partition(partition)
+                self.save_checkpoint(options['checkpoint'], scope, key)
+
+        logger.info(f"Rebuilt aggregations for {len(pending)} partitions.")
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            # Everything was processed, next runs should start from scratch.
+            os.remove(options['checkpoint'])
+
+    @staticmethod
+    def load_checkpoint(checkpoint, scope):
+        """
+        Returns the partitions recorded in the checkpoint. Its first line
+        holds the --party/--period options of the run that wrote it, as
+        checkpoints of runs with other options cover other partitions.
+        """
+        if not checkpoint or not os.path.exists(checkpoint):
+            return set()
+        with open(checkpoint) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines:
+            return set()
+        if lines[0] != scope:
+            raise CommandError(
+                f"Checkpoint {checkpoint} was not written with the same "
+                f"options ({lines[0]}), remove it to start from scratch."
+            )
+        return set(tuple(key) for key in lines[1:])
+
+    @staticmethod
+    def save_checkpoint(checkpoint, scope, key):
+        if not checkpoint:
+            return
+        with open(checkpoint, 'a') as f:
+            if f.tell() == 0:
+                f.write(json.dumps(scope, sort_keys=True) + '\n')
+            f.write(json.dumps(list(key)) + '\n')
@@ -1,16 +1,14 @@
 """Import Submission from Excel file.
 """
-import pickle
 import decimal
 import logging
 import collections
+import multiprocessing
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connections, transaction
 from django.utils.timezone import make_aware
 
-from openpyxl import load_workbook
-
 from ozone.core.models import (
     User,
     Party,
@@ -27,12 +25,39 @@ from ozone.core.models import (
     SubmissionFormat,
     Blend,
 )
+from ozone.core.models.data import BlendCompositionMixin
 from ozone.core.models.utils import float_to_decimal
 from ozone.core.models.utils import sum_decimals
 from ozone.core.models.utils import METHYL_BROMIDE
+from ozone.core.utils.cache import invalidation_queue
+from ozone.core.utils.spreadsheet import GroupedWorkbook
 
 logger = logging.getLogger(__name__)
-CACHE_LOC = "/var/tmp/legacy_submission.cache"
+CACHE_DIR = "/var/tmp/legacy_submission_cache"
+
+# Command used by the bulk-load worker processes (inherited when forking).
+_worker_command = None
+
+
+def bulk_import_partition(partition):
+    """Imports the submissions of one party in a worker process.
+
+    Kept at module level so it can be used by a multiprocessing pool. Pool
+    workers are terminated without running atexit handlers, so the queued
+    cache invalidations are sent before returning.
+    """
+    options, entries = partition
+    try:
+        return _worker_command.bulk_import(entries, **options)
+    finally:
+        invalidation_queue.flush(force=True)
+
+
+def close_connections():
+    """Used as pool initializer; forked workers must not share the parent's
+    database connections, so they are closed and lazily reopened.
+    """
+    connections.close_all()
 
 
 class Command(BaseCommand):
@@ -103,11 +128,21 @@ class Command(BaseCommand):
                             help="Number of digits after after the period to "
                                  "check for consistency.")
         parser.add_argument('-C', '--use-cache', action="store_true", default=False,
-                            help="Load the data from the cache (if available) instead "
-                                 "of the xls")
+                            help="Load the data from the cache of this file (if "
+                                 "available) instead of parsing the xlsx again")
         parser.add_argument("--dry-run", action="store_true", default=False,
                             help="Only parse the data, but do not insert it.")
         parser.add_argument("-S", "--single", help="Only process this single entry.")
+        parser.add_argument("--bulk", action="store_true", default=False,
+                            help="Insert the data rows of many submissions at once, "
+                                 "without any model validation, and fill the "
+                                 "aggregations after everything is inserted.")
+        parser.add_argument("--chunk-size", type=int, default=100,
+                            help="Number of submissions inserted at once (and in "
+                                 "one transaction) by --bulk.")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Number of worker processes used by --bulk, "
+                                 "the submissions are partitioned by party.")
 
     def process_entry(self, party, period, values, recreate=False, purge=False):
         """Process the parsed data and insert it into the DB.
@@ -779,26 +814,14 @@ class Command(BaseCommand):
     @transaction.atomic
     def _process_entry(self, party, period, values, recreate=False, purge=False):
         """Inserts the processed data into the DB."""
-        is_processed = (party.abbr, period.name) in self.current_submission
         if purge:
             self.delete_instance(party, period)
             return True
 
-        if is_processed:
-            if recreate:
-                self.delete_instance(party, period)
-            else:
-                logger.info("Submission %s/%s already imported, skipping.",
-                            party.abbr, period.name)
-                return False
-
-        submission = Submission.objects.create(
-            **values["submission"]
-        )
+        if not self.check_existing(party, period, recreate):
+            return False
 
-        for key, value in values["submission_info"].items():
-            setattr(submission.info, key, value)
-        submission.info.save()
+        submission = self.create_submission(values)
 
         # Use bulk create to bypass any model level validation.
         # This will mean that some entries will be in impossible states but
@@ -823,29 +846,12 @@ class Command(BaseCommand):
                     submission=submission, **table_values
                 )
 
-        # Extra tidy
-        submission._current_state = "finalized"
-        submission.save()
+        self.finalize_submission(submission, values)
 
         # Fill aggregated data on submission import
         submission.fill_aggregated_data()
 
-        # Setting updated_at and created_at like this avoids creating a new
-        # history item.
-        if values["submission"]["created_at"]:
-            Submission.objects.filter(pk=submission.pk).update(
-                created_at=values["submission"]["created_at"]
-            )
-        if values["submission"]["updated_at"]:
-            Submission.objects.filter(pk=submission.pk).update(
-                updated_at=values["submission"]["updated_at"]
-            )
-        for obj in submission.history.all():
-            obj.history_user = self.admin
-            obj.created_at = values["submission"]["created_at"]
-            obj.updated_at = values["submission"]["updated_at"]
-            obj.history_date = values["submission"]["created_at"]
-            obj.save()
+        self.restore_dates(submission, values)
 
         log_data = ", ".join("%s=%s" % (_data_type, len(values[_data_type]))
                              for _data_type in self.data_to_check)
@@ -853,6 +859,133 @@ class Command(BaseCommand):
                     party.abbr, period.name, log_data)
         return True
 
+    def check_existing(self, party, period, recreate=False):
+        """Returns True if the submission identified by the party/period
+        combination needs to be imported, deleting the existing one if
+        `recreate` is set.
+        """
+        if (party.abbr, period.name) not in self.current_submission:
+            return True
+
+        if recreate:
+            self.delete_instance(party, period)
+            return True
+
+        logger.info("Submission %s/%s already imported, skipping.",
+                    party.abbr, period.name)
+        return False
+
+    def create_submission(self, values):
+        submission = Submission.objects.create(
+            **values["submission"]
+        )
+
+        for key, value in values["submission_info"].items():
+            setattr(submission.info, key, value)
+        submission.info.save()
+        return submission
+
+    def finalize_submission(self, submission, values):
+        # Extra tidy
+        submission._current_state = "finalized"
+        submission.save()
+
+    def restore_dates(self, submission, values):
+        # Setting updated_at and created_at like this avoids creating a new
+        # history item.
+        dates = {
+            field: values["submission"][field]
+            for field in ("created_at", "updated_at")
+            if values["submission"][field]
+        }
+        if dates:
+            Submission.objects.filter(pk=submission.pk).update(**dates)
+        submission.history.update(
+            history_user=self.admin,
+            created_at=values["submission"]["created_at"],
+            updated_at=values["submission"]["updated_at"],
+            history_date=values["submission"]["created_at"],
+        )
+
+    def bulk_import(self, entries, recreate=False, chunk_size=100):
+        """Inserts the processed data of many submissions into the DB.
+
+        Data rows (including the rows of blend components) are built in
+        memory and inserted with one bulk insert per table for each chunk of
+        submissions, each chunk in its own transaction. Aggregations are only
+        filled after all chunks are inserted.
+
+        Returns the number of imported submissions.
+        """
+        submission_ids = []
+        for start in range(0, len(entries), chunk_size):
+            try:
+                submission_ids.extend(self._bulk_import_chunk(
+                    entries[start:start + chunk_size], recreate=recreate
+                ))
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logger.error("Error %s while saving chunk: %s", e, ", ".join(
+                    "%s/%s" % (party.abbr, period.name)
+                    for party, period, values in entries[start:start + chunk_size]
+                ), exc_info=True)
+
+        for submission in Submission.objects.filter(
+            id__in=submission_ids
+        ).select_related("party", "reporting_period", "obligation"):
+            submission.fill_aggregated_data()
+        return len(submission_ids)
+
+    @transaction.atomic
+    def _bulk_import_chunk(self, entries, recreate=False):
+        """Inserts the processed data of a chunk of submissions into the DB.
+
+        Returns the ids of the created submissions.
+        """
+        submission_ids = []
+        rows = collections.OrderedDict()
+        for party, period, values in entries:
+            if not self.check_existing(party, period, recreate):
+                continue
+
+            submission = self.create_submission(values)
+            self.finalize_submission(submission, values)
+            self.restore_dates(submission, values)
+            submission_ids.append(submission.id)
+
+            for key, klass in (
+                ("art7", Article7Questionnaire),
+                ("imports", Article7Import),
+                ("exports", Article7Export),
+                ("produced", Article7Production),
+                ("destroyed", Article7Destruction),
+                ("nonparty", Article7NonPartyTrade),
+            ):
+                table_values = values[key]
+                instances = rows.setdefault(klass, [])
+                if isinstance(table_values, list):
+                    for _i, _instance in enumerate(table_values):
+                        instances.append(klass(
+                            submission=submission, ordering_id=_i, **_instance
+                        ))
+                else:
+                    instances.append(klass(
+                        submission=submission, **table_values
+                    ))
+
+            log_data = ", ".join("%s=%s" % (_data_type, len(values[_data_type]))
+                                 for _data_type in self.data_to_check)
+            logger.info("Submission %s/%s imported with %s",
+                        party.abbr, period.name, log_data)
+
+        for klass, instances in rows.items():
+            if issubclass(klass, BlendCompositionMixin):
+                klass.bulk_create_with_components(instances)
+            else:
+                klass.objects.bulk_create(instances)
+        return submission_ids
+
     def delete_instance(self, party, period):
         """Removes the submission identified by the party and period
         and any related data.
@@ -876,11 +1009,13 @@ class Command(BaseCommand):
         """Loads the Excel file, collating the data based on the
         CntryID and PeriodID.
 
-        If cache is set to True, then the data is loaded from a previously
-        loaded version of the file. Reduces time required while doing a lot
-        of tests.
+        The file is parsed into an on-disk cache, keyed by the hash of the
+        file. If cache is set to True, then a previously parsed version of
+        the same file is used. Reduces time required while doing a lot of
+        tests.
 
-        Returns a list in the following format:
+        Returns a GroupedWorkbook, mapping each CntryID/PeriodID to the rows
+        in all the sheets:
         {
             ("RO", 2019): {
                 "Overall": [{<overall-data>}],
@@ -889,35 +1024,14 @@ class Command(BaseCommand):
             }
             ...
         }
+        Groups are read from disk one by one, when accessed.
         """
-        if use_cache:
-            try:
-                with open(CACHE_LOC, "rb") as cachef:
-                    return pickle.load(cachef)
-            except:
-                pass
-
-        def get_new():
-            return collections.defaultdict(list)
-
-        results = collections.defaultdict(get_new)
-
-        wb = load_workbook(filename=filename)
-        for sheet in wb:
-            values = list(sheet.values)
-            headers = values[0]
-
-            for row in values[1:]:
-                row = dict(zip(headers, row))
-                if not row["CntryID"]:
-                    continue
-                pk = row["CntryID"].upper(), row["PeriodID"].upper()
-                results[pk][sheet.title].append(row)
+        def get_key(row):
+            if not row["CntryID"]:
+                return None
+            return row["CntryID"].upper(), row["PeriodID"].upper()
 
-        results = list(results.items())
-        with open(CACHE_LOC, "wb") as cachef:
-            pickle.dump(results, cachef)
-        return results
+        return GroupedWorkbook(filename, get_key, CACHE_DIR, use_cache=use_cache)
 
     def handle(self, *args, **options):
         stream = logging.StreamHandler()
@@ -941,15 +1055,19 @@ class Command(BaseCommand):
             logger.critical("Unable to find an admin: %s", e)
             return
 
-        all_values = self.load_workbook(options["file"], use_cache=options["use_cache"])
+        workbook = self.load_workbook(options["file"], use_cache=options["use_cache"])
+        all_keys = workbook.keys()
         if options['limit']:
-            all_values = all_values[:options['limit']]
+            all_keys = all_keys[:options['limit']]
 
         success_count = 0
-        for pk, values_dict in all_values:
+        bulk_entries = collections.defaultdict(list)
+        for pk in all_keys:
             if single and single != "%s/%s" % pk:
                 continue
 
+            values_dict = workbook[pk]
+
             logger.debug("Importing row %s", values_dict)
 
             try:
@@ -961,10 +1079,46 @@ class Command(BaseCommand):
 
             data = dict(self.get_data(values_dict, party, period))
             self.check_consistency(data, party, period)
-            if not options["dry_run"]:
-                success_count += self.process_entry(party,
-                                                    period,
-                                                    data,
-                                                    options["recreate"],
-                                                    options["purge"])
-        logger.info("Success on %s out of %s", success_count, len(all_values))
+            if options["dry_run"]:
+                continue
+            if options["bulk"] and not options["purge"]:
+                bulk_entries[party.id].append((party, period, data))
+                continue
+            success_count += self.process_entry(party,
+                                                period,
+                                                data,
+                                                options["recreate"],
+                                                options["purge"])
+
+        if bulk_entries:
+            success_count += self.run_bulk_import(
+                list(bulk_entries.values()),
+                options["workers"],
+                recreate=options["recreate"],
+                chunk_size=options["chunk_size"],
+            )
+        logger.info("Success on %s out of %s", success_count, len(all_keys))
+
+    def run_bulk_import(self, partitions, workers, **options):
+        """Runs bulk_import for each partition (the entries of one party),
+        using `workers` processes if more than one.
+
+        Returns the number of imported submissions.
+        """
+        if workers <= 1:
+            return self.bulk_import(
+                [entry for entries in partitions for entry in entries],
+                **options
+            )
+
+        global _worker_command
+        _worker_command = self
+        # Forked processes must not reuse the parent's DB connections
+        connections.close_all()
+        with multiprocessing.Pool(
+            workers, initializer=close_connections
+        ) as pool:
+            return sum(pool.imap_unordered(
+                bulk_import_partition,
+                [(options, entries) for entries in partitions],
+            ))
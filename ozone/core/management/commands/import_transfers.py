@@ -89,6 +89,15 @@ class Command(BaseCommand):
                 row = dict(zip(headers, row))
                 workbook_processor(row, options["purge"])
 
+        if not options["purge"] and self.transfers_map:
+            # Aggregations are filled once all transfers have their letters
+            # set, instead of once for each saved transfer.
+            Transfer.bulk_populate_aggregated_data(self.transfers_map.values())
+            logger.info(
+                f"Aggregated data filled for {len(self.transfers_map)} "
+                f"transfers"
+            )
+
     def process_letter_data(self, letter, purge=False):
         try:
             return self._process_letter_data(letter, purge)
@@ -204,11 +213,9 @@ class Command(BaseCommand):
             return
 
         if not self.transfers_map.get(transfer_id):
-            t = Transfer.objects.create(
-                **entry
-            )
-            # Fill aggregated data based on this transfer
-            t.populate_aggregated_data()
+            # Aggregated data is filled at the end, for all transfers at once
+            t = Transfer(**entry)
+            t.save(force_insert=True, populate_aggregations=False)
 
             self.transfers_map[transfer_id] = t
 
@@ -268,7 +275,7 @@ class Command(BaseCommand):
                 f"{entry['ProdTransferID']}."
             )
 
-        transfer.save()
+        transfer.save(populate_aggregations=False)
 
     def get_submission_data(self, letter):
         letter_date = letter["LetterDate"] if letter else None
@@ -1,14 +1,20 @@
 import logging
+from collections import defaultdict
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 
 from ozone.core.models import (
-    Submission,
+    Baseline,
+    CalculationDirtyKey,
+    Limit,
     ProdCons,
     Party,
     ReportingPeriod,
     ObligationTypes,
 )
+from ozone.core.utils.cache import bump_data_generation
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +23,16 @@ class Command(BaseCommand):
     """
     Calculates and saves (overwriting if needed) the baselines and limits in
     already-existing aggregations for all Article 7 submissions.
+
+    Limits and baselines are loaded upfront and only the aggregations whose
+    values actually change are written.
     """
 
+    FIELDS = (
+        'baseline_prod', 'baseline_cons', 'baseline_bdn',
+        'limit_prod', 'limit_cons', 'limit_bdn',
+    )
+
     help = __doc__
 
     def add_arguments(self, parser):
@@ -68,20 +82,74 @@ class Command(BaseCommand):
                 f"{prodcons_queryset.count()} aggregations."
             )
 
-        for a in prodcons_queryset:
-            if options['confirm']:
-                logger.info(f"Updating data for aggregation {a}")
-            else:
-                logger.debug(f"Found aggregation {a.id}")
-
-            if options['confirm']:
-                a.update_limits_and_baselines()
-                logger.debug(
-                    f"Updated aggregation {a} with:\n"
-                    f"baseline production: {a.baseline_prod},\n"
-                    f"baseline consumption: {a.baseline_cons},\n"
-                    f"baseline bdn: {a.baseline_bdn},\n"
-                    f"limit production: {a.limit_prod},\n"
-                    f"limit consumption: {a.limit_cons},\n"
-                    f"limit bdn: {a.limit_bdn}\n"
+        limits = defaultdict(list)
+        for limit in Limit.objects.all():
+            limits[
+                (limit.party_id, limit.reporting_period_id, limit.group_id)
+            ].append(limit)
+        baselines = defaultdict(list)
+        for baseline in Baseline.objects.values(
+            'party_id', 'group_id', 'baseline_type__name', 'baseline'
+        ):
+            baselines[
+                (baseline['party_id'], baseline['group_id'])
+            ].append(baseline)
+
+        updated = 0
+        updated_parties = set()
+        updated_periods = set()
+        prodcons_queryset = prodcons_queryset.select_related(
+            'party', 'reporting_period', 'group'
+        )
+        with transaction.atomic():
+            for a in prodcons_queryset:
+                if options['confirm']:
+                    logger.info(f"Updating data for aggregation {a}")
+                else:
+                    logger.debug(f"Found aggregation {a.id}")
+
+                old_values = [getattr(a, field) for field in self.FIELDS]
+                a.populate_limits_and_baselines(
+                    limits=limits[
+                        (a.party_id, a.reporting_period_id, a.group_id)
+                    ],
+                    baselines=baselines[(a.party_id, a.group_id)],
                 )
+                new_values = [getattr(a, field) for field in self.FIELDS]
+                if new_values == old_values:
+                    continue
+
+                updated += 1
+                if options['confirm']:
+                    # Saving through the queryset does not mark the
+                    # aggregation as changed for the baselines calculation.
+                    # It also skips auto_now, used by the reports cache.
+                    ProdCons.objects.filter(pk=a.pk).update(
+                        updated_at=timezone.now(),
+                        **dict(zip(self.FIELDS, new_values))
+                    )
+                    updated_parties.add(a.party_id)
+                    updated_periods.add(a.reporting_period)
+                    logger.debug(
+                        f"Updated aggregation {a} with:\n"
+                        f"baseline production: {a.baseline_prod},\n"
+                        f"baseline consumption: {a.baseline_cons},\n"
+                        f"baseline bdn: {a.baseline_bdn},\n"
+                        f"limit production: {a.limit_prod},\n"
+                        f"limit consumption: {a.limit_cons},\n"
+                        f"limit bdn: {a.limit_bdn}\n"
+                    )
+
+            for party_id in updated_parties:
+                bump_data_generation(party_id)
+            # Baselines are also included in the aggregation summaries
+            for period in updated_periods:
+                CalculationDirtyKey.mark(
+                    CalculationDirtyKey.Targets.SUMMARIES,
+                    reporting_period=period
+                )
+
+        if options['confirm']:
+            logger.info(f"Updated {updated} aggregations.")
+        else:
+            logger.info(f"{updated} aggregations would be updated.")
@@ -10,5 +10,5 @@ class Command(BaseCommand):
         parser.add_argument('csvdir', type=Path, help="Output csvdir")
 
     def handle(self, *args, **options):
-        s = OzoneSpreadsheet.from_xlsx(options['xlsx'])
+        s = OzoneSpreadsheet.from_xlsx(options['xlsx'], lazy=True)
         s.dump_csvdir(options['csvdir'])
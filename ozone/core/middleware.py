@@ -5,6 +5,8 @@ from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from sentry_sdk import capture_exception, configure_scope
 
+from .authentication import get_token
+
 
 User = get_user_model()
 
@@ -53,12 +55,10 @@ class TokenAdminAuthMiddleware(object):
     def __call__(self, request):
         # See django.contrib.auth.middleware.AuthenticationMiddleware
         if not hasattr(request, '_cached_user'):
-            try:
-                token = Token.objects.select_related('user').get(key=request.COOKIES['authToken'])
-                if token.user.is_active:
-                    request._cached_user = token.user
-            except (Token.DoesNotExist, KeyError):
-                pass
+            key = request.COOKIES.get('authToken')
+            token = get_token(key, request) if key else None
+            if token is not None and token.user.is_active:
+                request._cached_user = token.user
         response = self.get_response(request)
         return response
 
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_rafreportusecategory_remarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalculationDirtyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('baselines', 'BASELINES'), ('limits', 'LIMITS')], help_text='Calculation whose inputs have changed', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.Group')),
+                ('party', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.Party')),
+                ('reporting_period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.ReportingPeriod')),
+            ],
+            options={
+                'db_table': 'calculation_dirty_key',
+            },
+        ),
+    ]
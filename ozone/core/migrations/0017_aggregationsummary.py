@@ -0,0 +1,43 @@
+# Generated by Django 2.1.4 on 2026-10-18 11:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_calculationdirtykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calculationdirtykey',
+            name='target',
+            field=models.CharField(choices=[('baselines', 'BASELINES'), ('limits', 'LIMITS'), ('summaries', 'SUMMARIES')], help_text='Calculation whose inputs have changed', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='AggregationSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_article5', models.NullBooleanField()),
+                ('is_reporting', models.BooleanField()),
+                ('calculated_production', models.DecimalField(blank=True, decimal_places=15, max_digits=25, null=True)),
+                ('calculated_consumption', models.DecimalField(blank=True, decimal_places=15, max_digits=25, null=True)),
+                ('baseline_prod', models.DecimalField(blank=True, decimal_places=15, max_digits=25, null=True)),
+                ('baseline_cons', models.DecimalField(blank=True, decimal_places=15, max_digits=25, null=True)),
+                ('population', models.BigIntegerField(blank=True, null=True)),
+                ('party_count', models.IntegerField(default=0)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.Group')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.Region')),
+                ('reporting_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.ReportingPeriod')),
+            ],
+            options={
+                'db_table': 'aggregation_summary',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='aggregationsummary',
+            index_together={('reporting_period', 'region', 'is_article5')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.4 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_aggregationsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseline',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.4 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_baseline_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='limit',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='partyhistory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -3,19 +3,22 @@ from decimal import Decimal
 
 from django.contrib.postgres import fields
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.functional import cached_property
 
 from .legal import ReportingPeriod
-from .party import Party, PartyHistory
+from .party import Party, PartyHistory, Region
 from .substance import Group, Substance
 from .utils import round_decimal_half_up, DECIMAL_FIELD_DECIMALS, DECIMAL_FIELD_DIGITS
-from .control import Limit, LimitTypes, Baseline
+from .control import Limit, LimitTypes, Baseline, CalculationDirtyKey
+from ..utils.cache import bump_data_generation
 
 
 __all__ = [
     'ProdCons',
-    'ProdConsMT'
+    'ProdConsMT',
+    'AggregationSummary',
 ]
 
 
@@ -248,6 +251,36 @@ class BaseProdCons(models.Model):
                 return False
         return True
 
+    @classmethod
+    def bulk_save(cls, aggregations):
+        """
+        Persists the given (already calculated) aggregation instances without
+        going through save(): new ones are inserted using a single
+        bulk_create() and existing ones are written using update(), so none of
+        the per-row lookups done by save() are performed.
+
+        Callers are responsible for calling calculate_totals() and populating
+        the flags (and limits/baselines where needed) beforehand, as well as for
+        invalidating the aggregation cache afterwards.
+        """
+        new_aggregations = [a for a in aggregations if a.pk is None]
+        existing_aggregations = [a for a in aggregations if a.pk is not None]
+
+        # update() does not trigger the auto_now behaviour of updated_at
+        now = timezone.now()
+        update_fields = [
+            f.name for f in cls._meta.concrete_fields
+            if not f.primary_key and not f.is_relation
+        ]
+        with transaction.atomic():
+            cls.objects.bulk_create(new_aggregations)
+            for aggregation in existing_aggregations:
+                aggregation.updated_at = now
+                cls.objects.filter(pk=aggregation.pk).update(**{
+                    field_name: getattr(aggregation, field_name)
+                    for field_name in update_fields
+                })
+
     @classmethod
     def cleanup_aggregations(cls, party, reporting_period):
         """
@@ -547,7 +580,9 @@ class ProdCons(BaseProdCons):
             getattr(self, 'party', None),
         )
 
-    def populate_limits_and_baselines(self, is_article5=None):
+    def populate_limits_and_baselines(
+        self, is_article5=None, limits=None, baselines=None
+    ):
         """
         At save we fetch the limits/baselines from the corresponding tables.
         This assumes that said tables are pre-populated, which should happen
@@ -555,6 +590,10 @@ class ProdCons(BaseProdCons):
 
         We may also fetch the limits/baselines data without having first saved
         the instance. In this case the is_article5 parameter is used.
+
+        limits/baselines - optional pre-fetched Limit instances and Baseline
+        values() dicts for this party/period/group; bulk callers use them to
+        avoid querying the DB once for each aggregation.
         """
         # If this instance had already been saved, the is_article5 field should
         # already be populated with a coherent value.
@@ -568,12 +607,20 @@ class ProdCons(BaseProdCons):
         self.limit_prod = self.limit_cons = self.limit_bdn = None
         self.baseline_prod = self.baseline_cons = self.baseline_bdn = None
 
+        if limits is None:
+            limits = Limit.objects.filter(
+                party=self.party,
+                reporting_period=self.reporting_period,
+                group=self.group
+            )
+        if baselines is None:
+            baselines = Baseline.objects.filter(
+                party=self.party,
+                group=self.group
+            ).values('baseline_type__name', 'baseline')
+
         # Populate limits
-        for limit in Limit.objects.filter(
-            party=self.party,
-            reporting_period=self.reporting_period,
-            group=self.group
-        ):
+        for limit in limits:
             if limit.limit_type == LimitTypes.PRODUCTION.value:
                 self.limit_prod = limit.limit
             elif limit.limit_type == LimitTypes.CONSUMPTION.value:
@@ -592,10 +639,7 @@ class ProdCons(BaseProdCons):
             cons_bt = 'NA5Cons'
             bdn_bt = 'BDN_NA5'
 
-        for baseline in Baseline.objects.filter(
-            party=self.party,
-            group=self.group
-        ).values('baseline_type__name', 'baseline'):
+        for baseline in baselines:
             if (baseline['baseline_type__name'] == prod_bt
                     and self.limit_prod is not None):
                 self.baseline_prod = baseline['baseline']
@@ -661,6 +705,13 @@ class ProdCons(BaseProdCons):
 
         super().save(*args, **kwargs)
 
+        # Aggregated data is an input for baselines; update_limits_and_baselines
+        # bypasses this method, so saving the results does not mark them again.
+        CalculationDirtyKey.mark_aggregation(
+            self.party, self.group, self.reporting_period
+        )
+        bump_data_generation(self.party_id)
+
         # If all went well, send the clear_cache signal.
         # send_robust() is used to avoid save() not completing in case there
         # is an error when invalidating the cache.
@@ -678,7 +729,11 @@ class ProdCons(BaseProdCons):
         # If the param is not specified, default action is to invalidate.
         invalidate_cache = kwargs.pop('invalidate_cache', True)
 
+        CalculationDirtyKey.mark_aggregation(
+            self.party, self.group, self.reporting_period
+        )
         super().delete(*args, **kwargs)
+        bump_data_generation(self.party_id)
 
         # If all went well, send the clear_cache signal.
         # send_robust() is used to avoid save() not completing in case there
@@ -749,8 +804,178 @@ class ProdConsMT(BaseProdCons):
         self.is_eu_member = ph.is_eu_member if ph else None
 
         super().save(*args, **kwargs)
+        bump_data_generation(self.party_id)
 
     class Meta(BaseProdCons.Meta):
         db_table = "aggregation_prod_cons_mt"
         unique_together = ("party", "reporting_period", "substance")
         verbose_name_plural = 'Production consumptions metric tonnes'
+
+
+class AggregationSummary(models.Model):
+    """
+    Pre-aggregated ProdCons data used by the production/consumption summary
+    reports, by reporting period, region, article 5 status and group.
+
+    `is_reporting` is set for the data of main parties that have submissions
+    for the period. Rows without a group hold the population and number of
+    these parties instead.
+
+    Summaries are recalculated for a whole reporting period (by refresh()),
+    only when their inputs have changed.
+    """
+
+    FIELDS = (
+        'calculated_production',
+        'calculated_consumption',
+        'baseline_prod',
+        'baseline_cons',
+    )
+
+    reporting_period = models.ForeignKey(
+        ReportingPeriod, related_name='+', on_delete=models.CASCADE
+    )
+    region = models.ForeignKey(
+        Region, related_name='+', null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+    is_article5 = models.NullBooleanField()
+    is_reporting = models.BooleanField()
+    group = models.ForeignKey(
+        Group, related_name='+', null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+
+    calculated_production = models.DecimalField(
+        max_digits=DECIMAL_FIELD_DIGITS, decimal_places=DECIMAL_FIELD_DECIMALS,
+        null=True, blank=True
+    )
+    calculated_consumption = models.DecimalField(
+        max_digits=DECIMAL_FIELD_DIGITS, decimal_places=DECIMAL_FIELD_DECIMALS,
+        null=True, blank=True
+    )
+    baseline_prod = models.DecimalField(
+        max_digits=DECIMAL_FIELD_DIGITS, decimal_places=DECIMAL_FIELD_DECIMALS,
+        null=True, blank=True
+    )
+    baseline_cons = models.DecimalField(
+        max_digits=DECIMAL_FIELD_DIGITS, decimal_places=DECIMAL_FIELD_DECIMALS,
+        null=True, blank=True
+    )
+
+    # The EU is not included in the population, as its member states are
+    population = models.BigIntegerField(null=True, blank=True)
+    party_count = models.IntegerField(default=0)
+
+    @classmethod
+    def calculate(cls, reporting_period):
+        """
+        Returns (unsaved) summaries for the reporting period.
+        """
+        from .reporting import Submission
+
+        histories = {
+            history.party_id: history
+            for history in PartyHistory.objects.filter(
+                reporting_period=reporting_period
+            )
+        }
+        reporting_parties = set(
+            Submission.objects.filter(
+                reporting_period=reporting_period,
+                party__in=Party.get_main_parties(),
+            ).values_list('party_id', flat=True)
+        )
+
+        def add(value, other):
+            if value is None:
+                return other
+            if other is None:
+                return value
+            return value + other
+
+        summaries = {}
+
+        def get_summary(party_id, region_id, group_id):
+            history = histories.get(party_id)
+            key = (
+                region_id,
+                history.is_article5 if history else None,
+                party_id in reporting_parties,
+                group_id,
+            )
+            if key not in summaries:
+                summaries[key] = cls(
+                    reporting_period=reporting_period,
+                    region_id=key[0],
+                    is_article5=key[1],
+                    is_reporting=key[2],
+                    group_id=key[3],
+                )
+            return summaries[key]
+
+        for row in ProdCons.objects.filter(
+            reporting_period=reporting_period
+        ).values(
+            'party_id', 'party__subregion__region', 'group_id', *cls.FIELDS
+        ):
+            summary = get_summary(
+                row['party_id'], row['party__subregion__region'],
+                row['group_id']
+            )
+            for field in cls.FIELDS:
+                setattr(
+                    summary, field, add(getattr(summary, field), row[field])
+                )
+
+        # Only parties with a history for the period are counted
+        for party in Party.objects.filter(
+            id__in=reporting_parties.intersection(histories)
+        ).values('id', 'abbr', 'subregion__region'):
+            summary = get_summary(party['id'], party['subregion__region'], None)
+            summary.party_count += 1
+            if party['abbr'] != 'EU':
+                summary.population = add(
+                    summary.population, histories[party['id']].population
+                )
+            elif summary.population is None:
+                summary.population = 0
+
+        return list(summaries.values())
+
+    @classmethod
+    def refresh(cls, reporting_period):
+        """
+        Recalculates the summaries for the reporting period, if they have not
+        been calculated yet or if any of their inputs have changed.
+        """
+        marks = CalculationDirtyKey.objects.filter(
+            target=CalculationDirtyKey.Targets.SUMMARIES.value,
+            reporting_period=reporting_period,
+        )
+        if (
+            not marks.exists()
+            and cls.objects.filter(reporting_period=reporting_period).exists()
+        ):
+            return
+
+        with transaction.atomic():
+            # Serialize concurrent refreshes of the same period
+            ReportingPeriod.objects.select_for_update().get(
+                pk=reporting_period.pk
+            )
+            mark_ids = list(marks.values_list('pk', flat=True))
+            if (
+                not mark_ids
+                and cls.objects.filter(
+                    reporting_period=reporting_period
+                ).exists()
+            ):
+                return
+            cls.objects.filter(reporting_period=reporting_period).delete()
+            cls.objects.bulk_create(cls.calculate(reporting_period))
+            CalculationDirtyKey.objects.filter(pk__in=mark_ids).delete()
+
+    class Meta:
+        db_table = "aggregation_summary"
+        index_together = ("reporting_period", "region", "is_article5")
@@ -15,6 +15,7 @@ __all__ = [
     'ControlMeasure',
     'Baseline',
     'Limit',
+    'CalculationDirtyKey',
 ]
 
 
@@ -109,6 +110,8 @@ class Baseline(models.Model):
         validators=[MinValueValidator(0.0)], blank=True, null=True
     )
 
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
     class Meta:
         db_table = 'baseline'
 
@@ -139,5 +142,88 @@ class Limit(models.Model):
         validators=[MinValueValidator(0.0)], blank=True, null=True
     )
 
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
     class Meta:
         db_table = 'limit_prod_cons'
+
+
+class CalculationDirtyKey(models.Model):
+    """
+    Records that some input of the baselines, limits or aggregation summaries
+    calculation has changed for a party/group/reporting period, so that only
+    the affected values need to be recalculated.
+
+    A null party, group or reporting period stands for "all of them" (e.g. a
+    ControlMeasure change affects the limits of all parties and periods for
+    its group).
+    """
+
+    @enum.unique
+    class Targets(enum.Enum):
+        BASELINES = 'baselines'
+        LIMITS = 'limits'
+        SUMMARIES = 'summaries'
+
+    target = models.CharField(
+        max_length=16, choices=((s.value, s.name) for s in Targets),
+        help_text="Calculation whose inputs have changed"
+    )
+
+    party = models.ForeignKey(
+        Party, related_name='+', null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+    group = models.ForeignKey(
+        Group, related_name='+', null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+    reporting_period = models.ForeignKey(
+        ReportingPeriod, related_name='+', null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def mark(cls, target, party=None, group=None, reporting_period=None):
+        # Always a new row, even if the same key is already marked: running
+        # calculations delete the marks they have read (up to some id) once
+        # done, so reusing one of them would lose this change.
+        cls.objects.create(
+            target=target.value,
+            party=party,
+            group=group,
+            reporting_period=reporting_period,
+        )
+
+    @classmethod
+    def mark_aggregation(cls, party, group, reporting_period):
+        """
+        Called when aggregated data (production, consumption, BDN transfers)
+        changes; these are used for calculating baselines and the
+        aggregation summaries.
+        """
+        cls.mark_aggregations([
+            (party.pk, group.pk if group else None, reporting_period.pk)
+        ])
+
+    @classmethod
+    def mark_aggregations(cls, keys):
+        """
+        Same as mark_aggregation(), for many (party_id, group_id,
+        reporting_period_id) keys at once, using a single query.
+        """
+        cls.objects.bulk_create([
+            cls(
+                target=target.value,
+                party_id=party_id,
+                group_id=group_id,
+                reporting_period_id=reporting_period_id,
+            )
+            for party_id, group_id, reporting_period_id in set(keys)
+            for target in (cls.Targets.BASELINES, cls.Targets.SUMMARIES)
+        ])
+
+    class Meta:
+        db_table = 'calculation_dirty_key'
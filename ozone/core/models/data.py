@@ -1,3 +1,4 @@
+from collections import defaultdict, OrderedDict
 from decimal import Decimal
 
 from django.core.exceptions import ValidationError
@@ -107,10 +108,14 @@ class BlendCompositionMixin:
 
         super().clean()
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, expand_components=True, **kwargs):
         """
         This overrides save() to also create rows for each substance (component)
         in a blend.
+
+        Callers saving many rows can pass `expand_components=False` and then
+        call sync_components() once for all rows that had
+        components_changed() before being saved.
         """
 
         # Call clean() to perform either-substance-or-blend validation
@@ -118,46 +123,119 @@ class BlendCompositionMixin:
 
         super().save(*args, **kwargs)
 
-        # If blend has changed, child rows should be deleted.
+        if expand_components and self.components_changed():
+            self.__class__.sync_components([self])
+
+    def components_changed(self):
+        """
+        Whether the component rows need to be updated, i.e. if the blend or
+        any of the QUANTITY_FIELDS have changed since the last save.
+        """
         # Tracker adds an '_id' to foreign key field names.
         if self.tracker.has_changed('blend_id'):
-            changed_fields = self.QUANTITY_FIELDS
-        else:
-            # If any of the QUANTITY_FIELDS have changed for a blend,
-            # child rows should be deleted.
-            changed_fields = [field for field in self.QUANTITY_FIELDS
-                              if self.tracker.has_changed(field)]
-        if not changed_fields:
-            return
+            return True
+        return any(
+            self.tracker.has_changed(field) for field in self.QUANTITY_FIELDS
+        )
 
-        with transaction.atomic():
-            # First delete all child rows (using related_name)
-            self.components.all().delete()
+    def get_component_attributes(self, component):
+        """
+        Returns the field values of the substance row corresponding to a
+        component of this row's blend.
+        """
+        attributes = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in (
+                'id', 'substance_id', 'blend_id', 'blend_item_id',
+            )
+        }
+        for field in self.QUANTITY_FIELDS:
+            # Compute individual substance quantities
+            quantity = getattr(self, field)
+            attributes[field] = quantize(component.percentage * quantity) \
+                if quantity else None
+        attributes['substance_id'] = component.substance_id
+        attributes['blend_item_id'] = self.pk
+        return attributes
+
+    @classmethod
+    def sync_components(cls, rows):
+        """
+        Brings the component rows of many (already saved) rows in line with
+        their blends and quantities.
+
+        All blend compositions and all existing component rows are loaded with
+        one query each; then only the differences are written, in a single
+        transaction: missing component rows are inserted with one
+        bulk_create(), changed ones are updated and the ones that no longer
+        correspond to a blend component (e.g. because the row's blend has
+        changed) are deleted with one query.
 
-            # Then recreate, skipping over substance-less components
-            components = BlendComponent.objects.filter(
-                blend=self.blend, substance__isnull=False
+        Like bulk_create(), this does not go through save().
+        """
+        rows = [row for row in rows if row.pk is not None]
+        if not rows:
+            return
+
+        blend_ids = set(row.blend_id for row in rows if row.blend_id)
+        components = defaultdict(list)
+        if blend_ids:
+            # Skipping over substance-less components
+            for component in BlendComponent.objects.filter(
+                blend_id__in=blend_ids, substance__isnull=False
+            ):
+                components[component.blend_id].append(component)
+
+        existing_rows = {
+            (component_row.blend_item_id, component_row.substance_id):
+                component_row
+            for component_row in cls.objects.filter(
+                blend_item_id__in=[row.pk for row in rows]
             )
-            for component in components:
-                # Init & populate kwargs for each blend component's save()
-                field_dictionary = dict()
-                for field in self.QUANTITY_FIELDS:
-                    # Compute individual substance quantities
-                    quantity = getattr(self, field)
-                    field_dictionary[field] = quantize(component.percentage * quantity) \
-                        if quantity else None
+        }
 
-                attributes = model_to_dict(
-                    self,
-                    exclude=[
-                        'id', 'substance_id', 'blend_id', 'blend_item_id',
-                        '_state', '_deferred_fields', '_tracker', 'save',
-                    ],
+        new_rows = []
+        changed_rows = []
+        for row in rows:
+            for component in components.get(row.blend_id, []):
+                attributes = row.get_component_attributes(component)
+                component_row = existing_rows.pop(
+                    (row.pk, component.substance_id), None
                 )
-                attributes['substance_id'] = component.substance.pk
-                attributes['blend_item_id'] = self.pk
-                attributes.update(field_dictionary)
-                self.__class__.objects.create(**attributes)
+                if component_row is None:
+                    new_rows.append(cls(**attributes))
+                elif any(
+                    getattr(component_row, name) != value
+                    for name, value in attributes.items()
+                ):
+                    changed_rows.append((component_row.pk, attributes))
+
+        with transaction.atomic():
+            if existing_rows:
+                cls.objects.filter(
+                    pk__in=[r.pk for r in existing_rows.values()]
+                ).delete()
+            for pk, attributes in changed_rows:
+                cls.objects.filter(pk=pk).update(**attributes)
+            if new_rows:
+                cls.objects.bulk_create(new_rows)
+
+    @classmethod
+    def bulk_create_with_components(cls, instances, batch_size=None):
+        """
+        Inserts many rows at once, along with the substance rows for the
+        components of the blends among them (see sync_components()).
+
+        Like bulk_create(), this does not go through save(), so no validation
+        is performed. Relies on the database returning the ids of the
+        inserted rows (PostgreSQL).
+        """
+        instances = cls.objects.bulk_create(instances, batch_size=batch_size)
+        cls.sync_components(
+            instance for instance in instances if instance.blend_id
+        )
+        return instances
 
 
 class PolyolsMixin:
@@ -211,6 +289,81 @@ class AggregationMixin:
             for field_name in field_names
         }
 
+    @classmethod
+    def get_fields_sums_by_group(cls, submission, groups, baseline=False):
+        """
+        Set-based counterpart of get_fields_sum_by_group(): returns, using a
+        single grouped query, the ODP/GWP-weighted sums of all
+        AGGREGATION_MAPPING fields for all given groups, as a mapping of form:
+        {
+            group_id: {model_field: sum, ...},
+            ...
+        }
+        Groups without any data are missing from the result.
+
+        Default model ordering is cleared, as it would otherwise be added to the
+        GROUP BY clause.
+        """
+        if baseline is True:
+            potential = models.F('substance__gwp_baseline')
+        else:
+            potential = models.Case(
+                models.When(
+                    substance__group__is_gwp=True,
+                    then=models.F('substance__gwp')
+                ),
+                models.When(
+                    substance__group__is_odp=True,
+                    then=models.F('substance__odp')
+                ),
+                default=None,
+                output_field=models.DecimalField()
+            )
+
+        sums = cls.objects.filter(
+            submission=submission, substance__group__in=groups
+        ).order_by().values('substance__group').annotate(**{
+            f'sum_{field_name}': models.Sum(
+                models.F(field_name) * potential,
+                output_field=models.DecimalField()
+            )
+            for field_name in cls.AGGREGATION_MAPPING.keys()
+        })
+
+        return {
+            entry['substance__group']: {
+                field_name: decimal_zero_if_none(entry[f'sum_{field_name}'])
+                for field_name in cls.AGGREGATION_MAPPING.keys()
+            }
+            for entry in sums
+        }
+
+    @classmethod
+    def get_fields_sums_by_substance(cls, submission):
+        """
+        Returns, using a single grouped query, the (metric tonnes) sums of all
+        AGGREGATION_MAPPING fields for each substance reported in the given
+        submission, as a mapping of form:
+        {
+            substance_id: {model_field: sum, ...},
+            ...
+        }
+        """
+        sums = cls.objects.filter(
+            submission=submission, substance__isnull=False
+        ).order_by().values('substance_id').annotate(**{
+            f'sum_{field_name}': models.Sum(field_name)
+            for field_name in cls.AGGREGATION_MAPPING.keys()
+        })
+
+        return {
+            entry['substance_id']: {
+                field_name: decimal_zero_if_none(entry[f'sum_{field_name}'])
+                for field_name in cls.AGGREGATION_MAPPING.keys()
+            }
+            for entry in sums
+        }
+
     @classmethod
     def fill_aggregated_data(cls, submission=None, reported_groups=[]):
         # Aggregations are unique per Party/Period/AnnexGroup. We need to
@@ -556,11 +709,15 @@ class BaseImportExportReport(models.Model):
     )
 
     @classmethod
-    def validate_import_export_data(cls, submission):
+    def get_import_export_errors(cls, submission):
         """
-        Function for validation of all import/export data in a specific Art 7
-        submission. Validation is done in regards to complex, per-form
-        validation criteria (see https://github.com/eaudeweb/ozone/issues/81)
+        Validates all import/export data in a specific Art 7 submission in
+        regards to complex, per-form validation criteria
+        (see https://github.com/eaudeweb/ozone/issues/81).
+
+        All rows are fetched in a single query (along with the names used in
+        messages) and checked in one pass. Returns the list of all error
+        messages, which is empty if the data is valid.
         """
 
         def get_fields_sum(entry_dict, field_names):
@@ -578,107 +735,84 @@ class BaseImportExportReport(models.Model):
             if f not in totals_fields and f not in excluded_fields
         ]
 
-        # Find all entries in this submission that do not have a src/dst country
-        # (actually, there should only be one such entry).
-        # Then find all substances relating to those entries, taking blend
-        # contents into account.
-        # From these substances, keep only the ones that are also in at least
-        # one entry with a src/dst country.
-        partyless_substances = set()
-        partyful_substances = set()
         # Only taking into account substance entries (as there already are
         # substance entries auto-generated from blends - and calculating them
         # again is redundant)
-        substance_entries = cls.objects.filter(submission=submission).exclude(
+        values = cls.objects.filter(submission=submission).exclude(
             blend__isnull=False
-        )
-        values = substance_entries.values(
-            'substance', party_field, *totals_fields, *quantity_fields
+        ).values(
+            'substance', 'substance__name', party_field,
+            f'{party_field}__name', *totals_fields, *quantity_fields
         )
 
+        errors = []
+        # Keyed by substance id, in order of appearance
+        substances = OrderedDict()
         for entry in values:
-            substance = entry.get('substance', None)
-            party = entry.get(party_field, None)
+            substance = entry['substance']
+            party = entry[party_field]
+            totals = get_fields_sum(entry, totals_fields)
+            quantities = get_fields_sum(entry, quantity_fields)
+
+            if substance not in substances:
+                substances[substance] = {
+                    'name': entry['substance__name'],
+                    'partyless_entries': [],
+                    'has_party': False,
+                    'totals_sum': Decimal(0),
+                    'quantities_sum': Decimal(0),
+                }
+            sums = substances[substance]
+            sums['totals_sum'] += totals
+            sums['quantities_sum'] += quantities
 
             # If this entry has a party set, it should be checked for
             # consistency at entry level.
             # (see https://github.com/eaudeweb/ozone/issues/1416)
             if party is not None:
-                if (
-                    get_fields_sum(entry, totals_fields) <
-                    get_fields_sum(entry, quantity_fields)
-                ):
-                    raise ValidationError(
-                        f'For {Substance.objects.filter(id=substance).first()},'
-                        f' {Party.objects.filter(id=party).first()}, '
+                sums['has_party'] = True
+                if totals < quantities:
+                    errors.append(
+                        f'For {entry["substance__name"]}, '
+                        f'{entry[f"{party_field}__name"]}, '
                         f'the sum of quantities across this data entry is '
                         f'greater than the sum of totals.'
                     )
-
-            # Populate sets for checks across all data
-            if party is None:
-                partyless_substances.add(substance)
             else:
-                partyful_substances.add(substance)
+                sums['partyless_entries'].append((totals, quantities))
 
-        # For substances that are only present in party-less rows, we check
-        # that each row has totals >= quantities.
-        completely_partyless_substances = partyless_substances.difference(
-            partyful_substances
-        )
-        if completely_partyless_substances:
-            completely_partyless_entries = (
-                v for v in values
-                if v.get('substance', None) in completely_partyless_substances
-            )
-            for entry in completely_partyless_entries:
-                if (
-                    get_fields_sum(entry, totals_fields) <
-                    get_fields_sum(entry, quantity_fields)
-                ):
-                    raise ValidationError(
-                        f'For {Substance.objects.filter(id=substance).first()},'
-                        f' the sum of quantities across this data entry is'
-                        f'greater than the sum of totals.'
-                    )
-
-        # Now check all substances that are present both in partyless and
-        # partyful rows.
-        related_substances = partyless_substances.intersection(
-            partyful_substances
-        )
-        # Calculate the sums of quantities and totals for each substance
-        if related_substances:
-            sums_dictionary = {
-                substance: {
-                    'totals_sum': Decimal(0),
-                    'quantities_sum': Decimal(0)
-                }
-                for substance in related_substances
-            }
-            # Only fetch data entries containing the related_substances
-            related_entries = (
-                v for v in values
-                if v.get('substance', None) in related_substances
-            )
-            for entry in related_entries:
-                substance = entry.get('substance', None)
-                sums_dictionary[substance]['totals_sum'] += get_fields_sum(
-                    entry, totals_fields
-                )
-                sums_dictionary[substance]['quantities_sum'] += get_fields_sum(
-                    entry, quantity_fields
+        for sums in substances.values():
+            if not sums['partyless_entries']:
+                continue
+            if not sums['has_party']:
+                # For substances that are only present in party-less rows, we
+                # check that each row has totals >= quantities.
+                for totals, quantities in sums['partyless_entries']:
+                    if totals < quantities:
+                        errors.append(
+                            f'For {sums["name"]}, the sum of quantities '
+                            f'across this data entry is greater than the sum '
+                            f'of totals.'
+                        )
+            elif sums['totals_sum'] < sums['quantities_sum']:
+                # For substances present both in party-less and party rows,
+                # the sum of totals should be >= the sum of quantities.
+                errors.append(
+                    f'For {sums["name"]}, the sum of quantities across all '
+                    f'data entries is greater than the sum of totals.'
                 )
 
-            # And finally verify that, for each substance,
-            # sum of totals > sum of quantities
-            for id, sums in sums_dictionary.items():
-                if sums['totals_sum'] < sums['quantities_sum']:
-                    raise ValidationError(
-                        f'For {Substance.objects.filter(id=id).first()}, the '
-                        f'sum of quantities across all data entries is greater '
-                        f'than the sum of totals.'
-                    )
+        return errors
+
+    @classmethod
+    def validate_import_export_data(cls, submission):
+        """
+        Raises a validation error listing all the problems found by
+        get_import_export_errors(), if any.
+        """
+        errors = cls.get_import_export_errors(submission)
+        if errors:
+            raise ValidationError(errors)
 
     class Meta:
         abstract = True
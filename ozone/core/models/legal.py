@@ -1,9 +1,12 @@
+import copy
 from datetime import datetime
 
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from ..utils.reference_cache import reference_cache
+
 __all__ = [
     'ReportingPeriod'
 ]
@@ -55,10 +58,15 @@ class ReportingPeriod(models.Model):
     @classmethod
     def get_current_period(cls):
         today = datetime.now().date()
-        return cls.objects.filter(
-            start_date__lte=today,
-            end_date__gte=today,
-        ).first()
+        period = reference_cache.get(
+            ('current_period', today),
+            lambda: cls.objects.filter(
+                start_date__lte=today,
+                end_date__gte=today,
+            ).first()
+        )
+        # The cached instance is shared, callers get their own copy.
+        return copy.copy(period)
 
     @classmethod
     def get_most_recent(cls):
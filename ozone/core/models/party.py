@@ -1,6 +1,5 @@
 import datetime
 import enum
-from functools import lru_cache
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
@@ -8,6 +7,7 @@ from django.db import models
 from .legal import ReportingPeriod
 from .meeting import Treaty
 from .utils import RatificationTypes
+from ..utils.reference_cache import reference_cache
 
 
 __all__ = [
@@ -209,29 +209,49 @@ class Party(models.Model):
         """ Returns the EU member states at specified time
         """
         return cls.objects.filter(
-            history__is_eu_member=True,
-            history__reporting_period=reporting_period,
-            is_active=True,
+            id__in=cls.get_eu_member_ids_at(reporting_period)
+        )
+
+    @classmethod
+    def get_eu_member_ids_at(cls, reporting_period):
+        """ Returns the ids of the EU member states at specified time
+        """
+        if reporting_period is None:
+            return frozenset()
+        return reference_cache.get(
+            ('eu_members', reporting_period.id),
+            lambda: frozenset(cls.objects.filter(
+                history__is_eu_member=True,
+                history__reporting_period=reporting_period,
+                is_active=True,
+            ).values_list('id', flat=True))
+        )
+
+    def get_history_flags_at(self, reporting_period):
+        """
+        Returns the (is_article5, is_eu_member) flags of the PartyHistory
+        entry for the given period, or (None, None) if there is none.
+        """
+        def get_flags():
+            ph = PartyHistory.objects.filter(
+                party=self,
+                reporting_period=reporting_period
+            ).values_list('is_article5', 'is_eu_member').first()
+            return ph if ph else (None, None)
+
+        return reference_cache.get(
+            ('party_history', self.id, getattr(reporting_period, 'id', None)),
+            get_flags
         )
 
     def is_eu_member_at(self, reporting_period):
-        ph = PartyHistory.objects.filter(
-            party=self,
-            reporting_period=reporting_period
-        ).first()
-        if ph and ph.is_eu_member:
-            return True
-        return False
+        is_article5, is_eu_member = self.get_history_flags_at(reporting_period)
+        return bool(is_eu_member)
 
     def is_art5_at(self, reporting_period):
-        ph = PartyHistory.objects.filter(
-            party=self,
-            reporting_period=reporting_period
-        ).first()
         # TODO: remove field from model and use party type?
-        if ph and ph.is_article5:
-            return True
-        return False
+        is_article5, is_eu_member = self.get_history_flags_at(reporting_period)
+        return bool(is_article5)
 
     def __str__(self):
         return self.name
@@ -304,6 +324,8 @@ class PartyHistory(models.Model):
     # Remarks
     remark = models.CharField(max_length=256, blank=True)
 
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
     def __str__(self):
         return f'{self.party.name} - {self.reporting_period}'
 
@@ -386,6 +408,7 @@ class Language(models.Model):
         db_table = 'language'
 
 
-@lru_cache(maxsize=1)
 def eu_party_id():
-    return Party.objects.get(abbr='EU').id
+    return reference_cache.get(
+        'eu_party_id', lambda: Party.objects.get(abbr='EU').id
+    )
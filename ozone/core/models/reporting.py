@@ -1,5 +1,9 @@
 import enum
+import operator
 import os
+from collections import defaultdict, OrderedDict
+from decimal import Decimal
+from functools import reduce
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
@@ -10,7 +14,8 @@ from django.utils import timezone
 from model_utils import FieldTracker
 from simple_history.models import HistoricalRecords
 
-from .aggregation import ProdCons
+from .aggregation import ProdCons, ProdConsMT
+from .control import Baseline, CalculationDirtyKey, Limit
 from .legal import ReportingPeriod
 from .party import Party, PartyHistory
 from .substance import Group
@@ -671,11 +676,56 @@ class Submission(models.Model):
             model_instance=self,
             user=user
         )
+        wf.state = self.persisted_state
+        return wf
+
+    # Compiled workflow tables, keyed by workflow class name
+    _workflow_tables = {}
+
+    @classmethod
+    def get_workflow_table(cls, workflow_class):
+        """
+        Returns the states and transitions of a workflow class, so they can be
+        looked up without instantiating the workflow for each submission:
+        {
+            'initial_state': name,
+            'transitions': {state_name: [transition_name, ...]},
+        }
+        """
+        table = cls._workflow_tables.get(workflow_class)
+        if table is None:
+            wf = cls.WORKFLOW_MAPPING[workflow_class](
+                model_instance=None, user=None
+            )
+            workflow = wf.state.workflow
+            table = {
+                'initial_state': workflow.initial_state.name,
+                'transitions': {
+                    state.name: [
+                        transition.name
+                        for transition in workflow.transitions.available_from(
+                            state
+                        )
+                    ]
+                    for state in workflow.states
+                },
+            }
+            cls._workflow_tables[workflow_class] = table
+        return table
+
+    @property
+    def workflow_table(self):
+        return self.get_workflow_table(self._workflow_class)
+
+    @property
+    def persisted_state(self):
+        """
+        Name of the last persisted state, same as the one set by workflow().
+        """
         state = self.tracker.previous('_current_state') \
             if self.tracker.has_changed('_current_state') \
             else self.current_state
-        wf.state = state or wf.state.workflow.initial_state
-        return wf
+        return state or self.workflow_table['initial_state']
 
     @property
     def current_state(self):
@@ -689,19 +739,26 @@ class Submission(models.Model):
         """
         return self._previous_state
 
+    @property
+    def workflow_implementation(self):
+        return self.WORKFLOW_MAPPING[self._workflow_class]
+
     @property
     def data_changes_allowed(self):
         """
         Check whether data changes are allowed in current state.
         """
-        return self.workflow().data_changes_allowed
+        return (
+            self.persisted_state
+            in self.workflow_implementation.editable_data_states
+        )
 
     @property
     def deletion_allowed(self):
         """
         Check whether deletion is allowed in current state.
         """
-        return self.workflow().deletion_allowed
+        return self.in_initial_state
 
     @property
     def available_states(self):
@@ -720,17 +777,22 @@ class Submission(models.Model):
     def incorrect_states(self):
         return self.workflow().incorrect_data_states
 
+    # The state checks below are equivalent to the ones of the workflow, but
+    # use the compiled workflow tables instead of instantiating it.
     @property
     def in_incorrect_state(self):
-        return self.workflow().in_incorrect_data_state
+        return (
+            self.persisted_state
+            in self.workflow_implementation.incorrect_data_states
+        )
 
     @property
     def in_initial_state(self):
-        return self.workflow().in_initial_state
+        return self.persisted_state == self.workflow_table['initial_state']
 
     @property
     def in_final_state(self):
-        return self.workflow().finished
+        return self.persisted_state in self.workflow_implementation.final_states
 
     @property
     def is_current(self):
@@ -738,10 +800,57 @@ class Submission(models.Model):
             return False
         return True
 
-    def is_cloneable(self, user):
-        is_cloneable, message = self.check_cloning(user)
+    def is_cloneable(self, user, peers=None):
+        is_cloneable, message = self.check_cloning(user, peers)
         return is_cloneable
 
+    @classmethod
+    def get_permissions(cls, submissions, user):
+        """
+        Evaluates the permission-related fields of submission lists
+        (available_transitions, is_cloneable, can_edit_data, can_delete_data)
+        for many submissions at once, fetching the related objects and the
+        peers needed by the cloning checks using a constant number of queries.
+
+        Returns a dictionary keyed by submission id.
+        """
+        submissions = list(submissions)
+        models.prefetch_related_objects(
+            submissions,
+            'party', 'obligation', 'reporting_period', 'created_by__party',
+            'info',
+        )
+
+        peers = defaultdict(list)
+        if submissions and not user.is_read_only:
+            keys = set(
+                (s.party_id, s.obligation_id, s.reporting_period_id)
+                for s in submissions
+            )
+            for peer in cls.objects.filter(
+                party_id__in=set(key[0] for key in keys),
+                obligation_id__in=set(key[1] for key in keys),
+                reporting_period_id__in=set(key[2] for key in keys),
+            ).select_related('created_by'):
+                key = (
+                    peer.party_id, peer.obligation_id, peer.reporting_period_id
+                )
+                if key in keys:
+                    peers[key].append(peer)
+
+        return {
+            s.pk: {
+                'available_transitions': s.available_transitions(user),
+                'is_cloneable': s.is_cloneable(
+                    user,
+                    peers[(s.party_id, s.obligation_id, s.reporting_period_id)]
+                ),
+                'can_edit_data': s.can_edit_data(user),
+                'can_delete_data': s.can_delete_data(user),
+            }
+            for s in submissions
+        }
+
     def available_transitions(self, user):
         """
         List of transitions that can be performed from current state.
@@ -752,13 +861,16 @@ class Submission(models.Model):
             return []
 
         transitions = []
-        wf = self.workflow(user)
-        for transition in wf.state.transitions():
-            if hasattr(wf, 'check_' + transition.name):
-                if getattr(wf, 'check_' + transition.name)():
-                    transitions.append(transition.name)
+        wf = None
+        for name in self.workflow_table['transitions'][self.persisted_state]:
+            if hasattr(self.workflow_implementation, 'check_' + name):
+                # Checks need an actual workflow, bound to the user
+                if wf is None:
+                    wf = self.workflow(user)
+                if getattr(wf, 'check_' + name)():
+                    transitions.append(name)
             else:
-                transitions.append(transition.name)
+                transitions.append(name)
         return transitions
 
     def call_transition(self, trans_name, user):
@@ -818,18 +930,35 @@ class Submission(models.Model):
 
         return True
 
-    def check_imports_exports(self):
+    def get_imports_exports_errors(self):
         """
         Performs checks on all imports and exports data in this submission
         based on the validation rules described in
         https://github.com/eaudeweb/ozone/issues/81/
-        If validation fails, this will raise a validation error.
+        Returns a dictionary with the lists of error messages for imports and
+        exports (empty if the data is valid).
         """
+        errors = OrderedDict()
         if self.obligation.obligation_type == ObligationTypes.ART7.value:
-            if hasattr(self, "article7imports") and self.article7imports:
-                self.article7imports.model.validate_import_export_data(self)
-            if hasattr(self, "article7exports") and self.article7exports:
-                self.article7exports.model.validate_import_export_data(self)
+            for related in ('article7imports', 'article7exports'):
+                if hasattr(self, related) and getattr(self, related):
+                    errors[related] = getattr(
+                        self, related
+                    ).model.get_import_export_errors(self)
+        return errors
+
+    def check_imports_exports(self):
+        """
+        Same as get_imports_exports_errors(), but raises a validation error
+        listing all problems found, if any.
+        """
+        errors = [
+            message
+            for messages in self.get_imports_exports_errors().values()
+            for message in messages
+        ]
+        if errors:
+            raise ValidationError(errors)
 
     def can_edit_flags(self, user):
         """
@@ -1166,10 +1295,13 @@ class Submission(models.Model):
                     return True, message
         return False, None
 
-    def check_cloning(self, user):
+    def check_cloning(self, user, peers=None):
         """
         Checks whether the current submission can be cloned and the current user
         has the necessary permissions.
+
+        `peers` (submissions for the same party-period-obligation) can be
+        given when they have already been fetched.
         """
 
         if (
@@ -1210,11 +1342,12 @@ class Submission(models.Model):
         # Submissions can't be cloned if there is already a data entry one
         # created by the same user type (OS, party) for the same
         # party-period-obligation
-        peers = Submission.objects.filter(
-            party=self.party,
-            obligation=self.obligation,
-            reporting_period=self.reporting_period
-        )
+        if peers is None:
+            peers = Submission.objects.filter(
+                party=self.party,
+                obligation=self.obligation,
+                reporting_period=self.reporting_period
+            )
         has_peers, message = self.has_initial_state_peers_by_same_user_type(
             peers, user
         )
@@ -1375,32 +1508,72 @@ class Submission(models.Model):
             self.purge_aggregated_data()
 
     @classmethod
-    @transaction.atomic
-    def latest_submitted_for_parties(cls, obligation, reporting_period, parties):
-        rv = {}
+    def get_submitted_states(cls):
+        """
+        States in which submissions are considered submitted (data can no
+        longer be changed and is not known to be incorrect), keyed by workflow
+        class. Derived from the workflow definitions.
+        """
+        ret = {}
+        for workflow_class, implementation in cls.WORKFLOW_MAPPING.items():
+            # 'empty' and 'base' are not actual workflows
+            if implementation in (None, BaseWorkflow):
+                continue
+            ret[workflow_class] = [
+                state
+                for state in cls.get_workflow_table(workflow_class)['transitions']
+                if state not in implementation.editable_data_states
+                and state not in implementation.incorrect_data_states
+            ]
+        return ret
 
+    @classmethod
+    def latest_submitted_for_matrix(cls, obligation, parties, reporting_periods):
+        """
+        Returns the latest valid submitted submission for each party and
+        reporting period, keyed by (party_id, reporting_period_id).
+
+        Uses a single (non-locking) query, fetching the related objects needed
+        by the reports.
+        """
+        states_filter = reduce(operator.or_, (
+            models.Q(_workflow_class=workflow_class, _current_state__in=states)
+            for workflow_class, states in cls.get_submitted_states().items()
+        ))
         versions = (
-            Submission.objects.select_for_update()
-            .filter(
+            cls.objects.filter(
+                states_filter,
                 party__in=parties,
-                reporting_period=reporting_period,
+                reporting_period__in=reporting_periods,
                 obligation=obligation,
             )
             .exclude(flag_valid=False)
+            .select_related(
+                'party', 'reporting_period', 'obligation', 'created_by', 'info'
+            )
             .order_by('version')
         )
 
+        rv = {}
         for submission in versions:
-            if submission.data_changes_allowed:
-                continue
-            if submission.in_incorrect_state:
-                continue
-
             # overwrite previous versions
-            rv[submission.party] = submission
-
+            rv[(submission.party_id, submission.reporting_period_id)] = (
+                submission
+            )
         return rv
 
+    @classmethod
+    def latest_submitted_for_parties(cls, obligation, reporting_period, parties):
+        parties = list(parties)
+        submissions = cls.latest_submitted_for_matrix(
+            obligation, parties, [reporting_period]
+        )
+        return {
+            party: submissions[(party.pk, reporting_period.pk)]
+            for party in parties
+            if (party.pk, reporting_period.pk) in submissions
+        }
+
     @classmethod
     def latest_submitted(cls, obligation, party, reporting_period):
         res = cls.latest_submitted_for_parties(obligation, reporting_period, [party])
@@ -1553,7 +1726,11 @@ class Submission(models.Model):
     def fill_aggregated_data(self):
         """
         Fill aggregated data from this submission into the corresponding
-        aggregation model instance.
+        aggregation model instances.
+
+        The ODP/GWP and MT sums are calculated using one grouped query per
+        data model and aggregation type; all aggregations are then written
+        in bulk, in a single transaction, without going through their save().
 
         Returns list of ID's of ProdCons objects that have been created or
         modified.
@@ -1561,48 +1738,143 @@ class Submission(models.Model):
         if not self.obligation.is_aggregateable:
             return
 
-        # Cleanup aggregated data that's become stale
-        self.purge_aggregated_data(invalidate_cache=False)
+        groups = list(self.get_reported_groups())
+        obligation_type = self.obligation.obligation_type
+        data_models = [
+            getattr(self, related).model
+            for related, aggr_flag in self.RELATED_DATA
+            if aggr_flag and hasattr(
+                getattr(self, related).model, 'AGGREGATION_MAPPING'
+            )
+        ]
+        # All aggregation fields populated by this submission's data models.
+        # These are reset before adding the newly-calculated values, which is
+        # what purge_aggregated_data() would do.
+        aggregation_fields = set(
+            aggr_field
+            for model in data_models
+            for aggr_field in model.AGGREGATION_MAPPING.values()
+        )
 
-        groups = self.get_reported_groups()
+        # The submission's party_history property is cached.
+        ph = self.party_history
+        is_article5 = ph.is_article5 if ph else None
+        is_eu_member = ph.is_eu_member if ph else None
+
+        def reset_aggregation(aggregation):
+            for aggr_field in aggregation_fields:
+                setattr(aggregation, aggr_field, Decimal('0.0'))
+            aggregation.is_article5 = is_article5
+            aggregation.is_eu_member = is_eu_member
+            submissions_set = set(
+                aggregation.submissions.get(obligation_type, [])
+            )
+            submissions_set.add(self.id)
+            aggregation.submissions[obligation_type] = list(submissions_set)
+
+        def add_values(aggregation, model, values):
+            for model_field, aggr_field in model.AGGREGATION_MAPPING.items():
+                # Add with existing value, as a field in the aggregation
+                # table may be populated by aggregating values from several
+                # other fields in the data models.
+                setattr(
+                    aggregation, aggr_field,
+                    getattr(aggregation, aggr_field) + values[model_field]
+                )
 
-        # Create all-zero ProdCons rows for all reported groups.
-        # For ProdConsMT this is not necessary.
-        ret = []
+        # ODP/GWP aggregations - one for each reported group, even if all-zero
+        aggregations = {
+            aggregation.group_id: aggregation
+            for aggregation in ProdCons.objects.filter(
+                party=self.party,
+                reporting_period=self.reporting_period,
+                group__in=groups
+            )
+        }
         for group in groups:
-            aggregation, created = ProdCons.objects.get_or_create(
+            if group.id not in aggregations:
+                aggregations[group.id] = ProdCons(
+                    party=self.party,
+                    reporting_period=self.reporting_period,
+                    group=group
+                )
+            reset_aggregation(aggregations[group.id])
+
+        for model in data_models:
+            sums = model.get_fields_sums_by_group(self, groups)
+            for group_id, values in sums.items():
+                add_values(aggregations[group_id], model, values)
+
+        limits = defaultdict(list)
+        for limit in Limit.objects.filter(
+            party=self.party,
+            reporting_period=self.reporting_period,
+            group__in=groups
+        ):
+            limits[limit.group_id].append(limit)
+        baselines = defaultdict(list)
+        for baseline in Baseline.objects.filter(
+            party=self.party, group__in=groups
+        ).values('group_id', 'baseline_type__name', 'baseline'):
+            baselines[baseline['group_id']].append(baseline)
+
+        for group_id, aggregation in aggregations.items():
+            # Same order as in ProdCons.save()
+            aggregation.calculate_totals()
+            aggregation.populate_limits_and_baselines(
+                limits=limits[group_id], baselines=baselines[group_id]
+            )
+
+        # MT aggregations - one for each reported substance
+        mt_sums = [
+            (model, model.get_fields_sums_by_substance(self))
+            for model in data_models
+        ]
+        substance_ids = set(
+            substance_id for model, sums in mt_sums for substance_id in sums
+        )
+        mt_aggregations = {
+            aggregation.substance_id: aggregation
+            for aggregation in ProdConsMT.objects.filter(
                 party=self.party,
                 reporting_period=self.reporting_period,
-                group=group
+                substance_id__in=substance_ids
             )
-            obligation_type = self.obligation.obligation_type
-            if obligation_type in aggregation.submissions:
-                submissions_set = set(aggregation.submissions[obligation_type])
-                submissions_set.add(self.id)
-                aggregation.submissions[obligation_type] = list(submissions_set)
-            else:
-                aggregation.submissions[obligation_type] = [self.id,]
-            # Do not invalidate cache as it's already been done
-            aggregation.save(invalidate_cache=False)
-            ret.append(aggregation.id)
+        }
+        for substance_id in substance_ids:
+            if substance_id not in mt_aggregations:
+                mt_aggregations[substance_id] = ProdConsMT(
+                    party=self.party,
+                    reporting_period=self.reporting_period,
+                    substance_id=substance_id
+                )
+            reset_aggregation(mt_aggregations[substance_id])
 
-        for related, aggr_flag in self.RELATED_DATA:
-            if not aggr_flag:
-                continue
-            related_manager = getattr(self, related)
-            if related_manager.count() > 0:
-                if hasattr(related_manager.model, 'fill_aggregated_data'):
-                    related_manager.model.fill_aggregated_data(
-                        submission=self, reported_groups=groups
-                    )
-                if hasattr(related_manager.model, 'fill_aggregated_mt_data'):
-                    related_manager.model.fill_aggregated_mt_data(
-                        submission=self,
-                        queryset=related_manager.all().filter(
-                            substance__isnull=False
-                        )
-                    )
-        return ret
+        for model, sums in mt_sums:
+            for substance_id, values in sums.items():
+                add_values(mt_aggregations[substance_id], model, values)
+
+        for aggregation in mt_aggregations.values():
+            aggregation.calculate_totals()
+
+        with transaction.atomic():
+            ProdCons.bulk_save(list(aggregations.values()))
+            ProdConsMT.bulk_save(list(mt_aggregations.values()))
+            CalculationDirtyKey.mark_aggregations(
+                (self.party_id, group_id, self.reporting_period_id)
+                for group_id in aggregations
+            )
+
+        # Cache invalidation is done per party, so one signal is enough.
+        # send_robust() is used to avoid failing in case there is an error when
+        # invalidating the cache.
+        if aggregations:
+            from ..signals import clear_aggregation_cache_signal
+            clear_aggregation_cache_signal.send_robust(
+                sender=ProdCons, instance=next(iter(aggregations.values()))
+            )
+
+        return [aggregation.id for aggregation in aggregations.values()]
 
     def get_aggregated_data(self, baseline=False, populate_baselines=True):
         """
@@ -1789,12 +2061,12 @@ class Submission(models.Model):
                     for flag in self.GROUP_FLAGS_MAPPING.keys():
                         setattr(self, flag, getattr(self.cloned_from, flag))
                 else:
-                    groups = Group.get_report_groups(
+                    group_ids = Group.get_report_group_ids(
                         self.party, self.reporting_period
                     )
-                    for g in groups:
+                    for group_id in group_ids:
                         setattr(
-                            self, self.FLAG_GROUPS_MAPPING[g.group_id], True
+                            self, self.FLAG_GROUPS_MAPPING[group_id], True
                         )
 
             # Prefill blank-related flags if needed
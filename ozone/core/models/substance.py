@@ -8,6 +8,7 @@ from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
 from ..exceptions import MethodNotAllowed
+from ..utils.reference_cache import reference_cache
 from .meeting import Treaty
 from .party import Party, PartyRatification
 
@@ -144,12 +145,56 @@ class Group(models.Model):
 
         # Get all the current ratifications of this Party
         # When the entry into force date is empty, the field has simply not been updated
-        return PartyRatification.objects.filter(
-            Q(entry_into_force_date__lte=max_date) |
-            Q(entry_into_force_date__isnull=True) & Q(ratification_date__lte=max_date),
-            party=party,
-            treaty__entry_into_force_date__lte=max_date,
-        ).values_list('treaty_id', flat=True)
+        return reference_cache.get(
+            ('ratifications', party.id, max_date),
+            lambda: frozenset(PartyRatification.objects.filter(
+                Q(entry_into_force_date__lte=max_date) |
+                Q(entry_into_force_date__isnull=True) & Q(ratification_date__lte=max_date),
+                party=party,
+                treaty__entry_into_force_date__lte=max_date,
+            ).values_list('treaty_id', flat=True))
+        )
+
+    @staticmethod
+    def _get_group_treaties():
+        """
+        Returns (group_id, control_treaty_id, report_treaty_id) tuples for
+        all groups, in the default ordering.
+        """
+        return reference_cache.get(
+            'group_treaties',
+            lambda: tuple(Group.objects.values_list(
+                'group_id', 'control_treaty_id', 'report_treaty_id'
+            ))
+        )
+
+    @staticmethod
+    def get_controlled_group_ids(party, reporting_period=None):
+        """
+        Returns the list of Group.group_id values of the groups for which
+        control measures apply for the given party and reporting_period.
+        """
+        current_ratifications = Group._get_ratifications(party, reporting_period)
+        return [
+            group_id
+            for group_id, control_treaty_id, report_treaty_id
+            in Group._get_group_treaties()
+            if control_treaty_id in current_ratifications
+        ]
+
+    @staticmethod
+    def get_report_group_ids(party, reporting_period=None):
+        """
+        Returns the list of Group.group_id values of the groups that party
+        should report in given reporting_period.
+        """
+        current_ratifications = Group._get_ratifications(party, reporting_period)
+        return [
+            group_id
+            for group_id, control_treaty_id, report_treaty_id
+            in Group._get_group_treaties()
+            if report_treaty_id in current_ratifications
+        ]
 
     @staticmethod
     def get_controlled_groups(party, reporting_period=None):
@@ -157,8 +202,9 @@ class Group(models.Model):
         Returns queryset of all substance Groups for which control measures
         apply for the given party and reporting_period.
         """
-        current_ratifications = Group._get_ratifications(party, reporting_period)
-        return Group.objects.filter(control_treaty_id__in=current_ratifications)
+        return Group.objects.filter(
+            group_id__in=Group.get_controlled_group_ids(party, reporting_period)
+        )
 
     @staticmethod
     def get_report_groups(party, reporting_period=None):
@@ -166,8 +212,9 @@ class Group(models.Model):
         Returns queryset of all substance Groups that party should report in
         given reporting_period.
         """
-        current_ratifications = Group._get_ratifications(party, reporting_period)
-        return Group.objects.filter(report_treaty_id__in=current_ratifications)
+        return Group.objects.filter(
+            group_id__in=Group.get_report_group_ids(party, reporting_period)
+        )
 
     def __str__(self):
         return f'Group {self.group_id}'
@@ -1,17 +1,24 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from django.utils.translation import gettext_lazy as _
 
 from .aggregation import ProdCons, ProdConsMT
+from .control import Baseline, CalculationDirtyKey, Limit
 from .legal import ReportingPeriod
-from .party import Party
+from .party import Party, PartyHistory
 from .reporting import Submission, ObligationTypes
 from .substance import Substance
 from .utils import (
     decimal_zero_if_none, DECIMAL_FIELD_DIGITS, DECIMAL_FIELD_DECIMALS
 )
 
+from ..utils.cache import bump_data_generation
+
 from model_utils import FieldTracker
 
 
@@ -110,33 +117,157 @@ class Transfer(models.Model):
         """
         Populates relevant fields in aggregation tables based on this transfer.
         """
-        for klass, params, potential in self.__class__.get_aggregation_classes(
-            self.substance, self.source_party, self.reporting_period
+        self.__class__.bulk_populate_aggregated_data([self])
+
+    @classmethod
+    def bulk_populate_aggregated_data(cls, transfers):
+        """
+        Adds the given transfers to the aggregation tables.
+
+        The transferred amounts are first summed up in memory, for each
+        party/period/group (ProdCons) and party/period/substance (ProdConsMT),
+        then all affected aggregations are written in bulk, in a single
+        transaction, without going through their save(). The number of
+        queries does not depend on the number of transfers.
+        """
+        transfers = list(transfers)
+        if not transfers:
+            return
+        prefetch_related_objects(
+            transfers, 'source_party', 'reporting_period', 'substance__group'
+        )
+
+        # Deltas are keyed by (party, period, group/substance) ids
+        deltas = {ProdCons: {}, ProdConsMT: {}}
+        related = {ProdCons: {}, ProdConsMT: {}}
+        for transfer in transfers:
+            for klass, params, potential in cls.get_aggregation_classes(
+                transfer.substance, transfer.source_party,
+                transfer.reporting_period
+            ):
+                key = tuple(obj.id for obj in params.values())
+                if key not in deltas[klass]:
+                    deltas[klass][key] = {
+                        'prod_transfer': Decimal('0.0'),
+                        'cons_transfer': Decimal('0.0'),
+                        'submissions': set(),
+                    }
+                    related[klass][key] = params
+                delta = deltas[klass][key]
+                to_add = decimal_zero_if_none(transfer.transferred_amount) * \
+                    decimal_zero_if_none(potential)
+                if transfer.transfer_type == 'P':
+                    delta['prod_transfer'] += to_add
+                elif transfer.transfer_type == 'C':
+                    delta['cons_transfer'] += to_add
+                for submission_id in (
+                    transfer.source_party_submission_id,
+                    transfer.destination_party_submission_id,
+                ):
+                    if submission_id:
+                        delta['submissions'].add(submission_id)
+
+        party_ids = set(key[0] for key in deltas[ProdCons])
+        period_ids = set(key[1] for key in deltas[ProdCons])
+        group_ids = set(key[2] for key in deltas[ProdCons])
+        substance_ids = set(key[2] for key in deltas[ProdConsMT])
+
+        party_histories = {
+            (ph.party_id, ph.reporting_period_id): ph
+            for ph in PartyHistory.objects.filter(
+                party_id__in=party_ids, reporting_period_id__in=period_ids
+            )
+        }
+        limits = defaultdict(list)
+        for limit in Limit.objects.filter(
+            party_id__in=party_ids,
+            reporting_period_id__in=period_ids,
+            group_id__in=group_ids
         ):
-            # Populate aggregation data
-            aggregation, created = klass.objects.get_or_create(**params)
-            to_add = decimal_zero_if_none(self.transferred_amount) * \
-                     decimal_zero_if_none(potential)
-            if self.transfer_type == 'P':
-                existing_value = decimal_zero_if_none(aggregation.prod_transfer)
-                aggregation.prod_transfer = existing_value + to_add
-            elif self.transfer_type == 'C':
-                existing_value = decimal_zero_if_none(aggregation.cons_transfer)
-                aggregation.cons_transfer = existing_value + to_add
+            limits[
+                (limit.party_id, limit.reporting_period_id, limit.group_id)
+            ].append(limit)
+        baselines = defaultdict(list)
+        for baseline in Baseline.objects.filter(
+            party_id__in=party_ids, group_id__in=group_ids
+        ).values('party_id', 'group_id', 'baseline_type__name', 'baseline'):
+            baselines[
+                (baseline['party_id'], baseline['group_id'])
+            ].append(baseline)
+
+        existing = {
+            ProdCons: {
+                (a.party_id, a.reporting_period_id, a.group_id): a
+                for a in ProdCons.objects.filter(
+                    party_id__in=party_ids,
+                    reporting_period_id__in=period_ids,
+                    group_id__in=group_ids
+                )
+            },
+            ProdConsMT: {
+                (a.party_id, a.reporting_period_id, a.substance_id): a
+                for a in ProdConsMT.objects.filter(
+                    party_id__in=party_ids,
+                    reporting_period_id__in=period_ids,
+                    substance_id__in=substance_ids
+                )
+            },
+        }
+
+        obligation_type = ObligationTypes.TRANSFER.value
+        aggregations = {ProdCons: [], ProdConsMT: []}
+        for klass, klass_deltas in deltas.items():
+            for key, delta in klass_deltas.items():
+                aggregation = existing[klass].get(key)
+                if aggregation is None:
+                    aggregation = klass(**related[klass][key])
+                aggregation.prod_transfer = (
+                    decimal_zero_if_none(aggregation.prod_transfer)
+                    + delta['prod_transfer']
+                )
+                aggregation.cons_transfer = (
+                    decimal_zero_if_none(aggregation.cons_transfer)
+                    + delta['cons_transfer']
+                )
+                submissions_set = set(
+                    aggregation.submissions.get(obligation_type, [])
+                )
+                submissions_set.update(delta['submissions'])
+                aggregation.submissions[obligation_type] = list(
+                    submissions_set
+                )
 
-            # Populate submissions list
-            obligation_type = ObligationTypes.TRANSFER.value
-            if obligation_type in aggregation.submissions:
-                submissions_set = set(aggregation.submissions[obligation_type])
-            else:
-                submissions_set = set()
-            if self.source_party_submission:
-                submissions_set.add(self.source_party_submission.id)
-            if self.destination_party_submission:
-                submissions_set.add(self.destination_party_submission.id)
-            aggregation.submissions[obligation_type] = list(submissions_set)
+                # Same steps as in ProdCons.save() and ProdConsMT.save()
+                ph = party_histories.get(key[:2])
+                aggregation.is_article5 = ph.is_article5 if ph else None
+                aggregation.is_eu_member = ph.is_eu_member if ph else None
+                aggregation.calculate_totals()
+                if klass is ProdCons:
+                    aggregation.populate_limits_and_baselines(
+                        limits=limits[key],
+                        baselines=baselines[(key[0], key[2])]
+                    )
+                aggregations[klass].append(aggregation)
+
+        with transaction.atomic():
+            ProdCons.bulk_save(aggregations[ProdCons])
+            ProdConsMT.bulk_save(aggregations[ProdConsMT])
+            CalculationDirtyKey.mark_aggregations(
+                (a.party_id, a.group_id, a.reporting_period_id)
+                for a in aggregations[ProdCons]
+            )
 
-            aggregation.save()
+        # Cache invalidation is done per party, so one signal is enough for
+        # each of them.
+        from ..signals import clear_aggregation_cache_signal
+        parties = {}
+        for aggregation in aggregations[ProdCons]:
+            parties.setdefault(aggregation.party_id, aggregation)
+        for party_id, aggregation in parties.items():
+            bump_data_generation(party_id)
+            clear_aggregation_cache_signal.send_robust(
+                sender=ProdCons, instance=aggregation
+            )
 
     def clear_aggregated_data(self, use_old_values=False):
         if use_old_values:
@@ -260,15 +391,21 @@ class Transfer(models.Model):
 
         super().delete(*args, **kwargs)
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, populate_aggregations=True, **kwargs):
+        """
+        populate_aggregations=False skips updating the aggregation tables;
+        callers saving many transfers use it and then call
+        bulk_populate_aggregated_data() once for all of them.
+        """
         self.full_clean()
 
-        if self.pk or not kwargs.get('force_insert', False):
-            # If this is an edit, delete anything related to the old values
-            self.clear_aggregated_data(use_old_values=True)
+        if populate_aggregations:
+            if self.pk or not kwargs.get('force_insert', False):
+                # If this is an edit, delete anything related to the old values
+                self.clear_aggregated_data(use_old_values=True)
 
-        # Populate aggregation data using current values
-        self.populate_aggregated_data()
+            # Populate aggregation data using current values
+            self.populate_aggregated_data()
 
         super().save(*args, **kwargs)
 
@@ -75,6 +75,7 @@ from .models import (
     ORMReport,
     MultilateralFund,
 )
+from .models.data import BlendCompositionMixin
 from .models.report import Reports
 from ozone.core.api import export_pdf
 
@@ -160,12 +161,25 @@ class BaseBulkUpdateSerializer(serializers.ListSerializer):
 
     def create_single(self, data, instance, submission):
         """Creates a single entry"""
-        obj = instance.create(
+        obj = instance.model(
             submission=submission,
             **data
         )
+        self.save_single(obj, force_insert=True)
         return obj
 
+    def save_single(self, obj, **kwargs):
+        """
+        Saves a single (created or updated) entry. The blend component rows of
+        all entries are updated at once, at the end of update().
+        """
+        if not isinstance(obj, BlendCompositionMixin):
+            obj.save(**kwargs)
+            return
+        if obj.components_changed():
+            self.changed_blend_rows.append(obj)
+        obj.save(expand_components=False, **kwargs)
+
     def update(self, instance, validated_data):
         """
         Updating data reports in a submission will work as follows:
@@ -182,6 +196,8 @@ class BaseBulkUpdateSerializer(serializers.ListSerializer):
         submission = instance.first().submission
         # List of updated/created items to be returned
         ret = []
+        # Saved entries whose blend component rows need to be updated
+        self.changed_blend_rows = []
 
         data_dictionary = self.construct_data_dictionary(validated_data)
 
@@ -195,7 +211,15 @@ class BaseBulkUpdateSerializer(serializers.ListSerializer):
             # existing data is a small price to pay for potentially avoiding
             # a lot of unnecessary updates afterwards (e.g. when a single record
             # changes for an existing submission with a lot of records).
-            for existing_entry in instance:
+            # Related objects used for constructing keys and validating
+            key_relations = [
+                field for field in self.unique_with or ()
+                if instance.model._meta.get_field(field).is_relation
+            ]
+            existing_entries = instance.select_related(
+                'submission', *self.substance_blend_fields, *key_relations
+            )
+            for existing_entry in existing_entries:
                 # Construct the key to lookup the existing entry in data_dict
                 key = self.construct_key(existing_entry)
 
@@ -211,7 +235,7 @@ class BaseBulkUpdateSerializer(serializers.ListSerializer):
                         ret.append(existing_entry)
 
         for existing_entry in ret:
-            existing_entry.save()
+            self.save_single(existing_entry)
 
         # After all that is done, just create the entries that still need to be
         # created (have not been popped out of data_dictionary)
@@ -219,6 +243,9 @@ class BaseBulkUpdateSerializer(serializers.ListSerializer):
             obj = self.create_single(data, instance, submission)
             ret.append(obj)
 
+        if self.changed_blend_rows:
+            instance.model.sync_components(self.changed_blend_rows)
+
         return ret
 
     def create(self, validated_data):
@@ -1710,6 +1737,20 @@ class CreateSubmissionSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class ListSubmissionListSerializer(serializers.ListSerializer):
+    """
+    Evaluates the permission-related fields for all listed submissions at once
+    and passes them to the child serializer through the context.
+    """
+
+    def to_representation(self, data):
+        submissions = list(data.all() if hasattr(data, 'all') else data)
+        self.context['permissions'] = Submission.get_permissions(
+            submissions, self.context['request'].user
+        )
+        return super().to_representation(submissions)
+
+
 class ListSubmissionSerializer(CreateSubmissionSerializer):
     created_at = serializers.DateTimeField()
     updated_at = serializers.DateTimeField()
@@ -1734,22 +1775,27 @@ class ListSubmissionSerializer(CreateSubmissionSerializer):
             )
         )
         extra_kwargs = {'url': {'view_name': 'core:submission-detail'}}
+        list_serializer_class = ListSubmissionListSerializer
+
+    def get_permissions(self, obj):
+        permissions = self.context.get('permissions', {})
+        if obj.pk not in permissions:
+            permissions = Submission.get_permissions(
+                [obj], self.context['request'].user
+            )
+        return permissions[obj.pk]
 
     def get_available_transitions(self, obj):
-        user = self.context['request'].user
-        return obj.available_transitions(user)
+        return self.get_permissions(obj)['available_transitions']
 
     def get_is_cloneable(self, obj):
-        user = self.context['request'].user
-        return obj.is_cloneable(user)
+        return self.get_permissions(obj)['is_cloneable']
 
     def get_can_edit_data(self, obj):
-        user = self.context['request'].user
-        return obj.can_edit_data(user)
+        return self.get_permissions(obj)['can_edit_data']
 
     def get_can_delete_data(self, obj):
-        user = self.context['request'].user
-        return obj.can_delete_data(user)
+        return self.get_permissions(obj)['can_delete_data']
 
 
 class SubmissionHistorySerializer(serializers.ModelSerializer):
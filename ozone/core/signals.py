@@ -1,17 +1,47 @@
 import django.dispatch
 import logging
 
+from django.contrib.auth import get_user_model
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete
+from impersonate.signals import session_begin, session_end
+from rest_framework.authtoken.models import Token
 
+from .authentication import evict_token, evict_user_tokens
+from .utils.cache import bump_data_generation
 from .utils.cache import invalidate_aggregation_cache
 from .utils.cache import invalidate_party_cache
+from .utils.reference_cache import reference_cache
+from .utils.report_cache import report_cache
 
+from ozone.core.models.control import (
+    Baseline,
+    CalculationDirtyKey,
+    ControlMeasure,
+    Limit,
+)
+from ozone.core.models.exemption import (
+    ApprovedCriticalUse,
+    ExemptionApproved,
+    Nomination,
+)
+from ozone.core.models.legal import ReportingPeriod
+from ozone.core.models.meeting import Treaty
 from ozone.core.models.party import (
+    Party,
     PartyDeclaration,
     PartyHistory,
     PartyRatification
 )
+from ozone.core.models.reporting import Submission, SubmissionInfo
+from ozone.core.models.substance import (
+    Annex,
+    Blend,
+    BlendComponent,
+    Group,
+    Substance,
+)
+from ozone.core.models.transfer import Transfer
 from ozone.core.models.country_profile import (
     FocalPoint,
     IllegalTrade,
@@ -66,3 +96,133 @@ country_profile_models = [
 for model in country_profile_models:
     post_save.connect(clear_country_profile_cache, model)
     post_delete.connect(clear_country_profile_cache, model)
+
+
+def mark_transfer_dirty(sender, instance, **kwargs):
+    """
+    BDN transfers are used when calculating baselines of the source party.
+    """
+    CalculationDirtyKey.mark_aggregation(
+        instance.source_party, instance.substance.group,
+        instance.reporting_period
+    )
+
+
+def mark_party_history_dirty(sender, instance, **kwargs):
+    """
+    Party types and EU membership are used for both baselines and limits.
+    """
+    for target in CalculationDirtyKey.Targets:
+        CalculationDirtyKey.mark(
+            target, party=instance.party,
+            reporting_period=instance.reporting_period
+        )
+
+
+def mark_control_measure_dirty(sender, instance, **kwargs):
+    """
+    Control measures affect the limits of all parties for their group.
+    """
+    CalculationDirtyKey.mark(
+        CalculationDirtyKey.Targets.LIMITS, group=instance.group
+    )
+
+
+def mark_baseline_dirty(sender, instance, **kwargs):
+    """
+    Baselines affect the limits of their party/group for all periods.
+    """
+    CalculationDirtyKey.mark(
+        CalculationDirtyKey.Targets.LIMITS, party=instance.party,
+        group=instance.group
+    )
+
+
+def mark_submission_dirty(sender, instance, created=True, **kwargs):
+    """
+    The aggregation summaries count the parties that have submissions.
+    """
+    if created:
+        CalculationDirtyKey.mark(
+            CalculationDirtyKey.Targets.SUMMARIES, party=instance.party,
+            reporting_period=instance.reporting_period
+        )
+
+
+for model, handler in (
+    (Transfer, mark_transfer_dirty),
+    (PartyHistory, mark_party_history_dirty),
+    (ControlMeasure, mark_control_measure_dirty),
+    (Baseline, mark_baseline_dirty),
+    (Submission, mark_submission_dirty),
+):
+    post_save.connect(handler, model)
+    post_delete.connect(handler, model)
+
+
+def clear_limit_cache(sender, instance, **kwargs):
+    """
+    Invalidates cached limits API responses for the limit's party.
+    """
+    bump_data_generation(instance.party_id)
+
+
+post_save.connect(clear_limit_cache, Limit)
+post_delete.connect(clear_limit_cache, Limit)
+
+
+def invalidate_reference_cache(sender, instance, **kwargs):
+    """
+    Drops the cached reference data (see ReferenceCache) in all processes.
+    """
+    reference_cache.invalidate()
+
+
+for model in (
+    Party, PartyHistory, PartyRatification, Group, Substance, ReportingPeriod,
+    Treaty,
+):
+    post_save.connect(invalidate_reference_cache, model)
+    post_delete.connect(invalidate_reference_cache, model)
+
+
+def invalidate_report_cache(sender, instance, **kwargs):
+    """
+    Makes the cached reports stale. Only needed for data not covered by the
+    fingerprint of the report cache (see ReportCache).
+    """
+    report_cache.invalidate()
+
+
+for model in (
+    Party, PartyRatification, Group, Annex, Substance, Blend, BlendComponent,
+    ReportingPeriod, Treaty, SubmissionInfo, Transfer, Nomination,
+    ExemptionApproved, ApprovedCriticalUse,
+):
+    post_save.connect(invalidate_report_cache, model)
+    post_delete.connect(invalidate_report_cache, model)
+
+
+def evict_cached_token(sender, instance, **kwargs):
+    evict_token(instance.key)
+
+
+def evict_cached_user_tokens(sender, instance, **kwargs):
+    """
+    Cached tokens include their user, which might have been deactivated.
+    """
+    evict_user_tokens(instance.pk)
+
+
+def evict_impersonation_tokens(sender, impersonator, impersonating, **kwargs):
+    for user in (impersonator, impersonating):
+        if user is not None:
+            evict_user_tokens(user.pk)
+
+
+post_save.connect(evict_cached_token, Token)
+post_delete.connect(evict_cached_token, Token)
+post_save.connect(evict_cached_user_tokens, get_user_model())
+post_delete.connect(evict_cached_user_tokens, get_user_model())
+session_begin.connect(evict_impersonation_tokens)
+session_end.connect(evict_impersonation_tokens)
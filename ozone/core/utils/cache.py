@@ -1,26 +1,150 @@
-import concurrent.futures
+import atexit
 import logging
+import threading
+import time
 import requests
 from requests.auth import HTTPBasicAuth
 
 from django.conf import settings
-
-
-pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+from django.core.cache import caches
+from django.db import transaction
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
-def invalidate_party_cache(party_id):
+class InvalidationQueue:
+    """
+    Coalescing queue of parties whose data needs to be invalidated in the
+    cache of the main website.
+
+    Party ids are deduplicated while waiting to be sent and flushed in
+    batches by a background thread, after a short coalescing window, so bulk
+    operations (imports, aggregation rebuilds) only produce one request per
+    party. Failed requests are retried with exponential backoff and dropped
+    after too many attempts.
+
+    The queue lives in memory; whatever is still pending when the process
+    exits is flushed by an atexit handler. Processes exiting without running
+    atexit handlers (like multiprocessing pool workers) need to call
+    flush(force=True) themselves once done.
+    """
+
+    def __init__(self, send=None):
+        self.send = send if send is not None else send_invalidation_request
+        self.lock = threading.Lock()
+        # Keyed by party id, values are (attempts, not_before) tuples
+        self.pending = {}
+        self.thread = None
+        self.stats = {
+            'queued': 0,
+            'coalesced': 0,
+            'sent': 0,
+            'retried': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'last_flush_latency': None,
+            'max_flush_latency': None,
+        }
+
+    def add(self, party_id):
+        with self.lock:
+            if party_id in self.pending:
+                self.stats['coalesced'] += 1
+                return
+            if len(self.pending) >= int(settings.CACHE_INVALIDATION_MAX_PENDING):
+                self.stats['dropped'] += 1
+                logger.error(
+                    f'Cache invalidation queue full, dropping party {party_id}'
+                )
+                return
+            self.pending[party_id] = (0, 0)
+            self.stats['queued'] += 1
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(
+                target=self._run, name='cache-invalidation', daemon=True
+            )
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(float(settings.CACHE_INVALIDATION_DELAY))
+            self.flush()
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+
+    def _take_batch(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            batch = {
+                party_id: attempts
+                for party_id, (attempts, not_before) in self.pending.items()
+                if force or not_before <= now
+            }
+            for party_id in batch:
+                del self.pending[party_id]
+        return batch
+
+    def flush(self, force=False):
+        """
+        Sends the pending invalidations which are not waiting for a retry
+        (or all of them, if `force` is True). Returns the number of parties
+        successfully invalidated.
+        """
+        batch = self._take_batch(force)
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        sent = 0
+        max_retries = int(settings.CACHE_INVALIDATION_RETRIES)
+        backoff = float(settings.CACHE_INVALIDATION_BACKOFF)
+        for party_id, attempts in sorted(batch.items()):
+            try:
+                self.send(party_id)
+            except Exception:
+                attempts += 1
+                if attempts > max_retries or force:
+                    logger.exception(
+                        f'Error while invalidating cache for party {party_id}'
+                    )
+                    with self.lock:
+                        self.stats['dropped'] += 1
+                    continue
+                not_before = time.monotonic() + backoff * 2 ** (attempts - 1)
+                with self.lock:
+                    self.stats['retried'] += 1
+                    # Newer requests for the same party need not be retried
+                    self.pending.setdefault(party_id, (attempts, not_before))
+            else:
+                sent += 1
+
+        latency = time.monotonic() - started
+        with self.lock:
+            self.stats['sent'] += sent
+            self.stats['flushes'] += 1
+            self.stats['last_flush_latency'] = latency
+            self.stats['max_flush_latency'] = max(
+                latency, self.stats['max_flush_latency'] or 0
+            )
+        return sent
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, queue_depth=len(self.pending))
+
+
+def send_invalidation_request(party_id):
     """
     For now, due to limitations on the Drupal side, invalidation works by
     invalidating all data for a specific party.
     """
-    url = settings.CACHE_INVALIDATION_URL
-    if url is None:
-        return
     try:
         timeout = float(settings.CACHE_INVALIDATION_TIMEOUT)
     except ValueError:
@@ -36,18 +160,33 @@ def invalidate_party_cache(party_id):
     auth = HTTPBasicAuth(
         settings.CACHE_INVALIDATION_USER, settings.CACHE_INVALIDATION_PASS
     )
-    url = f'{url}?party={party_id}'
-    pool.submit(requests.get, url, timeout=timeout, auth=auth)
+    url = f'{settings.CACHE_INVALIDATION_URL}?party={party_id}'
+    response = requests.get(url, timeout=timeout, auth=auth)
+    response.raise_for_status()
 
     logger.info('Done invalidating')
 
 
+invalidation_queue = InvalidationQueue()
+atexit.register(invalidation_queue.flush, force=True)
+
+
+def invalidate_party_cache(party_id):
+    """
+    Queues the invalidation of the main website's cache for this party.
+    """
+    if settings.CACHE_INVALIDATION_URL is None:
+        return
+    invalidation_queue.add(party_id)
+
+
 def invalidate_aggregation_cache(instance):
     """
     Used to invalidate entries in the aggregation cache based on the ProdCons
     instance that was added/modified/deleted.
     """
-    invalidate_party_cache(instance.party.id)
+    bump_data_generation(instance.party_id)
+    invalidate_party_cache(instance.party_id)
 
 
 def invalidate_aggregations_cache(aggregation_dict_list):
@@ -59,3 +198,70 @@ def invalidate_aggregations_cache(aggregation_dict_list):
     party_id_set = set([item['party'] for item in aggregation_dict_list])
     for party_id in party_id_set:
         invalidate_party_cache(party_id)
+
+
+API_CACHE_ALIAS = 'api'
+
+
+def get_api_cache():
+    """
+    Returns the cache used for API responses, or None if it is not configured.
+    """
+    if API_CACHE_ALIAS not in settings.CACHES:
+        return None
+    return caches[API_CACHE_ALIAS]
+
+
+def _generation_key(party_id=None):
+    if party_id is None:
+        return 'generation:all'
+    return f'generation:party:{party_id}'
+
+
+def _initial_generation():
+    # Counters may be evicted; starting from the current time ensures they
+    # never go back to a value used by previously cached responses.
+    return int(time.time() * 1000)
+
+
+def get_data_generations(party_ids=None):
+    """
+    Returns the data generation counters for the given parties (or the global
+    one if no parties are given), to be used as part of API cache keys.
+    """
+    cache = get_api_cache()
+    if cache is None:
+        return None
+    keys = (
+        [_generation_key(party_id) for party_id in sorted(party_ids)]
+        if party_ids else [_generation_key()]
+    )
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_data_generation(party_id):
+    """
+    Invalidates the cached API responses that include data of this party, by
+    incrementing its data generation and the global one.
+
+    This is done after the current transaction is committed, so responses
+    computed in the meantime are cached using the old generation.
+    """
+    cache = get_api_cache()
+    if cache is None:
+        return
+
+    def bump():
+        for key in (_generation_key(), _generation_key(party_id)):
+            try:
+                cache.add(key, _initial_generation(), None)
+                cache.incr(key)
+            except Exception:
+                logger.exception('Error while bumping data generation.')
+
+    transaction.on_commit(bump)
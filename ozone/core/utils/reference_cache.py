@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .cache import get_api_cache, _initial_generation
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache:
+    """
+    Process-wide cache of nearly static reference data (parties and their
+    history, ratifications, groups, reporting periods), so that hot paths
+    do not query the database for it again and again.
+
+    Values are kept in a dictionary local to the process and are dropped
+    whenever reference data changes (see invalidate(), connected to the
+    post_save/post_delete signals of the reference models):
+    - in the process making the change, once its transaction is committed;
+    - in other processes, through a generation stamp kept in the shared API
+      cache, which is checked at most once every
+      settings.REFERENCE_CACHE_CHECK_INTERVAL seconds. If the API cache is
+      not configured, values are simply dropped after that interval.
+
+    A thread that has changed reference data in its current transaction
+    bypasses the cache until the transaction is committed or the change is
+    rolled back, so it sees its own changes and never caches uncommitted
+    data.
+    """
+
+    GENERATION_KEY = 'generation:reference'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.generation = None
+        self.checked_at = None
+        self.local = threading.local()
+
+    def _get_generation(self):
+        cache = get_api_cache()
+        if cache is None:
+            return None
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            cache.add(self.GENERATION_KEY, _initial_generation(), None)
+            generation = cache.get(self.GENERATION_KEY)
+        return generation
+
+    def _check(self):
+        """
+        Drops all values if the generation stamp has changed (or if there is
+        no stamp and they are too old). Called with the lock held.
+        """
+        now = time.monotonic()
+        if (
+            self.checked_at is not None
+            and now - self.checked_at < float(
+                settings.REFERENCE_CACHE_CHECK_INTERVAL
+            )
+        ):
+            return
+        generation = self._get_generation()
+        if generation is None or generation != self.generation:
+            self.values = {}
+            self.generation = generation
+        self.checked_at = now
+
+    def _is_dirty(self):
+        pending = getattr(self.local, 'pending', None)
+        if not pending:
+            return False
+        # An invalidation is pending as long as its on_commit callback is
+        # registered. Callbacks are dropped once the transaction is committed
+        # or rolled back, including rollbacks to a savepoint set before the
+        # change (and the atomic block of each request, with ATOMIC_REQUESTS).
+        registered = {id(func) for _sids, func in connection.run_on_commit}
+        self.local.pending = [
+            func for func in pending if id(func) in registered
+        ]
+        return bool(self.local.pending)
+
+    def get(self, key, compute):
+        """
+        Returns the value cached for the given (hashable) key, calling
+        `compute` to get it if needed. Cached values are shared by all
+        threads and must not be modified.
+        """
+        if self._is_dirty():
+            return compute()
+        with self.lock:
+            self._check()
+            values = self.values
+            if key in values:
+                return values[key]
+        value = compute()
+        with self.lock:
+            # Values computed while the cache was cleared are discarded
+            # along with the old dictionary.
+            values[key] = value
+        return value
+
+    def clear(self):
+        """
+        Drops all values cached by this process.
+        """
+        with self.lock:
+            self.values = {}
+            self.checked_at = None
+
+    def invalidate(self):
+        """
+        Drops the cached values in all processes, after the current
+        transaction is committed. Needs to be called explicitly after changing
+        reference data without sending signals (e.g. using update()).
+        """
+        cache = get_api_cache()
+
+        def bump():
+            if cache is not None:
+                try:
+                    cache.add(self.GENERATION_KEY, _initial_generation(), None)
+                    cache.incr(self.GENERATION_KEY)
+                except Exception:
+                    logger.exception('Error while bumping reference generation.')
+            self.clear()
+
+        transaction.on_commit(bump)
+        if connection.in_atomic_block:
+            if getattr(self.local, 'pending', None) is None:
+                self.local.pending = []
+            self.local.pending.append(bump)
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import translation
+
+from ..models import Baseline, Limit, PartyHistory, ProdCons, Submission
+from .cache import get_api_cache, _initial_generation
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCache:
+    """
+    On-disk cache of rendered reports.
+
+    Entries are keyed by the report name, its (normalized) parameters, the
+    active language and a fingerprint of the data, so they never need to be
+    invalidated explicitly: any change of the data produces new keys and the
+    stale entries are eventually evicted.
+
+    The total size of the cache is bounded by settings.REPORT_CACHE_MAX_SIZE
+    (in bytes, 0 disables the cache); least recently used entries are evicted
+    first.
+
+    Changes of the other data shown in reports (names of parties and
+    substances, submission info, transfers, exemptions etc.) are tracked
+    using a generation stamp in the shared API cache, bumped by invalidate()
+    (see signals). Reports are not cached if the API cache is not configured.
+    """
+
+    GENERATION_KEY = 'generation:reports'
+    # Temporary files of interrupted writes are removed after this many
+    # seconds
+    TMP_FILE_MAX_AGE = 3600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return settings.REPORT_CACHE_DIR
+
+    @property
+    def max_size(self):
+        return int(settings.REPORT_CACHE_MAX_SIZE)
+
+    @staticmethod
+    def get_fingerprint():
+        """
+        Reports only use submitted data, aggregations, baselines, limits and
+        party history (EU membership, Article 5 status). Submitted data cannot
+        be changed without changing the submission itself, so the latest
+        update (and the number of rows, to catch deletions) of these tables is
+        enough to detect changes.
+        """
+        fingerprint = []
+        for model in (Submission, ProdCons, Baseline, Limit, PartyHistory):
+            stats = model.objects.order_by().aggregate(
+                max_updated_at=Max('updated_at'), row_count=Count('id')
+            )
+            fingerprint.append([
+                stats['max_updated_at'].isoformat()
+                if stats['max_updated_at'] else None,
+                stats['row_count'],
+            ])
+        return fingerprint
+
+    def get_generation(self):
+        cache = get_api_cache()
+        if cache is None:
+            return None
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            cache.add(self.GENERATION_KEY, _initial_generation(), None)
+            generation = cache.get(self.GENERATION_KEY)
+        return generation
+
+    def invalidate(self):
+        """
+        Makes all cached reports stale, after the current transaction is
+        committed.
+        """
+        cache = get_api_cache()
+        if cache is None:
+            return
+
+        def bump():
+            try:
+                cache.add(self.GENERATION_KEY, _initial_generation(), None)
+                cache.incr(self.GENERATION_KEY)
+            except Exception:
+                logger.exception('Error while bumping reports generation.')
+
+        transaction.on_commit(bump)
+
+    def get_key(self, report, params, generation):
+        payload = json.dumps(
+            [
+                report,
+                {name: sorted(values) for name, values in params.items()},
+                translation.get_language(),
+                generation,
+                self.get_fingerprint(),
+            ],
+            sort_keys=True,
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get_file_path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get_name_path(self, key):
+        return os.path.join(self.directory, f'{key}.name')
+
+    def get(self, key):
+        """
+        Returns a (base file name, open file) tuple, or None if the report is
+        not cached.
+        """
+        try:
+            with open(self.get_name_path(key)) as f:
+                base_name = f.read()
+            buf = open(self.get_file_path(key), 'rb')
+        except OSError:
+            return None
+        # The modification time is used for evicting the least recently used
+        try:
+            os.utime(self.get_file_path(key))
+        except OSError:
+            pass
+        return base_name, buf
+
+    def put(self, key, base_name, buf):
+        """
+        Stores the report and returns it as a (base file name, open file)
+        tuple, to be used instead of the (already consumed) buffer.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = f'{os.getpid()}.{threading.get_ident()}.tmp'
+        tmp_path = f'{self.get_file_path(key)}.{suffix}'
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(buf, f)
+        tmp_name_path = f'{self.get_name_path(key)}.{suffix}'
+        with open(tmp_name_path, 'w') as f:
+            f.write(base_name)
+        os.replace(tmp_name_path, self.get_name_path(key))
+        os.replace(tmp_path, self.get_file_path(key))
+        self.evict()
+        return base_name, open(self.get_file_path(key), 'rb')
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in the
+        configured size.
+        """
+        with self.lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                key, ext = os.path.splitext(name)
+                if ext not in ('.pdf', '.tmp'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if ext == '.pdf':
+                    entries.append((stat.st_mtime, stat.st_size, key))
+                elif now - stat.st_mtime > self.TMP_FILE_MAX_AGE:
+                    # Left behind by an interrupted put()
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+            total_size = sum(size for _mtime, size, _key in entries)
+            for _mtime, size, key in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                for path in (self.get_file_path(key), self.get_name_path(key)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total_size -= size
+                logger.debug(f'Evicted cached report {key}')
+
+    def get_or_build(self, report, params, build):
+        """
+        Returns the cached report, or calls `build` (which must return a
+        (base file name, file-like object) tuple) and caches its result.
+        """
+        if self.max_size <= 0:
+            return build()
+        generation = self.get_generation()
+        if generation is None:
+            # Changes of some of the data could not be detected
+            return build()
+        key = self.get_key(report, params, generation)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        base_name, buf = build()
+        return self.put(key, base_name, buf)
+
+
+report_cache = ReportCache()
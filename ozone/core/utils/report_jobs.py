@@ -0,0 +1,260 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import translation
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReportJobs:
+    """
+    Generates reports in background threads, with bounded concurrency.
+
+    The status of each job and the generated file are kept on disk (in
+    settings.REPORT_JOBS_DIR), so they are visible to all server processes,
+    and are removed after settings.REPORT_JOBS_TTL seconds.
+
+    Job ids are derived from the report name, its parameters and the scope of
+    the user requesting it, so identical requests share the same job.
+
+    Queued and running jobs are considered lost (and can be submitted again)
+    when their status has not been refreshed for settings.REPORT_JOBS_TIMEOUT
+    seconds; it is refreshed along with the progress of the job. Jobs still
+    queued or running in this process are never considered lost, and a lost
+    job that eventually finishes does not overwrite the status of its
+    replacement.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # Minimum interval (in seconds) between progress updates of a job
+    PROGRESS_INTERVAL = 1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        # Status of the job run by the current worker thread
+        self.local = threading.local()
+        # Run ids of the jobs queued or running in this process, by job id
+        self.active = {}
+
+    @property
+    def directory(self):
+        return settings.REPORT_JOBS_DIR
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(settings.REPORT_JOBS_WORKERS)
+                )
+            return self.executor
+
+    @staticmethod
+    def get_job_id(report, params, scope):
+        payload = json.dumps([report, params, scope], sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get_status_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def get_file_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.pdf')
+
+    def get(self, job_id):
+        """
+        Returns the status of the job as a dictionary, or None if there is no
+        such (unexpired) job.
+        """
+        try:
+            with open(self.get_status_path(job_id)) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.is_expired(status):
+            return None
+        return status
+
+    def is_expired(self, status):
+        now = time.time()
+        if status['status'] in (self.QUEUED, self.RUNNING):
+            with self.lock:
+                if self.active.get(status['id']) == status.get('run_id'):
+                    return False
+            # The process running the job might have been killed
+            heartbeat_at = status.get('heartbeat_at', status['created_at'])
+            return now - heartbeat_at > float(
+                settings.REPORT_JOBS_TIMEOUT
+            )
+        return now - status['created_at'] > float(settings.REPORT_JOBS_TTL)
+
+    def _write_status(self, status, exclusive=False):
+        path = self.get_status_path(status['id'])
+        if exclusive:
+            # Fails if another process has just submitted the same job
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(status, f)
+            return
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+
+    def _is_replaced(self, status):
+        """
+        Whether the job has been removed or replaced (after being considered
+        lost) since this process started it.
+        """
+        try:
+            with open(self.get_status_path(status['id'])) as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            return True
+        return current.get('run_id') != status['run_id']
+
+    def _write_own_status(self, status):
+        if not self._is_replaced(status):
+            self._write_status(status)
+
+    def _remove(self, job_id):
+        for path in (self.get_status_path(job_id), self.get_file_path(job_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self):
+        """
+        Removes expired jobs and their files.
+        """
+        for name in os.listdir(self.directory):
+            job_id, ext = os.path.splitext(name)
+            if ext != '.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if self.is_expired(status):
+                self._remove(job_id)
+
+    def submit(self, report, params, scope, build):
+        """
+        Starts generating the report, unless an identical job is already
+        queued, running or done. `build` is called in a worker thread and must
+        return a (base file name, file-like object) tuple.
+
+        Returns the status of the job.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+
+        job_id = self.get_job_id(report, params, scope)
+        status = self.get(job_id)
+        if status is not None and status['status'] != self.FAILED:
+            return status
+
+        self._remove(job_id)
+        now = time.time()
+        status = {
+            'id': job_id,
+            'run_id': uuid.uuid4().hex,
+            'report': report,
+            'scope': scope,
+            'status': self.QUEUED,
+            'created_at': now,
+            'heartbeat_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'filename': None,
+            'error': None,
+            'progress': None,
+        }
+        try:
+            self._write_status(status, exclusive=True)
+        except FileExistsError:
+            return self.get(job_id)
+
+        with self.lock:
+            self.active[job_id] = status['run_id']
+        language = translation.get_language()
+        self.get_executor().submit(self._run, status, build, language)
+        return status
+
+    def report_progress(self, **progress):
+        """
+        Records the progress of the job run by the current thread, if any
+        (e.g. the number of pages rendered so far). Can be called as often as
+        needed, as the status is only rewritten every PROGRESS_INTERVAL.
+        """
+        status = getattr(self.local, 'status', None)
+        if status is None:
+            return
+        now = time.time()
+        status['progress'] = progress
+        if now - self.local.progress_written_at >= self.PROGRESS_INTERVAL:
+            self.local.progress_written_at = now
+            status['heartbeat_at'] = now
+            self._write_own_status(status)
+
+    def _run(self, status, build, language):
+        now = time.time()
+        status = dict(
+            status, status=self.RUNNING, started_at=now, heartbeat_at=now
+        )
+        self._write_own_status(status)
+        self.local.status = status
+        self.local.progress_written_at = 0
+        try:
+            # Same as for requests (ATOMIC_REQUESTS)
+            with translation.override(language), transaction.atomic():
+                base_name, buf = build()
+            with buf:
+                tmp_path = (
+                    f'{self.get_file_path(status["id"])}.{status["run_id"]}'
+                    f'.tmp'
+                )
+                with open(tmp_path, 'wb') as f:
+                    shutil.copyfileobj(buf, f)
+            if self._is_replaced(status):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, self.get_file_path(status['id']))
+            status.update(
+                status=self.DONE,
+                filename=base_name,
+                finished_at=time.time(),
+            )
+        except Exception as e:
+            logger.exception(f"Error while generating report {status['id']}")
+            status.update(
+                status=self.FAILED,
+                error=str(e),
+                finished_at=time.time(),
+            )
+        finally:
+            self.local.status = None
+            # Worker threads do not go through the request cycle
+            connection.close()
+        self._write_own_status(status)
+        with self.lock:
+            if self.active.get(status['id']) == status['run_id']:
+                del self.active[status['id']]
+
+
+report_jobs = ReportJobs()
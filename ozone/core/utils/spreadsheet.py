@@ -1,10 +1,37 @@
 from collections import OrderedDict
 import csv
+import hashlib
 import json
-from datetime import datetime
+import os
+import shutil
+from datetime import date, datetime, time
+from itertools import islice
 import openpyxl
 
 
+def load_xlsx(path):
+    """
+    Opens the workbook in read-only mode: rows are parsed while being
+    iterated, instead of loading all the cells of all sheets at once.
+    """
+    return openpyxl.load_workbook(filename=str(path), read_only=True)
+
+
+def iter_xlsx_values(sheet):
+    """
+    Yields the values of each row of the sheet (the first one being the
+    header) as tuples.
+    """
+    for row in sheet.rows:
+        yield tuple(cell.value for cell in row)
+
+
+def make_row(header, values):
+    # Rows missing from read-only sheets are yielded as empty tuples
+    values = tuple(values) + (None,) * (len(header) - len(values))
+    return dict(zip(header, values))
+
+
 class DefaultConverter:
 
     def to_csv(self, value, column):
@@ -15,19 +42,41 @@ class DefaultConverter:
 
 
 class Table:
+    """
+    `rows` is either an iterable of rows, which is loaded in memory, or a
+    callable returning such an iterable. The callable is called every time
+    the rows are iterated, so large tables can be written out (see
+    `Spreadsheet.dump_xlsx`) without ever holding all their rows in memory.
+    """
 
     converter_cls = DefaultConverter
 
     def __init__(self, header=[], rows=[]):
         self.header = list(header)
-        self.rows = list(rows)
+        if callable(rows):
+            self._rows = rows
+        else:
+            self._rows = list(rows)
+
+    @property
+    def rows(self):
+        if callable(self._rows):
+            return self._rows()
+        return self._rows
 
     @classmethod
-    def from_xlsx_sheet(cls, sheet):
-        values = list(sheet.values)
-        headers = values[0]
-        rows = (dict(zip(headers, row)) for row in values[1:])
-        return cls(headers, rows)
+    def from_xlsx_sheet(cls, sheet, lazy=False):
+        """
+        With `lazy`, the rows are read from the sheet (which must stay open)
+        every time they are iterated, instead of being loaded in memory.
+        """
+        header = next(iter_xlsx_values(sheet), ())
+
+        def rows():
+            for values in islice(iter_xlsx_values(sheet), 1, None):
+                yield make_row(header, values)
+
+        return cls(header, rows if lazy else rows())
 
     @classmethod
     def from_csv(cls, path):
@@ -49,12 +98,11 @@ class Table:
             return cls(reader.fieldnames, rows)
 
     def dump_xlsx_sheet(self, sheet):
-        for (c, col) in enumerate(self.header, start=1):
-            sheet.cell(row=1, column=c).value = col
+        # Only appending is supported by write-only worksheets
+        sheet.append(self.header)
 
-        for (r, row) in enumerate(self.rows, start=2):
-            for (c, col) in enumerate(self.header, start=1):
-                sheet.cell(row=r, column=c).value = row[col]
+        for row in self.rows:
+            sheet.append([row[col] for col in self.header])
 
     def dump_csv(self, path):
         converter = self.converter_cls()
@@ -85,13 +133,21 @@ class Spreadsheet:
         self.tables = OrderedDict()
 
     @classmethod
-    def from_xlsx(cls, path):
-        wb = openpyxl.load_workbook(filename=path)
+    def from_xlsx(cls, path, lazy=False):
+        """
+        With `lazy`, the workbook is kept open for reading the rows later.
+        Otherwise it is closed once all the rows are loaded.
+        """
+        wb = load_xlsx(path)
         spreadsheet = cls()
 
-        for sheet in wb:
-            table = spreadsheet.table_cls.from_xlsx_sheet(sheet)
-            spreadsheet.tables[sheet.title] = table
+        try:
+            for sheet in wb:
+                table = spreadsheet.table_cls.from_xlsx_sheet(sheet, lazy=lazy)
+                spreadsheet.tables[sheet.title] = table
+        finally:
+            if not lazy:
+                wb.close()
 
         return spreadsheet
 
@@ -109,8 +165,12 @@ class Spreadsheet:
         return spreadsheet
 
     def dump_xlsx(self, path):
-        workbook = openpyxl.Workbook()
-        workbook.remove_sheet(workbook.active)
+        """
+        Writes the spreadsheet to `path` (a file name or a binary file-like
+        object). Rows are streamed to disk one by one (openpyxl write-only
+        mode), so memory usage does not depend on the size of the tables.
+        """
+        workbook = openpyxl.Workbook(write_only=True)
 
         for name, table in self.tables.items():
             table.dump_xlsx_sheet(workbook.create_sheet(name))
@@ -219,3 +279,149 @@ class OzoneTable(Table):
 class OzoneSpreadsheet(Spreadsheet):
 
     table_cls = OzoneTable
+
+
+class JSONRowEncoder(json.JSONEncoder):
+
+    def default(self, value):
+        if isinstance(value, datetime):
+            return {'$datetime': value.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+        if isinstance(value, date):
+            return {'$date': value.strftime('%Y-%m-%d')}
+        if isinstance(value, time):
+            return {'$time': value.strftime('%H:%M:%S.%f')}
+        return super().default(value)
+
+
+def decode_json_value(obj):
+    if '$datetime' in obj:
+        return datetime.strptime(obj['$datetime'], '%Y-%m-%dT%H:%M:%S.%f')
+    if '$date' in obj:
+        return datetime.strptime(obj['$date'], '%Y-%m-%d').date()
+    if '$time' in obj:
+        return datetime.strptime(obj['$time'], '%H:%M:%S.%f').time()
+    return obj
+
+
+class GroupedWorkbook:
+    """
+    Rows of all the sheets of a workbook, grouped by a key computed from each
+    row (e.g. the CntryID and PeriodID columns).
+
+    The workbook is streamed once (in read-only mode) into an on-disk cache:
+    a directory named after the hash of the file, holding a JSON lines file
+    for each sheet and an index of the rows of each group. Groups are then
+    read from the cache one at a time, so the workbook is never loaded in
+    memory, and later runs on the same file skip parsing it.
+
+    `get_key` returns a (JSON-serializable) tuple for a row, or None for
+    rows to be skipped. As the index depends on it, commands using different
+    keys need different cache directories.
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, path, get_key, cache_dir, use_cache=True):
+        self.path = path
+        self.get_key = get_key
+        self.directory = os.path.join(cache_dir, self.get_file_hash(path))
+        if not use_cache or not os.path.exists(self.directory):
+            self.build()
+
+        with open(os.path.join(self.directory, self.INDEX)) as f:
+            meta = json.load(f)
+        self.sheets = meta['sheets']
+        self.index = OrderedDict(
+            (tuple(key), offsets) for key, offsets in meta['groups']
+        )
+
+    @staticmethod
+    def get_file_hash(path):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def get_sheet_path(self, directory, position):
+        # Sheet titles are not necessarily valid file names
+        return os.path.join(directory, f'{position}.jsonl')
+
+    def build(self):
+        tmp_dir = f'{self.directory}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        sheets = []
+        groups = OrderedDict()
+        encoder = JSONRowEncoder()
+        workbook = load_xlsx(self.path)
+        try:
+            for position, sheet in enumerate(workbook):
+                sheets.append(sheet.title)
+                values = iter_xlsx_values(sheet)
+                header = next(values, ())
+                sheet_path = self.get_sheet_path(tmp_dir, position)
+                with open(sheet_path, 'wb') as f:
+                    for row_values in values:
+                        row = make_row(header, row_values)
+                        key = self.get_key(row)
+                        if key is None:
+                            continue
+                        offsets = groups.setdefault(key, {})
+                        offsets.setdefault(sheet.title, []).append(f.tell())
+                        f.write(encoder.encode(row).encode('utf8') + b'\n')
+        finally:
+            workbook.close()
+
+        with open(os.path.join(tmp_dir, self.INDEX), 'w') as f:
+            json.dump({
+                'sheets': sheets,
+                'groups': list(groups.items()),
+            }, f)
+
+        # Replace any previous cache atomically
+        old_dir = f'{self.directory}.{os.getpid()}.old'
+        try:
+            os.rename(self.directory, old_dir)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rename(tmp_dir, self.directory)
+        except OSError:
+            # Another process has just built the cache for the same file,
+            # which is complete as soon as it exists (see above).
+            if not os.path.exists(os.path.join(self.directory, self.INDEX)):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def keys(self):
+        return list(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, key):
+        """
+        Returns a {sheet title: [rows]} dict for the group, with an empty list
+        for the sheets that have no rows in the group.
+        """
+        offsets = self.index[key]
+        group = OrderedDict()
+        for position, title in enumerate(self.sheets):
+            group[title] = []
+            if title not in offsets:
+                continue
+            with open(self.get_sheet_path(self.directory, position), 'rb') as f:
+                for offset in offsets[title]:
+                    f.seek(offset)
+                    group[title].append(json.loads(
+                        f.readline().decode('utf8'),
+                        object_hook=decode_json_value,
+                    ))
+        return group
+
+    def items(self):
+        for key in self.index:
+            yield key, self[key]
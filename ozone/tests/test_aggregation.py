@@ -0,0 +1,493 @@
+import os
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIRequestFactory
+
+from ozone.core.management.commands import calculate_aggregations
+from ozone.core.management.commands.calculate_aggregations import (
+    Command as CalculateAggregationsCommand,
+)
+from ozone.core.models import (
+    AggregationSummary, CalculationDirtyKey, ProdCons, ProdConsMT, Submission,
+    Transfer,
+)
+
+from ozone.core.api.views import AggregationViewSet
+from ozone.core.utils.cache import _generation_key, get_api_cache
+
+from .base import BaseTests
+from .factories import (
+    AnotherPartyFactory,
+    ExportFactory,
+    GroupFactory,
+    ImportFactory,
+    LanguageEnFactory,
+    ObligationFactory,
+    PartyFactory,
+    PartyHistoryFactory,
+    RegionFactory,
+    ReportingChannelFactory,
+    ReportingPeriodFactory,
+    SecretariatUserFactory,
+    SubmissionFactory,
+    SubregionFactory,
+    SubstanceFactory,
+    AnotherSubstanceFactory,
+    TreatyFactory,
+)
+
+
+class AggregationTests(BaseTests):
+
+    def setUp(self):
+        super().setUp()
+        self.region = RegionFactory.create()
+        self.subregion = SubregionFactory.create(region=self.region)
+        self.party = PartyFactory(subregion=self.subregion)
+        self.party.parent_party = self.party
+        self.party.save()
+        self.period = ReportingPeriodFactory.create(
+            name="2018",
+            start_date=datetime.strptime('2018-01-01', '%Y-%m-%d'),
+            end_date=datetime.strptime('2018-12-31', '%Y-%m-%d')
+        )
+        PartyHistoryFactory(
+            party=self.party, reporting_period=self.period,
+            is_eu_member=False
+        )
+        self.obligation = ObligationFactory.create()
+        self.language = LanguageEnFactory()
+        hash_alg = Argon2PasswordHasher()
+        self.secretariat_user = SecretariatUserFactory(
+            language=self.language,
+            password=hash_alg.encode(password='qwe123qwe', salt='123salt123')
+        )
+        ReportingChannelFactory()
+
+        treaty = TreatyFactory()
+        self.group = GroupFactory(
+            group_id='AI', control_treaty=treaty, report_treaty=treaty
+        )
+        self.substance = SubstanceFactory(group=self.group, odp=Decimal('0.5'))
+        self.another_substance = AnotherSubstanceFactory(
+            group=self.group, odp=Decimal('2')
+        )
+
+    def create_submission(self, party=None):
+        submission = SubmissionFactory.create(
+            party=party or self.party,
+            reporting_period=self.period,
+            obligation=self.obligation,
+            created_by=self.secretariat_user,
+            last_edited_by=self.secretariat_user,
+        )
+        Submission.objects.filter(pk=submission.pk).update(
+            flag_has_reported_a1=True
+        )
+        return Submission.objects.get(pk=submission.pk)
+
+    def test_fill_aggregated_data(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.substance,
+            quantity_total_new=Decimal('10'), quantity_feedstock=Decimal('2')
+        )
+        ImportFactory(
+            submission=submission, substance=self.another_substance,
+            quantity_total_new=Decimal('1')
+        )
+        ExportFactory(
+            submission=submission, substance=self.substance,
+            quantity_total_new=Decimal('4')
+        )
+
+        ids = submission.fill_aggregated_data()
+
+        aggregation = ProdCons.objects.get(
+            party=self.party, reporting_period=self.period, group=self.group
+        )
+        self.assertEqual(ids, [aggregation.id])
+        self.assertEqual(aggregation.import_new, Decimal('7'))
+        self.assertEqual(aggregation.import_feedstock, Decimal('1'))
+        self.assertEqual(aggregation.export_new, Decimal('2'))
+        self.assertEqual(aggregation.calculated_consumption, Decimal('4'))
+        self.assertFalse(aggregation.is_eu_member)
+        self.assertEqual(aggregation.submissions, {'art7': [submission.id]})
+
+        mt_aggregation = ProdConsMT.objects.get(
+            party=self.party, reporting_period=self.period,
+            substance=self.substance
+        )
+        self.assertEqual(mt_aggregation.import_new, Decimal('10'))
+        self.assertEqual(mt_aggregation.export_new, Decimal('4'))
+        self.assertEqual(ProdConsMT.objects.count(), 2)
+
+    def test_fill_aggregated_data_twice(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.substance,
+            quantity_total_new=Decimal('10')
+        )
+
+        submission.fill_aggregated_data()
+        submission.fill_aggregated_data()
+
+        aggregation = ProdCons.objects.get(
+            party=self.party, reporting_period=self.period, group=self.group
+        )
+        self.assertEqual(aggregation.import_new, Decimal('5'))
+        self.assertEqual(aggregation.submissions, {'art7': [submission.id]})
+        self.assertEqual(
+            ProdConsMT.objects.get(substance=self.substance).import_new,
+            Decimal('10')
+        )
+
+    def test_fill_aggregated_data_marks_baselines_dirty(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.substance,
+            quantity_total_new=Decimal('10')
+        )
+
+        # Party history changes are marked with a null group
+        marks = CalculationDirtyKey.objects.filter(
+            target=CalculationDirtyKey.Targets.BASELINES.value,
+            group__isnull=False,
+        )
+        submission.fill_aggregated_data()
+        count = marks.count()
+        # Existing marks may be being cleared by a running calculation, so
+        # each change is recorded in a new one.
+        submission.fill_aggregated_data()
+        self.assertEqual(marks.count(), count + 1)
+        self.assertEqual(
+            set(
+                (mark.party, mark.group, mark.reporting_period)
+                for mark in marks
+            ),
+            {(self.party, self.group, self.period)}
+        )
+
+    def test_bulk_populate_transfers(self):
+        destination_party = AnotherPartyFactory(subregion=self.subregion)
+        transfers = []
+        for substance, amount in (
+            (self.substance, '10'),
+            (self.substance, '4'),
+            (self.another_substance, '1'),
+        ):
+            transfer = Transfer(
+                transfer_type='P',
+                source_party=self.party,
+                destination_party=destination_party,
+                reporting_period=self.period,
+                substance=substance,
+                transferred_amount=Decimal(amount),
+            )
+            transfer.save(populate_aggregations=False)
+            transfers.append(transfer)
+        self.assertFalse(ProdCons.objects.exists())
+
+        Transfer.bulk_populate_aggregated_data(transfers)
+        # Regular saves keep adding to the same aggregations
+        transfers[0].transferred_amount = Decimal('12')
+        transfers[0].save()
+
+        aggregation = ProdCons.objects.get()
+        self.assertEqual(aggregation.prod_transfer, Decimal('10'))
+        self.assertFalse(aggregation.is_eu_member)
+        self.assertEqual(
+            ProdConsMT.objects.get(substance=self.substance).prod_transfer,
+            Decimal('16')
+        )
+        self.assertEqual(ProdConsMT.objects.count(), 2)
+        self.assertTrue(CalculationDirtyKey.objects.filter(
+            target=CalculationDirtyKey.Targets.BASELINES.value,
+            party=self.party, group=self.group, reporting_period=self.period
+        ).exists())
+
+    def test_bulk_populate_transfers_queries(self):
+        destination_party = AnotherPartyFactory(subregion=self.subregion)
+
+        def create_transfers(count):
+            transfers = []
+            for index in range(count):
+                transfer = Transfer(
+                    transfer_type='P',
+                    source_party=self.party,
+                    destination_party=destination_party,
+                    reporting_period=self.period,
+                    substance=(
+                        self.substance if index % 2 else self.another_substance
+                    ),
+                    transferred_amount=Decimal('1'),
+                )
+                transfer.save(populate_aggregations=False)
+                transfers.append(transfer)
+            return transfers
+
+        def count_queries(transfers):
+            with CaptureQueriesContext(connection) as queries:
+                Transfer.bulk_populate_aggregated_data(transfers)
+            return len(queries)
+
+        # Creates the aggregations, later ones are only updated
+        Transfer.bulk_populate_aggregated_data(create_transfers(2))
+        self.assertEqual(
+            count_queries(create_transfers(2)),
+            count_queries(create_transfers(8))
+        )
+
+    def test_list_aggregated_by_party(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.substance,
+            quantity_total_new=Decimal('10.555')
+        )
+        ImportFactory(
+            submission=submission, substance=self.another_substance,
+            quantity_total_new=Decimal('1')
+        )
+        submission.fill_aggregated_data()
+
+        self.client.login(
+            username=self.secretariat_user.username, password='qwe123qwe'
+        )
+        resp = self.client.get(
+            reverse("core:aggregations-list"),
+            {"aggregation": "party", "group_by": "region"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data), 1)
+        aggregation = resp.data[0]
+        self.assertEqual(aggregation['group'], self.group.id)
+        self.assertEqual(aggregation['party'], None)
+        self.assertEqual(aggregation['region'], self.region.id)
+        self.assertEqual(aggregation['is_article5'], None)
+        # 10.555 * 0.5 + 1 * 2, rounded to 2 decimals
+        self.assertEqual(aggregation['import_new'], Decimal('7.28'))
+        self.assertEqual(aggregation['limit_cons'], None)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'api-tests',
+        },
+    })
+    def test_list_aggregated_cached(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.another_substance,
+            quantity_total_new=Decimal('1')
+        )
+        submission.fill_aggregated_data()
+
+        self.client.login(
+            username=self.secretariat_user.username, password='qwe123qwe'
+        )
+        params = {"aggregation": "party,group", "party": self.party.id}
+        url = reverse("core:aggregations-list")
+        self.assertEqual(
+            self.client.get(url, params).data[0]['import_new'], Decimal('2')
+        )
+
+        # Queryset updates do not bump the data generation
+        ProdCons.objects.update(import_new=Decimal('3'))
+        params = {"aggregation": "group,party", "party": self.party.id}
+        self.assertEqual(
+            self.client.get(url, params).data[0]['import_new'], Decimal('2')
+        )
+
+        get_api_cache().clear()
+        self.assertEqual(
+            self.client.get(url, params).data[0]['import_new'], Decimal('3')
+        )
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'api-tests',
+        },
+    })
+    def test_list_cache_key_or_fields(self):
+        another_party = AnotherPartyFactory(subregion=self.subregion)
+        view = AggregationViewSet()
+
+        def get_key(params):
+            request = view.initialize_request(
+                APIRequestFactory().get('/', params)
+            )
+            request.user = self.secretariat_user
+            return view.get_list_cache_key(request)
+
+        params = {"party": self.party.id, "group": self.group.id}
+        or_params = dict(params, or_fields="party,group")
+        key, or_key = get_key(params), get_key(or_params)
+
+        # Data of another party changes (see bump_data_generation)
+        cache = get_api_cache()
+        for party_id in (None, another_party.id):
+            cache.add(_generation_key(party_id), 1, None)
+            cache.incr(_generation_key(party_id))
+
+        self.assertEqual(get_key(params), key)
+        # With or_fields the results may include other parties
+        self.assertNotEqual(get_key(or_params), or_key)
+
+    def test_aggregation_summary(self):
+        submission = self.create_submission()
+        ImportFactory(
+            submission=submission, substance=self.another_substance,
+            quantity_total_new=Decimal('1')
+        )
+        submission.fill_aggregated_data()
+
+        AggregationSummary.refresh(self.period)
+
+        summary = AggregationSummary.objects.get(group=self.group)
+        self.assertEqual(summary.region, self.region)
+        self.assertTrue(summary.is_article5)
+        self.assertTrue(summary.is_reporting)
+        self.assertEqual(summary.calculated_consumption, Decimal('2'))
+        stats = AggregationSummary.objects.get(group=None)
+        self.assertEqual(stats.population, 10)
+        self.assertEqual(stats.party_count, 1)
+        self.assertFalse(
+            CalculationDirtyKey.objects.filter(
+                target=CalculationDirtyKey.Targets.SUMMARIES.value
+            ).exists()
+        )
+
+        # Not recalculated if nothing changed
+        ProdCons.objects.update(calculated_consumption=Decimal('3'))
+        AggregationSummary.refresh(self.period)
+        self.assertEqual(
+            AggregationSummary.objects.get(
+                group=self.group
+            ).calculated_consumption,
+            Decimal('2')
+        )
+
+    def create_aggregated_submissions(self):
+        another_party = AnotherPartyFactory(subregion=self.subregion)
+        another_party.parent_party = another_party
+        another_party.save()
+        PartyHistoryFactory(
+            party=another_party, reporting_period=self.period,
+            is_eu_member=False
+        )
+        for party, substance, amount in (
+            (self.party, self.substance, '10'),
+            (another_party, self.another_substance, '1'),
+        ):
+            submission = self.create_submission(party)
+            ImportFactory(
+                submission=submission, substance=substance,
+                quantity_total_new=Decimal(amount)
+            )
+            submission.fill_aggregated_data()
+        # Stale aggregations are replaced
+        ProdCons.objects.update(
+            import_new=Decimal('100'), calculated_consumption=Decimal('100')
+        )
+        # And those of parties without submissions are removed
+        ProdCons.objects.bulk_create([ProdCons(
+            party=self.party, group=self.group,
+            reporting_period=ReportingPeriodFactory(name='2019'),
+            import_new=Decimal('100'),
+        )])
+        return another_party
+
+    def assertAggregationsRebuilt(self, another_party):
+        aggregations = {
+            aggregation.party: aggregation
+            for aggregation in ProdCons.objects.all()
+        }
+        self.assertEqual(set(aggregations), {self.party, another_party})
+        for party, amount in ((self.party, '5'), (another_party, '2')):
+            self.assertEqual(aggregations[party].reporting_period, self.period)
+            self.assertEqual(aggregations[party].import_new, Decimal(amount))
+            self.assertEqual(
+                aggregations[party].calculated_consumption, Decimal(amount)
+            )
+        self.assertEqual(ProdConsMT.objects.count(), 2)
+
+    def test_calculate_aggregations(self):
+        another_party = self.create_aggregated_submissions()
+        call_command('calculate_aggregations', '--confirm')
+        self.assertAggregationsRebuilt(another_party)
+
+    def test_calculate_aggregations_workers(self):
+        another_party = self.create_aggregated_submissions()
+        rebuilt = []
+
+        class SerialPool:
+            # Runs the partitions in this process and transaction, which
+            # worker processes would not see.
+            def __init__(self, processes, initializer=None):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def imap_unordered(self, func, partitions):
+                for partition in reversed(list(partitions)):
+                    rebuilt.append(partition[0])
+                    yield func(partition)
+
+        with patch.object(
+            calculate_aggregations.multiprocessing, 'Pool', SerialPool
+        ), patch.object(calculate_aggregations, 'connections'):
+            call_command('calculate_aggregations', '--confirm', '--workers=2')
+
+        self.assertEqual(len(rebuilt), 3)
+        self.assertAggregationsRebuilt(another_party)
+
+
+class CalculateAggregationsCheckpointTests(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmp_dir.name, 'checkpoint')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_checkpoint_options(self):
+        command = CalculateAggregationsCommand
+        scope = {'party': 'RO', 'period': None}
+        self.assertEqual(command.load_checkpoint(self.checkpoint, scope), set())
+
+        command.save_checkpoint(self.checkpoint, scope, (1, 2))
+        command.save_checkpoint(self.checkpoint, scope, (1, 3))
+        self.assertEqual(
+            command.load_checkpoint(self.checkpoint, scope), {(1, 2), (1, 3)}
+        )
+
+        # Partitions recorded for other options must not be skipped
+        with self.assertRaises(CommandError):
+            command.load_checkpoint(
+                self.checkpoint, {'party': None, 'period': None}
+            )
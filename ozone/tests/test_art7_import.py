@@ -1,9 +1,11 @@
 from decimal import Decimal
+from types import SimpleNamespace
 
 from django.urls import reverse
 from django.contrib.auth.hashers import Argon2PasswordHasher
 
 from ozone.core.models import Article7Import, Submission
+from ozone.core.serializers import Article7ImportSerializer
 
 from .base import BaseTests
 from .factories import (
@@ -364,6 +366,49 @@ class TestArt7Import(BaseArt7ImportTest):
         )
         self.assertEqual(result.status_code, 422, result.json())
 
+    def test_imports_exports_errors(self):
+        submission = self.create_submission()
+
+        data1 = dict(ART7_IMPORT_DATA)
+        data1["substance"] = self.substance.id
+        data1["source_party"] = self.another_party.id
+        data1["quantity_total_new"] = 10.0
+        data1["quantity_feedstock"] = 20.0
+
+        data2 = dict(ART7_IMPORT_DATA)
+        data2["substance"] = self.another_substance.id
+        data2["source_party"] = None
+        data2["quantity_total_new"] = None
+        data2["quantity_feedstock"] = 5.0
+
+        result = self.client.post(
+            reverse(
+                "core:submission-article7-imports-list",
+                kwargs={"submission_pk": submission.pk},
+            ),
+            [data1, data2],
+        )
+        self.assertEqual(result.status_code, 201, result.json())
+
+        result = self.client.get(
+            reverse(
+                "core:submission-imports-exports-errors",
+                kwargs={"pk": submission.pk},
+            ),
+        )
+        self.assertEqual(result.status_code, 200)
+        # All errors are reported at once
+        self.assertEqual(result.json(), {
+            "article7imports": [
+                f"For {self.substance.name}, {self.another_party.name}, the "
+                f"sum of quantities across this data entry is greater than "
+                f"the sum of totals.",
+                f"For {self.another_substance.name}, the sum of quantities "
+                f"across this data entry is greater than the sum of totals.",
+            ],
+            "article7exports": [],
+        })
+
     def test_get(self):
         submission = self.create_submission()
 
@@ -560,6 +605,77 @@ class TestArt7Import(BaseArt7ImportTest):
         )
         self.assertEqual(result.status_code, 422, result.json())
 
+    def test_update_blend_components(self):
+        submission = self.create_submission()
+
+        art7_import = ImportFactory(
+            submission=submission, blend=self.blend, **ART7_IMPORT_DATA
+        )
+        component_ids = set(
+            art7_import.components.values_list('id', flat=True)
+        )
+        self.assertEqual(len(component_ids), 2)
+
+        data1 = dict(ART7_IMPORT_DATA)
+        data1["blend"] = self.blend.id
+        data1["quantity_total_new"] = 42
+
+        data2 = dict(ART7_IMPORT_DATA)
+        data2["blend"] = self.blend.id
+        data2["source_party"] = self.party.id
+        data2["quantity_total_new"] = 10
+
+        result = self.client.put(
+            reverse(
+                "core:submission-article7-imports-list",
+                kwargs={"submission_pk": submission.pk},
+            ),
+            [data1, data2],
+        )
+        self.assertEqual(result.status_code, 200, result.json())
+
+        # Existing component rows are updated in place
+        components = {
+            row.substance_id: row for row in art7_import.components.all()
+        }
+        self.assertEqual(set(r.id for r in components.values()), component_ids)
+        self.assertEqual(
+            components[self.substance.id].quantity_total_new, 21
+        )
+        self.assertEqual(
+            components[self.another_substance.id].quantity_total_new, 21
+        )
+
+        new_import = submission.article7imports.get(
+            blend=self.blend, source_party=self.party
+        )
+        self.assertEqual(
+            sorted(r.quantity_total_new for r in new_import.components.all()),
+            [5, 5]
+        )
+
+    def test_update_existing_entries_queries(self):
+        submission = self.create_submission()
+        for substance in (self.substance, self.another_substance):
+            for party in (self.party, self.another_party):
+                ImportFactory(
+                    submission=submission, substance=substance,
+                    source_party=party, **ART7_IMPORT_DATA
+                )
+
+        serializer = Article7ImportSerializer(many=True, context={
+            "request": SimpleNamespace(user=self.secretariat_user),
+            "submission": submission,
+        })
+        data = [
+            {"substance": entry.substance, "source_party": entry.source_party}
+            for entry in submission.article7imports.all()
+        ]
+        # Keys of existing entries are built without querying each entry
+        with self.assertNumQueries(2):
+            result = serializer.update(submission.article7imports.all(), data)
+        self.assertEqual(result, [])
+
     def test_clone(self):
         submission = self.create_submission()
 
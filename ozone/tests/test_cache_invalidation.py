@@ -0,0 +1,136 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from ozone.core.management.commands import (
+    calculate_aggregations,
+    import_submissions,
+)
+from ozone.core.utils.cache import InvalidationQueue, invalidation_queue
+
+from .base import BaseTests
+from .factories import (
+    LanguageEnFactory,
+    ReporterUserFactory,
+    SecretariatUserFactory,
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        party = parse_qs(urlparse(self.path).query)['party'][0]
+        self.server.received.append(party)
+        if self.server.failures:
+            self.server.failures -= 1
+            self.send_response(500)
+        else:
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class CacheInvalidationTests(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.received = []
+        self.server.failures = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.settings_override = override_settings(
+            CACHE_INVALIDATION_URL=(
+                f'http://127.0.0.1:{self.server.server_port}/purge'
+            ),
+            CACHE_INVALIDATION_DELAY=60,
+            CACHE_INVALIDATION_BACKOFF=0,
+            CACHE_INVALIDATION_RETRIES=1,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_coalesce(self):
+        queue = InvalidationQueue()
+        for party_id in (1, 2, 1, 1, 2):
+            queue.add(party_id)
+        self.assertEqual(queue.metrics()['queue_depth'], 2)
+
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(sorted(self.server.received), ['1', '2'])
+        metrics = queue.metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['coalesced'], 3)
+        self.assertEqual(metrics['sent'], 2)
+        self.assertIsNotNone(metrics['last_flush_latency'])
+
+    def test_retry_and_drop(self):
+        queue = InvalidationQueue()
+        self.server.failures = 3
+        queue.add(1)
+
+        self.assertEqual(queue.flush(), 0)
+        self.assertEqual(queue.metrics()['retried'], 1)
+        self.assertEqual(queue.metrics()['queue_depth'], 1)
+
+        self.assertEqual(queue.flush(), 0)
+        self.assertEqual(queue.metrics()['dropped'], 1)
+        self.assertEqual(queue.metrics()['queue_depth'], 0)
+        self.assertEqual(self.server.received, ['1', '1'])
+
+        queue.add(1)
+        self.server.failures = 0
+        self.assertEqual(queue.flush(), 1)
+
+    def test_pool_workers_flush(self):
+        # Pool workers are terminated without running atexit handlers
+        with patch.object(invalidation_queue, 'flush') as flush:
+            with patch.object(import_submissions, '_worker_command'):
+                import_submissions.bulk_import_partition(({}, []))
+            flush.assert_called_once_with(force=True)
+
+            flush.reset_mock()
+            with patch.object(calculate_aggregations, 'rebuild_partition'):
+                calculate_aggregations.rebuild_partition_in_worker(
+                    ((1, 2), [])
+                )
+            flush.assert_called_once_with(force=True)
+
+
+class CacheInvalidationMetricsTests(BaseTests):
+
+    def test_metrics(self):
+        language = LanguageEnFactory()
+        hash_alg = Argon2PasswordHasher()
+        password = hash_alg.encode(password='qwe123qwe', salt='123salt123')
+        secretariat_user = SecretariatUserFactory(
+            language=language, password=password
+        )
+        reporter = ReporterUserFactory(language=language, password=password)
+        url = reverse("core:cache-invalidation-list")
+
+        self.client.login(username=reporter.username, password='qwe123qwe')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 403)
+
+        self.client.login(
+            username=secretariat_user.username, password='qwe123qwe'
+        )
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('queue_depth', resp.data)
+        self.assertIn('dropped', resp.data)
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import Argon2PasswordHasher
@@ -377,3 +379,42 @@ class ExemptionApprovedTests(BaseExemptionTests):
         )
         self.assertEqual(result.status_code, 403)
 
+    def test_list_essencrit_aggregated(self):
+        submission = self.create_submission()
+        self.substance.odp = Decimal('0.5')
+        self.substance.save()
+        self.another_substance.has_critical_uses = True
+        self.another_substance.save()
+        for substance, quantity in (
+            (self.substance, Decimal('10.555')),
+            (self.substance, None),
+            (self.another_substance, Decimal('3')),
+        ):
+            ExemptionApprovedFactory(
+                submission=submission, substance=substance, quantity=quantity
+            )
+
+        self.client.login(username=self.secretariat_user.username, password='qwe123qwe')
+        expected = {
+            "reporting_period": submission.reporting_period_id,
+            "party": self.party.id,
+            "group": None,
+            "is_article5": None,
+            "is_eu_member": None,
+            "region": None,
+        }
+        result = self.client.get(
+            reverse("core:essencrit-list"), {"aggregation": "group"}
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json(), [dict(
+            expected, quantity_essential=5.28, quantity_critical=3.0
+        )])
+
+        result = self.client.get(
+            reverse("core:essencrit-mt-list"), {"aggregation": "group"}
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json(), [dict(
+            expected, quantity_essential=10.555, quantity_critical=3.0
+        )])
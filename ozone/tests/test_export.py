@@ -1,11 +1,19 @@
+import os
+import shutil
 from decimal import Decimal as D
+from io import BytesIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 from django.contrib.auth.hashers import Argon2PasswordHasher
-from django.test import tag
+from django.test import SimpleTestCase, tag
 from ozone.core.management.commands import import_submissions
 from ozone.core.management.commands import export_submissions
-from ozone.core.utils.spreadsheet import OzoneSpreadsheet
+from ozone.core.export.submissions import export_submissions as export_data
+from ozone.core.models import Submission
+from ozone.core.utils import spreadsheet
+from ozone.core.utils.spreadsheet import GroupedWorkbook
+from ozone.core.utils.spreadsheet import OzoneSpreadsheet, OzoneTable
 from .base import BaseTests
 from . import factories
 from .fixtures_for_importing import get_required_fixtures
@@ -61,6 +69,9 @@ def invoke_import_submissions(**kwargs):
         'use_cache': False,
         'dry_run': False,
         'single': False,
+        'bulk': False,
+        'chunk_size': 100,
+        'workers': 1,
         'verbosity': 1,
     }, **kwargs)
     cmd = import_submissions.Command()
@@ -154,3 +165,109 @@ class ExportTest(BaseTests):
             normalize_for_test(in_data)
             normalize_for_test(out_data)
             assert_spreadsheets_are_same(in_data, out_data)
+
+    @tag('export')
+    def test_export_submissions_queries(self):
+        in_path = examples / 'art7_submissions.xlsx'
+        in_data = OzoneSpreadsheet.from_xlsx(in_path)
+        fixtures = get_required_fixtures(in_data, blend_list=[
+            (369, [(101, D('0.3')), (102, D('0.7'))]),
+        ])
+        create_fixtures(self.subregion, **fixtures)
+        invoke_import_submissions(file=in_path)
+
+        # One query for the submissions and one for each type of data,
+        # regardless of the number of submissions.
+        with self.assertNumQueries(6):
+            export_data(Submission.objects.all()).dump_xlsx(BytesIO())
+
+
+class SpreadsheetTest(SimpleTestCase):
+
+    def test_lazy_rows(self):
+        calls = []
+
+        def rows():
+            calls.append(1)
+            for i in range(3):
+                yield {'SubstID': i, 'Remark': f'row {i}'}
+
+        data = OzoneSpreadsheet()
+        data.tables['Sheet'] = OzoneTable(['SubstID', 'Remark'], rows)
+        self.assertEqual(calls, [])
+
+        with TemporaryDirectory() as tmp:
+            out_path = Path(tmp) / 'out.xlsx'
+            data.dump_xlsx(out_path)
+            out_data = OzoneSpreadsheet.from_xlsx(out_path)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(out_data.tables['Sheet'].header, ['SubstID', 'Remark'])
+        self.assertEqual(
+            out_data.tables['Sheet'].rows,
+            [{'SubstID': i, 'Remark': f'row {i}'} for i in range(3)],
+        )
+
+    def test_grouped_workbook(self):
+        in_path = examples / 'art7_submissions.xlsx'
+        in_data = OzoneSpreadsheet.from_xlsx(in_path)
+
+        def get_key(row):
+            return row['CntryID'], row['PeriodID']
+
+        with TemporaryDirectory() as tmp:
+            workbook = GroupedWorkbook(in_path, get_key, tmp)
+            [key] = workbook.keys()
+            group = workbook[key]
+            self.assertEqual(list(group), list(in_data.tables))
+            for name, table in in_data.tables.items():
+                self.assertEqual(group[name], table.rows)
+
+            # Parsed once, then read from the cache
+            cached = GroupedWorkbook(in_path, None, tmp)
+            self.assertEqual(cached[key], group)
+
+    def test_workbooks_closed(self):
+        in_path = examples / 'art7_submissions.xlsx'
+        workbooks = []
+
+        def load_xlsx(path):
+            workbooks.append(spreadsheet.openpyxl.load_workbook(
+                filename=str(path), read_only=True
+            ))
+            return workbooks[-1]
+
+        with patch.object(spreadsheet, 'load_xlsx', load_xlsx):
+            OzoneSpreadsheet.from_xlsx(in_path)
+            with TemporaryDirectory() as tmp:
+                GroupedWorkbook(in_path, lambda row: row['CntryID'], tmp)
+
+        self.assertEqual(len(workbooks), 2)
+        for workbook in workbooks:
+            self.assertIsNone(workbook._archive.fp)
+
+    def test_grouped_workbook_concurrent_build(self):
+        in_path = examples / 'art7_submissions.xlsx'
+
+        def get_key(row):
+            return row['CntryID'], row['PeriodID']
+
+        with TemporaryDirectory() as tmp:
+            workbook = GroupedWorkbook(in_path, get_key, tmp)
+            built = os.path.join(tmp, 'built')
+            shutil.copytree(workbook.directory, built)
+            rename = os.rename
+
+            def concurrent_rename(src, dst):
+                if src.endswith('.tmp'):
+                    # Another process has just finished building the cache
+                    shutil.copytree(built, dst)
+                rename(src, dst)
+
+            with patch.object(os, 'rename', concurrent_rename):
+                rebuilt = GroupedWorkbook(in_path, get_key, tmp, False)
+
+            self.assertEqual(rebuilt.keys(), workbook.keys())
+            self.assertEqual(sorted(os.listdir(tmp)), sorted([
+                'built', os.path.basename(workbook.directory)
+            ]))
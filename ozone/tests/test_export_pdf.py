@@ -0,0 +1,251 @@
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from PyPDF2 import PdfFileReader
+from reportlab.platypus import PageBreak, Paragraph
+
+from ozone.core.api.export_pdf import export
+from ozone.core.api.export_pdf.util import left_paragraph_style
+from ozone.core.models import Submission
+
+from .base import BaseTests
+from .factories import (
+    AnotherPartyFactory,
+    AnotherSubstanceFactory,
+    BlendComponentFactory,
+    BlendFactory,
+    DestructionFactory,
+    EmissionFactory,
+    ExportFactory,
+    GroupFactory,
+    ImportFactory,
+    LanguageEnFactory,
+    NonPartyTradeFactory,
+    ObligationFactory,
+    PartyFactory,
+    ProductionFactory,
+    RegionFactory,
+    ReportingPeriodFactory,
+    SecretariatUserFactory,
+    SubmissionFactory,
+    SubregionFactory,
+    SubstanceFactory,
+)
+
+
+def get_test_flowables(text, pages):
+    # Module-level, so it can be used by the render workers
+    for page in range(pages):
+        if page:
+            yield PageBreak()
+        yield Paragraph(f'{text} {page}', left_paragraph_style)
+
+
+class BrokenPool:
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args):
+        raise BrokenProcessPool()
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+class BuildPdfTests(SimpleTestCase):
+
+    def get_pages(self, buff):
+        with buff:
+            reader = PdfFileReader(buff)
+            return [
+                reader.getPage(index).extractText()
+                for index in range(reader.getNumPages())
+            ]
+
+    def test_flowable_stream_lookahead(self):
+        flowables = iter(range(100))
+        stream = export.FlowableStream(flowables)
+        self.assertEqual(len(stream), export.FlowableStream.LOOKAHEAD)
+        # Only the look-ahead buffer has been consumed
+        self.assertEqual(next(flowables), export.FlowableStream.LOOKAHEAD)
+
+    def test_build_pdf(self):
+        # More flowables than the look-ahead buffer of FlowableStream
+        pages = self.get_pages(export.build_pdf(
+            get_test_flowables('page', export.FlowableStream.LOOKAHEAD * 2)
+        ))
+        self.assertEqual(len(pages), export.FlowableStream.LOOKAHEAD * 2)
+        for number, text in enumerate(pages):
+            self.assertIn(f'page {number}', text)
+            self.assertIn(f'Page {number + 1}', text)
+
+    def test_build_pdf_empty(self):
+        pages = self.get_pages(export.build_pdf(
+            iter(()), empty=Paragraph('No data', left_paragraph_style)
+        ))
+        self.assertEqual(len(pages), 1)
+        self.assertIn('No data', pages[0])
+
+
+class ParallelRenderingTests(SimpleTestCase):
+
+    sections = [
+        (get_test_flowables, ('first', 2)),
+        (get_test_flowables, ('second', 1)),
+    ]
+
+    def tearDown(self):
+        if export._render_pool is not None:
+            export._render_pool.shutdown()
+            export._render_pool = None
+        super().tearDown()
+
+    def assertPages(self, buff):
+        with buff:
+            reader = PdfFileReader(buff)
+            pages = [
+                reader.getPage(index).extractText()
+                for index in range(reader.getNumPages())
+            ]
+        self.assertEqual(len(pages), 3)
+        for text, expected in zip(pages, ('first 0', 'first 1', 'second 0')):
+            self.assertIn(expected, text)
+        # Pages are numbered across sections
+        for number, text in enumerate(pages, 1):
+            self.assertIn(f'Page {number}', text)
+
+    def test_merge_sections(self):
+        rendered = [
+            export.render_section('en', False, get_flowables, args)
+            for get_flowables, args in self.sections
+        ]
+        self.assertPages(export.merge_sections(rendered, False))
+
+    @override_settings(REPORT_RENDER_WORKERS=2, REPORT_RENDER_PYTHON='')
+    def test_build_pdf_parallel(self):
+        self.assertTrue(export.use_parallel_rendering(len(self.sections)))
+        self.assertPages(export.build_pdf_parallel(self.sections))
+
+    @override_settings(REPORT_RENDER_WORKERS=2, REPORT_RENDER_PYTHON='')
+    def test_broken_pool(self):
+        pool = export._render_pool = BrokenPool()
+        with export.build_pdf_parallel(self.sections) as buff:
+            reader = PdfFileReader(buff)
+            text = ''.join(
+                reader.getPage(index).extractText()
+                for index in range(reader.getNumPages())
+            )
+        # Rendered in this process instead
+        for expected in ('first 0', 'first 1', 'second 0'):
+            self.assertIn(expected, text)
+        # And a new pool is used next time
+        self.assertTrue(pool.shut_down)
+        self.assertIsNone(export._render_pool)
+
+    @override_settings(REPORT_RENDER_WORKERS=2, REPORT_RENDER_PYTHON='')
+    def test_uwsgi_requires_python(self):
+        # Under uWSGI, sys.executable is the uwsgi binary
+        with patch.object(export, 'uwsgi', object()):
+            self.assertIsNone(export.get_render_executable())
+            self.assertFalse(export.use_parallel_rendering(2))
+
+            with override_settings(REPORT_RENDER_PYTHON='/usr/bin/python3'):
+                self.assertEqual(
+                    export.get_render_executable(), '/usr/bin/python3'
+                )
+                self.assertTrue(export.use_parallel_rendering(2))
+
+
+class Art7RawQueriesTests(BaseTests):
+
+    def setUp(self):
+        super().setUp()
+        subregion = SubregionFactory(region=RegionFactory())
+        self.party = PartyFactory(subregion=subregion)
+        self.another_party = AnotherPartyFactory(subregion=subregion)
+        self.obligation = ObligationFactory()
+        self.period = ReportingPeriodFactory()
+        self.user = SecretariatUserFactory(language=LanguageEnFactory())
+
+        group = GroupFactory()
+        self.substance = SubstanceFactory(group=group)
+        self.another_substance = AnotherSubstanceFactory(group=group)
+        self.blend = BlendFactory()
+        for substance in (self.substance, self.another_substance):
+            BlendComponentFactory(
+                blend=self.blend, substance=substance,
+                percentage=Decimal('0.5')
+            )
+        self.version = 0
+
+    def create_submission(self, rows):
+        self.version += 1
+        submission = SubmissionFactory(
+            party=self.party, reporting_period=self.period,
+            obligation=self.obligation, version=self.version,
+            created_by=self.user, last_edited_by=self.user,
+        )
+        substances = (self.substance, self.another_substance)
+        for index in range(rows):
+            substance = substances[index % len(substances)]
+            ImportFactory(
+                submission=submission, substance=substance,
+                source_party=self.another_party, quantity_total_new=10,
+                quantity_laboratory_analytical_uses=1,
+            )
+            ExportFactory(
+                submission=submission, substance=substance,
+                destination_party=self.another_party, quantity_total_new=10,
+            )
+            ProductionFactory(
+                submission=submission, substance=substance,
+                quantity_total_produced=10,
+            )
+            DestructionFactory(
+                submission=submission, substance=substance,
+                quantity_destroyed=10,
+            )
+            NonPartyTradeFactory(
+                submission=submission, substance=substance,
+                quantity_import_new=10,
+            )
+            EmissionFactory(
+                submission=submission, facility_name='Facility',
+                quantity_emitted=10,
+            )
+        # Blend rows, along with their component rows
+        ImportFactory(
+            submission=submission, blend=self.blend,
+            source_party=self.another_party, quantity_total_new=10,
+        )
+        ExportFactory(
+            submission=submission, blend=self.blend,
+            destination_party=self.another_party, quantity_total_new=10,
+        )
+        return submission
+
+    def count_queries(self, submissions):
+        submissions = Submission.objects.filter(
+            pk__in=[submission.pk for submission in submissions]
+        )
+        with CaptureQueriesContext(connection) as context:
+            flowables = list(
+                export.get_submissions_flowables(self.obligation, submissions)
+            )
+        self.assertTrue(flowables)
+        return len(context.captured_queries)
+
+    def test_queries_independent_of_data_size(self):
+        queries = self.count_queries([self.create_submission(rows=1)])
+        self.assertEqual(
+            self.count_queries(
+                [self.create_submission(rows=4) for _ in range(3)]
+            ),
+            queries
+        )
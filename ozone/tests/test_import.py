@@ -21,6 +21,9 @@ def invoke_import_submissions(**kwargs):
         'use_cache': False,
         'dry_run': False,
         'single': False,
+        'bulk': False,
+        'chunk_size': 100,
+        'workers': 1,
         'verbosity': 1,
     }, **kwargs)
     cmd = import_submissions.Command()
@@ -41,7 +44,7 @@ class ImportTest(BaseTests):
         factories.ReportingChannelFactory(name="Legacy")
         factories.ObligationFactory(pk=1)
 
-    def test_blend_is_expanded_into_components(self):
+    def import_with_blend(self, **kwargs):
         in_path = examples / 'art7_submissions.xlsx'
         in_data = OzoneSpreadsheet.from_xlsx(in_path)
         blend_list = [
@@ -52,11 +55,31 @@ class ImportTest(BaseTests):
         ]
         fixtures = get_required_fixtures(in_data, blend_list=blend_list)
         create_fixtures(self.subregion, **fixtures)
-        invoke_import_submissions(file=in_path)
+        invoke_import_submissions(file=in_path, **kwargs)
+
+    def test_blend_is_expanded_into_components(self):
+        self.import_with_blend()
+
+        s101 = models.Substance.objects.get(substance_id='101')
+        s102 = models.Substance.objects.get(substance_id='102')
+        [submission] = models.Submission.objects.all()
+
+        import_blends = {
+            row.substance: row for row in
+            submission.article7imports.filter(blend_item_id__isnull=False)
+        }
+
+        assert set(import_blends.keys()) == set([s101, s102])
+        assert import_blends[s101].quantity_total_new == D('18')
+        assert import_blends[s102].quantity_total_new == D('42')
+
+    def test_bulk_import(self):
+        self.import_with_blend(bulk=True)
 
         s101 = models.Substance.objects.get(substance_id='101')
         s102 = models.Substance.objects.get(substance_id='102')
         [submission] = models.Submission.objects.all()
+        assert submission._current_state == 'finalized'
 
         import_blends = {
             row.substance: row for row in
@@ -66,3 +89,6 @@ class ImportTest(BaseTests):
         assert set(import_blends.keys()) == set([s101, s102])
         assert import_blends[s101].quantity_total_new == D('18')
         assert import_blends[s102].quantity_total_new == D('42')
+        assert models.ProdCons.objects.filter(
+            party=submission.party, reporting_period=submission.reporting_period
+        ).exists()
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from ozone.core.utils.cache import get_api_cache
+from ozone.core.utils.reference_cache import ReferenceCache, reference_cache
+
+from .factories import (
+    PartyFactory,
+    RegionFactory,
+    SubregionFactory,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Counter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'reference-tests',
+        },
+    },
+    REFERENCE_CACHE_CHECK_INTERVAL=60,
+)
+class ReferenceCacheTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_api_cache().clear()
+        self.cache = ReferenceCache()
+
+    def test_values_are_cached(self):
+        compute = Counter()
+        self.assertEqual(self.cache.get('key', compute), 1)
+        self.assertEqual(self.cache.get('key', compute), 1)
+        self.assertEqual(self.cache.get('other', compute), 2)
+
+    def test_generation_change(self):
+        compute = Counter()
+        self.cache.get('key', compute)
+
+        # Another process changed reference data
+        get_api_cache().incr(ReferenceCache.GENERATION_KEY)
+        self.assertEqual(self.cache.get('key', compute), 1)
+        # The generation is only checked once per interval
+        self.cache.checked_at -= 60
+        self.assertEqual(self.cache.get('key', compute), 2)
+
+    def test_changes_in_transaction(self):
+        compute = Counter()
+        self.cache.get('key', compute)
+
+        # Uncommitted changes are only seen by this thread, which bypasses
+        # the cache until the end of the transaction.
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get('key', compute), 2)
+        self.assertEqual(self.cache.get('key', compute), 3)
+
+    def test_changes_rolled_back(self):
+        compute = Counter()
+        self.cache.get('key', compute)
+
+        # Tests run in a transaction, like requests with ATOMIC_REQUESTS, so
+        # only the inner atomic block is rolled back.
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                self.cache.invalidate()
+                self.assertEqual(self.cache.get('key', compute), 2)
+                raise Rollback()
+        self.assertEqual(self.cache.get('key', compute), 1)
+
+    def test_reference_model_signals(self):
+        compute = Counter()
+        reference_cache.clear()
+        reference_cache.get('key', compute)
+        PartyFactory(subregion=SubregionFactory(region=RegionFactory()))
+        self.assertEqual(reference_cache.get('key', compute), 2)
@@ -0,0 +1,184 @@
+import io
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from ozone.core.api.views import ReportsViewSet
+from ozone.core.models import Limit, LimitTypes
+from ozone.core.utils.cache import get_api_cache
+from ozone.core.utils.report_cache import ReportCache
+
+from .base import BaseTests
+from .factories import (
+    GroupFactory,
+    LanguageEnFactory,
+    PartyFactory,
+    PartyHistoryFactory,
+    RegionFactory,
+    ReportingPeriodFactory,
+    SecretariatUserFactory,
+    SubregionFactory,
+)
+
+
+class ReportCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            REPORT_CACHE_DIR=self.tmp_dir.name,
+            REPORT_CACHE_MAX_SIZE=25,
+        )
+        self.settings_override.enable()
+        self.cache = ReportCache()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get('a'))
+        base_name, buf = self.cache.put('a', 'report', io.BytesIO(b'%PDF'))
+        buf.close()
+
+        base_name, buf = self.cache.get('a')
+        with buf:
+            self.assertEqual(base_name, 'report')
+            self.assertEqual(buf.read(), b'%PDF')
+
+    def test_least_recently_used_evicted(self):
+        for key in ('a', 'b'):
+            _, buf = self.cache.put(key, key, io.BytesIO(b'x' * 10))
+            buf.close()
+        # Make 'a' the least recently used
+        os.utime(self.cache.get_file_path('a'), (0, 0))
+
+        _, buf = self.cache.put('c', 'c', io.BytesIO(b'x' * 10))
+        buf.close()
+
+        self.assertIsNone(self.cache.get('a'))
+        for key in ('b', 'c'):
+            _, buf = self.cache.get(key)
+            buf.close()
+
+    def test_interrupted_writes_removed(self):
+        tmp_path = self.cache.get_file_path('a') + '.1.1.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b'%PDF')
+        # Writes might still be in progress
+        self.cache.evict()
+        self.assertTrue(os.path.exists(tmp_path))
+
+        old = time.time() - ReportCache.TMP_FILE_MAX_AGE - 1
+        os.utime(tmp_path, (old, old))
+        self.cache.evict()
+        self.assertFalse(os.path.exists(tmp_path))
+
+
+class ReportCacheViewTests(BaseTests):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            REPORT_CACHE_DIR=self.tmp_dir.name,
+            REPORT_CACHE_MAX_SIZE=1024,
+            CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                },
+                'api': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'report-cache-tests',
+                },
+            },
+        )
+        self.settings_override.enable()
+        get_api_cache().clear()
+
+        subregion = SubregionFactory(region=RegionFactory())
+        self.party = PartyFactory(subregion=subregion)
+        self.party.parent_party = self.party
+        self.party.save()
+        self.period = ReportingPeriodFactory()
+        self.history = PartyHistoryFactory(
+            party=self.party, reporting_period=self.period,
+            is_eu_member=False
+        )
+        self.group = GroupFactory()
+        hash_alg = Argon2PasswordHasher()
+        self.secretariat_user = SecretariatUserFactory(
+            language=LanguageEnFactory(),
+            password=hash_alg.encode(password='qwe123qwe', salt='123salt123')
+        )
+        self.client.login(
+            username=self.secretariat_user.username, password='qwe123qwe'
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def get_report(self):
+        resp = self.client.get(reverse("core:reports-prodcons"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'%PDF')
+        resp.close()
+
+    @patch.object(ReportsViewSet, 'build_prodcons')
+    def test_report_rebuilt_on_changes(self, build):
+        build.side_effect = lambda parties, periods: (
+            'prodcons', io.BytesIO(b'%PDF')
+        )
+
+        self.get_report()
+        self.get_report()
+        self.assertEqual(build.call_count, 1)
+
+        limit = Limit.objects.create(
+            party=self.party, reporting_period=self.period, group=self.group,
+            limit_type=LimitTypes.PRODUCTION.value, limit=10
+        )
+        self.get_report()
+        self.assertEqual(build.call_count, 2)
+
+        limit.limit = 20
+        limit.save()
+        self.get_report()
+        self.assertEqual(build.call_count, 3)
+
+        self.history.is_article5 = False
+        self.history.save()
+        self.get_report()
+        self.get_report()
+        self.assertEqual(build.call_count, 4)
+
+        # Other data is tracked by the reports generation, bumped once the
+        # transaction is committed.
+        self.party.name = 'Renamed'
+        self.party.save()
+        get_api_cache().incr(ReportCache.GENERATION_KEY)
+        self.get_report()
+        self.assertEqual(build.call_count, 5)
+
+    @patch.object(ReportsViewSet, 'build_prodcons')
+    def test_not_cached_without_api_cache(self, build):
+        build.side_effect = lambda parties, periods: (
+            'prodcons', io.BytesIO(b'%PDF')
+        )
+        with override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        }):
+            self.get_report()
+            self.get_report()
+        self.assertEqual(build.call_count, 2)
@@ -0,0 +1,99 @@
+import io
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from ozone.core.utils import report_jobs
+from ozone.core.utils.report_jobs import ReportJobs
+
+
+class RecordingExecutor:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, *args):
+        self.submitted.append(args)
+
+
+class ReportJobsTests(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            REPORT_JOBS_DIR=self.tmp_dir.name,
+            REPORT_JOBS_TTL=60,
+            REPORT_JOBS_TIMEOUT=60,
+        )
+        self.settings_override.enable()
+        self.jobs = ReportJobs()
+        self.jobs.executor = RecordingExecutor()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def test_identical_jobs_are_deduplicated(self):
+        params = {'party': [1], 'period': [2]}
+        first = self.jobs.submit('art7_raw', params, 'secretariat', None)
+        second = self.jobs.submit('art7_raw', params, 'secretariat', None)
+        other = self.jobs.submit('art7_raw', params, 'party:1', None)
+
+        self.assertEqual(first['id'], second['id'])
+        self.assertNotEqual(first['id'], other['id'])
+        self.assertEqual(first['status'], ReportJobs.QUEUED)
+        self.assertEqual(len(self.jobs.executor.submitted), 2)
+
+    def test_expired_jobs_are_removed(self):
+        status = self.jobs.submit('art7_raw', {}, 'secretariat', None)
+        status['heartbeat_at'] = time.time() - 120
+        self.jobs._write_status(status)
+        # Jobs of this process are never considered lost
+        self.assertIsNotNone(self.jobs.get(status['id']))
+
+        # The process running the job has been killed
+        self.jobs.active.clear()
+        self.assertIsNone(self.jobs.get(status['id']))
+
+        self.jobs.cleanup()
+        self.assertFalse(
+            os.path.exists(self.jobs.get_status_path(status['id']))
+        )
+
+    def test_progress(self):
+        status = self.jobs.submit('art7_raw', {}, 'secretariat', None)
+        # Outside of a job, progress is ignored
+        self.jobs.report_progress(pages=1)
+        self.assertIsNone(self.jobs.get(status['id'])['progress'])
+
+        self.jobs.local.status = status
+        self.jobs.local.progress_written_at = 0
+        self.jobs.report_progress(pages=3)
+        self.assertEqual(self.jobs.get(status['id'])['progress'], {'pages': 3})
+
+    def test_lost_job_does_not_overwrite_replacement(self):
+        status = self.jobs.submit('art7_raw', {}, 'secretariat', None)
+        status['heartbeat_at'] = time.time() - 120
+        self.jobs._write_status(status)
+        self.jobs.active.clear()
+
+        replacement = self.jobs.submit('art7_raw', {}, 'secretariat', None)
+        self.assertNotEqual(replacement['run_id'], status['run_id'])
+
+        # The lost job finishes eventually (without using the database)
+        buf = io.BytesIO(b'%PDF')
+        with patch.object(report_jobs, 'transaction'), \
+                patch.object(report_jobs, 'connection'):
+            self.jobs._run(status, lambda: ('old', buf), 'en')
+        self.assertTrue(buf.closed)
+        current = self.jobs.get(status['id'])
+        self.assertEqual(current['run_id'], replacement['run_id'])
+        self.assertEqual(current['status'], ReportJobs.QUEUED)
+        self.assertFalse(
+            os.path.exists(self.jobs.get_file_path(status['id']))
+        )
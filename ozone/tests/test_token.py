@@ -1,5 +1,10 @@
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+
+from ozone.core.authentication import get_token
+from ozone.core.utils.cache import get_api_cache
 
 from .base import BaseTests
 from .factories import LanguageEnFactory
@@ -29,3 +34,27 @@ class EmailAuthTests(BaseTests):
         })
         self.assertEqual(resp.status_code, 200)
         self.assertIn('token', resp.data)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'token-tests',
+        },
+    })
+    def test_token_cache(self):
+        get_api_cache().clear()
+        key = Token.objects.get(user=self.user).key
+        self.assertEqual(get_token(key).user, self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_token(key).user, self.user)
+
+        # Deactivating the user evicts its cached token
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(get_token(key).user.is_active)
+
+        Token.objects.filter(user=self.user).delete()
+        self.assertIsNone(get_token(key))
@@ -2,6 +2,8 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import Argon2PasswordHasher
 
+from ozone.core.models import Submission
+
 from .base import BaseTests
 from .factories import (
     AnotherPartyFactory,
@@ -590,6 +592,64 @@ class DefaultWorkflowPermissionsTests(BaseWorkflowPermissionsTests):
         self.assertEqual(resp.status_code, 403)
 
 
+    def test_batch_permissions(self):
+        """
+        Testing that permissions evaluated for many submissions at once match
+        the ones evaluated for each submission.
+        """
+
+        submissions = [
+            self.create_submission(
+                owner=self.secretariat_user,
+                party=self.party,
+                current_state='submitted',
+            ),
+            self.create_submission(
+                owner=self.reporter,
+                party=self.party,
+                current_state='processing',
+            ),
+        ]
+        for user in (self.secretariat_user, self.reporter):
+            permissions = Submission.get_permissions(submissions, user)
+            for submission in submissions:
+                self.assertEqual(
+                    permissions[submission.pk],
+                    {
+                        'available_transitions':
+                            submission.available_transitions(user),
+                        'is_cloneable': submission.is_cloneable(user),
+                        'can_edit_data': submission.can_edit_data(user),
+                        'can_delete_data': submission.can_delete_data(user),
+                    }
+                )
+
+    def test_latest_submitted_for_matrix(self):
+        """
+        Testing that only submissions in submitted states are returned.
+        """
+
+        submission = self.create_submission(
+            owner=self.secretariat_user,
+            party=self.party,
+            current_state='submitted',
+        )
+        matrix = (
+            submission.obligation,
+            [self.party, self.another_party],
+            [submission.reporting_period],
+        )
+        self.assertEqual(
+            Submission.latest_submitted_for_matrix(*matrix),
+            {(self.party.pk, submission.reporting_period_id): submission}
+        )
+
+        Submission.objects.filter(pk=submission.pk).update(
+            _current_state='recalled'
+        )
+        self.assertEqual(Submission.latest_submitted_for_matrix(*matrix), {})
+
+
 class AcceleratedWorkflowTests(BaseWorkflowPermissionsTests):
 
     def setUp(self):